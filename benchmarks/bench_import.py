@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Cold start benchmark, every sample runs in a fresh interpreter
+
+    $ python3 benchmarks/bench_import.py -n 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = [
+    ("import src.component_sniffer", [sys.executable, "-c", "import src.component_sniffer"]),
+    ("import src.component_manager", [sys.executable, "-c", "import src.component_manager"]),
+    ("webhunt --help", [sys.executable, os.path.join(ROOT, "webhunt"), "--help"]),
+    ("webhunt scan --help", [sys.executable, os.path.join(ROOT, "webhunt"), "scan", "--help"]),
+]
+
+HEAVY_MODULES = ("requests", "bs4", "html5lib", "pymysql", "pypinyin", "socks")
+
+
+def sample(cmd, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def loaded_heavy_modules(stmt):
+    code = "import sys; %s; print(' '.join(m for m in %r if m in sys.modules))" % (
+        stmt, HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                         stdout=subprocess.PIPE, check=True)
+    return out.stdout.decode().strip() or "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=10, help="samples per case")
+    args = parser.parse_args()
+
+    print("%-32s %10s %10s  %s" % ("case", "median", "min", "heavy modules"))
+    for name, cmd in CASES:
+        times = sample(cmd, args.n)
+        heavy = loaded_heavy_modules(name) if name.startswith("import") else ""
+        print("%-32s %8.1fms %8.1fms  %s" % (
+            name, statistics.median(times) * 1000, min(times) * 1000, heavy))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Component loading benchmark, by the number of loader threads
+
+    $ python3 benchmarks/bench_load.py -d components -w 1 8 -n 5
+"""
+import argparse
+import os
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.loader import LoadStats, iter_directory  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-d", "--directory", default=os.path.join(ROOT, "components"))
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("-n", type=int, default=5, help="samples")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        times, stats = [], None
+        for _ in range(args.n):
+            stats = LoadStats()
+            for _ in iter_directory(args.directory, max_workers=workers, stats=stats):
+                pass
+            times.append(stats.seconds)
+        print("workers %-3d median %.1fms, min %.1fms  %s" % (
+            workers, statistics.median(times) * 1000, min(times) * 1000, stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Matching benchmark over captured responses, no network is used, so the
+results and the timings are reproducible
+
+    $ python3 benchmarks/bench_offline.py crawl.warc.gz -d components -n 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.batch import BatchSniffer  # noqa: E402
+from src.offline import ResponseStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", help="HAR, WARC(.gz) or directory of responses")
+    parser.add_argument("-d", "--directory", default=os.path.join(ROOT, "components"))
+    parser.add_argument("-a", "--aggression", action="store_true")
+    parser.add_argument("-t", "--max-threads", type=int, default=8)
+    parser.add_argument("-n", type=int, default=5, help="samples")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = ResponseStore.load(args.input)
+    load_time = time.perf_counter() - start
+    targets = store.targets()
+
+    times, found = [], 0
+    for _ in range(args.n):
+        batch = BatchSniffer(targets, args.directory)
+        batch.store = store
+        batch.max_threads = args.max_threads
+        batch.options = {"aggression": args.aggression}
+        start = time.perf_counter()
+        results = batch.start()
+        times.append(time.perf_counter() - start)
+        found = sum(len(r) - 2 for r in results.values() if r)
+
+    print("responses %d, targets %d, load %.1fms" % (len(store), len(targets), load_time * 1000))
+    print("scan median %.1fms, min %.1fms, %.1f targets/s, %d components found" % (
+        statistics.median(times) * 1000, min(times) * 1000,
+        len(targets) / statistics.median(times), found))
+
+
+if __name__ == "__main__":
+    main()
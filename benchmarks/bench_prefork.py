@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Private memory of the prefork children, with and without `gc.freeze` of the rule set.
+Every child runs a full collection, then reads its Private_Clean + Private_Dirty from
+/proc/self/smaps_rollup: the pages it no longer shares with the parent (Linux only)
+
+    $ python3 benchmarks/bench_prefork.py -d components -p 4 -n 3
+    $ python3 benchmarks/bench_prefork.py -s 5000 -p 4 -n 3
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import statistics
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.batch import BatchSniffer  # noqa: E402
+from src.core import Component  # noqa: E402
+from src.prefork import Prefork, share  # noqa: E402
+
+
+def synthetic_components(n: int):
+    return [Component.from_dict({
+        "name": "Synthetic%d" % i,
+        "matches": [
+            {"search": "headers[server]", "regexp": r"synthetic%d/([\d.]+)" % i, "offset": 0},
+            {"text": "synthetic-component-%d" % i},
+            {"url": "/static/synthetic%d.js" % i, "md5": "%032x" % i},
+        ],
+    }) for i in range(n)]
+
+
+def private_kb() -> int:
+    total = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total += int(line.split()[1])
+    return total
+
+
+def _child(index, emit):
+    gc.collect()
+    emit(private_kb())
+
+
+def measure(args, freeze: bool, results):
+    batch = BatchSniffer([], args.directory)
+    if args.synthetic:
+        batch.components = synthetic_components(args.synthetic)
+    share(batch)
+    if not freeze:
+        gc.unfreeze()
+    results.put([kb for kb, in Prefork(args.processes).start(_child).items()])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-d", "--directory", default=os.path.join(ROOT, "components"))
+    parser.add_argument("-s", "--synthetic", type=int, default=0,
+                        help="generated components instead of the directory")
+    parser.add_argument("-p", "--processes", type=int, default=4)
+    parser.add_argument("-n", type=int, default=3, help="samples")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("fork")
+    for freeze in (False, True):
+        sizes = []
+        for _ in range(args.n):
+            # a fresh parent every sample, the freeze of one mode can't leak into the other
+            results = ctx.Queue()
+            parent = ctx.Process(target=measure, args=(args, freeze, results))
+            parent.start()
+            sizes.extend(results.get())
+            parent.join()
+        print("%-9s private median %.1fMB, max %.1fMB per child" % (
+            "freeze" if freeze else "no-freeze", statistics.median(sizes) / 1024, max(sizes) / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from src.component_sniffer import ComponentSniffer
+from src.core import Component, ComponentGeneratorMixin
+from src.dedup import ResultCache, is_passive, response_fingerprint
+from src.hash_index import HashIndex
+from src.journal import ScanJournal
+from src.log import logger
+from src.offline import OfflineSniffer, ResponseStore
+from src.prefilter import LiteralIndex
+from src.scheduler import HostScheduler
+from src.utils import cached_property, host_of
+
+
+class TargetScan:
+    """State of one target in a batch scan
+    """
+
+    def __init__(self, sniffer: ComponentSniffer):
+        self.sniffer = sniffer
+        self.host = host_of(sniffer.target)
+        self.plugins = []
+        # hits reused from the result cache
+        self.cached_hits = []
+        # checked component of every task, None for the hash index task
+        self.tasks: List[Optional[Component]] = []
+        # hits of every task, each task only writes its own slot, None until it completes
+        self.task_hits: List[Optional[List]] = []
+        # paths fetched by the hash index task
+        self.hash_paths = set()
+        # the target can't be requested
+        self.failed = False
+        self.fingerprint = None
+        self.results = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def add_pending(self, n: int):
+        with self._lock:
+            self._pending += n
+
+    def done_one(self) -> bool:
+        """:returns True when it was the last pending task
+        """
+        with self._lock:
+            self._pending -= 1
+            return self._pending == 0
+
+
+class BatchSniffer(ComponentGeneratorMixin):
+    """Scan many targets with one components set and one pool of workers,
+    the tasks of all targets are scheduled by a `HostScheduler`
+    """
+
+    def __init__(self, targets: List[str], directory: str,
+                 components: Optional[List[Component]] = None, session=None):
+        self.targets = list(OrderedDict.fromkeys(targets))
+        self.directory = directory
+        self.components = components
+        self.session = session
+        self.options = {}
+        self.max_threads = 8
+        self.scheduler = HostScheduler()
+        # only check these components, like `ComponentSniffer.test`
+        self.only_components = None
+        # called with (target, results) when a target is finished
+        self.on_result = None
+        # `ScanJournal` checkpoint, its finished targets are skipped
+        self.journal: Optional[ScanJournal] = None
+        # `ResponseStore` of captured responses, scan offline when it is set
+        self.store: Optional[ResponseStore] = None
+        # `SnapshotStore` which keeps the responses and hits of the finished targets
+        self.snapshots = None
+        # `ProxyPool` shared by all targets
+        self.proxy_pool = None
+        # `ResultCache` of the passive hits, targets with the same response reuse them
+        self.result_cache: Optional[ResultCache] = ResultCache()
+        # `AdaptiveConcurrency` which tunes the limits of the scheduler, `max_threads` is fixed without
+        self.concurrency = None
+
+    @cached_property
+    def hash_index(self) -> HashIndex:
+        return HashIndex.build(self.iter_components())
+
+    @cached_property
+    def literal_index(self) -> LiteralIndex:
+        return LiteralIndex.build(self.iter_components())
+
+    @cached_property
+    def component_names(self) -> Dict[str, Component]:
+        return ComponentSniffer.component_names.func(self)
+
+    @cached_property
+    def component_positions(self) -> Dict[int, int]:
+        return ComponentSniffer.component_positions.func(self)
+
+    @cached_property
+    def passive_components(self) -> set:
+        """id of the components only checked on the target response
+        """
+        return {id(c) for c in self.iter_components() if is_passive(c)}
+
+    @cached_property
+    def hash_components(self) -> List[Tuple[Component, Set[str]]]:
+        """Components resolved by the hash index with the paths they need
+        """
+        found = {}
+        for path, by_type in self.hash_index.paths.items():
+            for entries in by_type.values():
+                for digest_entries in entries.values():
+                    for component, _ in digest_entries:
+                        if self.hash_index.resolves(component):
+                            found.setdefault(id(component), (component, set()))[1].add(path)
+        return list(found.values())
+
+    def _share(self, sniffer: ComponentSniffer):
+        """indexes of the components are shared by all targets
+        """
+        sniffer.hash_index = self.hash_index
+        sniffer.literal_index = self.literal_index
+        sniffer.component_names = self.component_names
+        sniffer.component_positions = self.component_positions
+
+    def make_sniffer(self, target: str) -> ComponentSniffer:
+        if self.store is not None:
+            sniffer = OfflineSniffer(target, self.directory, self.store,
+                                     components=self.components)
+        else:
+            sniffer = ComponentSniffer(target, self.directory,
+                                       components=self.components, session=self.session)
+        self._share(sniffer)
+        sniffer.politeness = self.scheduler
+        sniffer.proxy_pool = self.proxy_pool
+        if self.snapshots is not None:
+            sniffer.recorder = ResponseStore()
+        sniffer.configure(self.options)
+        return sniffer
+
+    def _submit(self, scan: TargetScan, task: Callable[[], None], network: bool):
+        def _run():
+            try:
+                task()
+            finally:
+                if scan.done_one():
+                    self._finish(scan)
+        self.scheduler.submit(scan.host, _run, network)
+
+    def _prepare(self, scan: TargetScan):
+        sniffer = scan.sniffer
+        scan.plugins = sniffer.prepare()
+        if not sniffer.request(sniffer.target):
+            # dead or tarpit target, the checks would only request it again
+            logger.warning("'%s' can't be requested, no component checked", sniffer.target)
+            scan.failed = True
+            return
+        if self.only_components is not None:
+            tasks = [c for c in sniffer.iter_components()
+                     if c.name in self.only_components]
+        else:
+            tasks = list(sniffer.iter_tasks())
+            cached = self._cached_hits(scan)
+            if cached is not None:
+                scan.cached_hits = cached
+                tasks = [c for c in tasks if id(c) not in self.passive_components]
+            tasks.insert(0, None)
+        scan.tasks = tasks
+        scan.task_hits = [None] * len(tasks)
+        scan.add_pending(len(tasks))
+        for i, component in enumerate(tasks):
+            if component is None:
+                self._submit(scan, lambda i=i: self._run_task(
+                    scan, i, lambda: sniffer._process_hash_index(max_workers=1, fetched=scan.hash_paths)),
+                    sniffer.aggression)
+            else:
+                self._submit(scan, lambda i=i, c=component: self._run_task(
+                    scan, i, lambda: self._check(scan, c)), sniffer.needs_network(component))
+
+    @staticmethod
+    def _run_task(scan: TargetScan, index: int, task: Callable[[], List]):
+        scan.task_hits[index] = task()
+
+    def _cached_hits(self, scan: TargetScan) -> Optional[List]:
+        """Passive hits of an earlier target with the same response, None on a miss
+        """
+        if self.result_cache is None:
+            return None
+        resp = scan.sniffer.request(scan.sniffer.target)
+        if not resp:
+            return None
+        fingerprint = response_fingerprint(resp)
+        hits = self.result_cache.get(fingerprint)
+        if hits is None:
+            scan.fingerprint = fingerprint
+            return None
+        logger.debug("'%s' reuses %d passive hits of %s", scan.sniffer.target, len(hits), fingerprint[:12])
+        return [(component, dict(result)) for component, result in hits]
+
+    @staticmethod
+    def _check(scan: TargetScan, component: Component) -> List:
+        hit = scan.sniffer._check_component(component)
+        return [hit] if hit else []
+
+    def _finish(self, scan: TargetScan):
+        """Merge the hits of the tasks once, all of them are done
+        """
+        hits = list(scan.cached_hits)
+        passive_hits = []
+        for component, task_hits in zip(scan.tasks, scan.task_hits):
+            if not task_hits:
+                continue
+            hits.extend(task_hits)
+            if component is not None and id(component) in self.passive_components:
+                passive_hits.extend(task_hits)
+        deadline = scan.sniffer.deadline
+        if scan.fingerprint is not None and (deadline is None or time.monotonic() < deadline):
+            self.result_cache.put(scan.fingerprint, [(c, dict(r)) for c, r in passive_hits])
+        scan.results = scan.sniffer.finish(scan.plugins, hits)
+        if self.snapshots is not None:
+            self._save_snapshot(scan, hits)
+        if self.journal is not None:
+            self.journal.record(scan.sniffer.target, scan.results)
+        if self.on_result is not None:
+            self.on_result(scan.sniffer.target, scan.results)
+
+    def _evaluated(self, scan: TargetScan) -> List[Component]:
+        """Components checked to completion on the target, the cached
+        and the skipped components are not
+        """
+        evaluated = []
+        for component, task_hits in zip(scan.tasks, scan.task_hits):
+            if task_hits is None:
+                continue
+            if component is not None:
+                evaluated.append(component)
+                continue
+            evaluated.extend(c for c, paths in self.hash_components if paths <= scan.hash_paths)
+        return evaluated
+
+    def _save_snapshot(self, scan: TargetScan, hits: List):
+        deadline = scan.sniffer.deadline
+        if scan.failed or (deadline is not None and time.monotonic() >= deadline):
+            logger.warning("'%s' isn't finished, no snapshot saved", scan.sniffer.target)
+            return
+        ruleset = self.snapshots.save_ruleset(self._evaluated(scan))
+        self.snapshots.save(scan.sniffer.target, scan.sniffer.recorder,
+                            scan.plugins, hits, scan.results, ruleset)
+
+    def _run(self):
+        if self.concurrency is None:
+            self.scheduler.run(self.max_threads)
+            return
+        with self.concurrency:
+            self.scheduler.run(self.concurrency.max_threads)
+
+    def start(self) -> Dict[str, List[Dict]]:
+        """:returns {target: results} in the targets order, including the journaled ones
+        """
+        if self.components is None:
+            self.load_components()
+        scans = {}
+        for target in self.targets:
+            if self.journal is not None and target in self.journal:
+                continue
+            scan = TargetScan(self.make_sniffer(target))
+            scan.add_pending(1)
+            self._submit(scan, lambda s=scan: self._prepare(s), True)
+            scans[target] = scan
+        if self.journal is not None:
+            logger.info("journal: %d finished targets skipped", len(self.targets) - len(scans))
+        self._run()
+        return OrderedDict((t, scans[t].results if t in scans else self.journal.get(t))
+                           for t in self.targets)
+
+    def rescan(self) -> Dict[str, List[Dict]]:
+        """Check only the new or changed components on the snapshots of the targets,
+        the targets without snapshot are skipped
+        :returns {target: results} in the targets order
+        """
+        if self.components is None:
+            self.load_components()
+        results = OrderedDict()
+        for target in self.targets:
+            sniffer = self.snapshots.make_sniffer(target, self.directory, self.components)
+            self._share(sniffer)
+            sniffer.configure(self.options)
+            r = self.snapshots.rescan(sniffer)
+            if r is None:
+                logger.warning("'%s' has no snapshot, skipped", target)
+                continue
+            results[target] = r
+            if self.on_result is not None:
+                self.on_result(target, r)
+        return results
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+import datetime
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from src.core import Component
+from src.hash_index import HASH_KEYS, HashIndex
+from src.log import logger
+from src.prefilter import LiteralIndex, trigrams
+
+MAGIC = b"WHB1"
+FORMAT_VERSION = 1
+# magic, format version, header length
+_PREFIX = struct.Struct("<4sHI")
+SECTIONS = ("components", "paths", "names", "literal_index", "hash_index")
+
+
+def is_bundle(path: str) -> bool:
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _safe_path(path: str) -> bool:
+    path = os.path.normpath(path)
+    return not os.path.isabs(path) and not path.startswith("..")
+
+
+def pack(components: List[Tuple[Component, str]], path: str) -> Dict:
+    """Write the components and their indexes into one bundle file:
+
+        "WHB1" | format version | header length | header | sections
+
+    The header is JSON: format version, rule set digest and the offset, length and
+    sha256 of every section. Sections are zlib compressed JSON, the indexes refer to
+    the components by position. Nothing is pickled, a bundle can't run code.
+    :param components: (component, relative path) in the bundle order
+    :returns the header
+    """
+    ordered = [c for c, _ in components]
+    positions = {id(c): i for i, c in enumerate(ordered)}
+    names = {}
+    for i, c in enumerate(ordered):
+        names.setdefault(c.name, i)
+    literal_index = LiteralIndex.build(ordered)
+    hash_index = HashIndex.build(ordered)
+    match_positions = {}
+    for i, c in enumerate(ordered):
+        for j, m in enumerate(c.matches):
+            match_positions[(i, id(m))] = j
+    raw = {
+        "components": _dumps([c.to_dict() for c in ordered]),
+        "paths": _dumps([p for _, p in components]),
+        "names": _dumps(names),
+        "literal_index": _dumps({
+            "literals": {l: sorted(positions[i] for i in ids) for l, ids in literal_index.literals.items()},
+            "always": sorted(positions[i] for i in literal_index.always),
+            "remote": sorted(positions[i] for i in literal_index.remote),
+            "locations": sorted(literal_index.locations),
+        }),
+        "hash_index": _dumps({
+            "paths": {p: {k: {d: [[positions[id(c)], match_positions[(positions[id(c)], id(m))]] for c, m in hits]
+                              for d, hits in by_digest.items()}
+                          for k, by_digest in by_type.items()}
+                      for p, by_type in hash_index.paths.items()},
+            "components": sorted(positions[i] for i in hash_index.components),
+        }),
+    }
+    sections, offset, data = {}, 0, []
+    for name in SECTIONS:
+        compressed = zlib.compress(raw[name], 9)
+        sections[name] = {"offset": offset, "length": len(compressed), "size": len(raw[name]),
+                          "sha256": hashlib.sha256(compressed).hexdigest()}
+        offset += len(compressed)
+        data.append(compressed)
+    header = {
+        "format": FORMAT_VERSION,
+        "created": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "count": len(ordered),
+        # the rule set version, same rules in the same order have the same digest
+        "digest": hashlib.sha256(raw["components"]).hexdigest(),
+        "sections": sections,
+    }
+    header_data = _dumps(header)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_data)))
+        f.write(header_data)
+        for d in data:
+            f.write(d)
+    os.replace(tmp, path)
+    return header
+
+
+class Bundle:
+    """A memory mapped bundle of `pack`, the sections are checked and decompressed when
+    they are first used, the indexes are loaded instead of being built from the rules
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _PREFIX.size:
+            raise ValueError("'%s' is not a components bundle" % path)
+        magic, version, header_len = _PREFIX.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError("'%s' is not a components bundle" % path)
+        if version > FORMAT_VERSION:
+            raise ValueError("bundle format %d of '%s' is newer than %d" % (version, path, FORMAT_VERSION))
+        try:
+            self.header = json.loads(self._mm[_PREFIX.size:_PREFIX.size + header_len].decode("utf-8"))
+        except ValueError as err:
+            raise ValueError("bundle header of '%s' is broken: %s" % (path, err))
+        self._data = _PREFIX.size + header_len
+        self._components = None
+
+    @property
+    def digest(self) -> str:
+        return self.header["digest"]
+
+    def section(self, name: str):
+        info = self.header["sections"].get(name)
+        if info is None:
+            raise ValueError("bundle '%s' has no section '%s'" % (self.path, name))
+        start = self._data + info["offset"]
+        data = self._mm[start:start + info["length"]]
+        if hashlib.sha256(data).hexdigest() != info["sha256"]:
+            raise ValueError("bundle section '%s' of '%s' is corrupted" % (name, self.path))
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+
+    @property
+    def components(self) -> List[Component]:
+        if self._components is None:
+            self._components = [Component.from_dict(info) for info in self.section("components")]
+            logger.debug("bundle '%s' %s: %d components", self.path, self.digest[:12], len(self._components))
+        return self._components
+
+    def paths(self) -> List[str]:
+        return self.section("paths")
+
+    def component_names(self) -> Dict[str, Component]:
+        components = self.components
+        return {name: components[i] for name, i in self.section("names").items()}
+
+    def component_positions(self) -> Dict[int, int]:
+        return {id(c): i for i, c in enumerate(self.components)}
+
+    def literal_index(self) -> LiteralIndex:
+        components = self.components
+        data = self.section("literal_index")
+        index = LiteralIndex()
+        index.literals = {l: {id(components[i]) for i in ids} for l, ids in data["literals"].items()}
+        index.always = {id(components[i]) for i in data["always"]}
+        index.remote = {id(components[i]) for i in data["remote"]}
+        # older bundles search all the locations
+        if "locations" in data:
+            index.locations = set(data["locations"])
+        index.grams = {l: tuple(trigrams(l)) for l in index.literals}
+        return index
+
+    def hash_index(self) -> HashIndex:
+        components = self.components
+        data = self.section("hash_index")
+        index = HashIndex()
+        for path, by_type in data["paths"].items():
+            for k in HASH_KEYS:
+                for digest, hits in by_type.get(k, {}).items():
+                    index.paths.setdefault(path, {}).setdefault(k, {})[digest] = [
+                        (components[i], components[i].matches[j]) for i, j in hits]
+        index.components = {id(components[i]) for i in data["components"]}
+        return index
+
+    def unpack(self, directory: str) -> int:
+        """Write the components as JSON files into `directory`, :returns the number of files
+        """
+        count = 0
+        for component, path in zip(self.section("components"), self.paths()):
+            if not _safe_path(path):
+                path = os.path.join(component["type"], component["name"] + ".json")
+            path = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(component, f, ensure_ascii=False, indent=2)
+            count += 1
+        return count
+
+    def close(self):
+        self._components = None
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load(target, path: str) -> List[Component]:
+    """Set the components and the precomputed indexes of the bundle on `target`
+    """
+    bundle = Bundle(path)
+    target.components = bundle.components
+    target.hash_index = bundle.hash_index()
+    target.literal_index = bundle.literal_index()
+    target.component_names = bundle.component_names()
+    target.component_positions = bundle.component_positions()
+    return target.components
+
+
+def pack_directory(directory: str, path: str, ignore_dirs=["tests"]) -> Optional[Dict]:
+    from src.core import ComponentGeneratorMixin
+    loader = ComponentGeneratorMixin()
+    loader.directory = directory
+    components = sorted(((c, os.path.relpath(p, directory)) for c, p in loader.iter_components(ignore_dirs, needpath=True)),
+                        key=lambda item: item[1])
+    return pack(components, path)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import codecs
+import re
+from types import MappingProxyType
+from typing import Mapping, Optional, Pattern
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+# charsets of the encoded non-ascii `text` needles: a utf-8 sequence can't match
+# inside another character, the needles of other multibyte charsets can
+COMMON_CHARSETS = ("utf-8",)
+# charsets in which every byte of a non-ascii character is >= 0x80, an ascii byte is
+# always an ascii character. The trail bytes of gbk, big5 and shift_jis, and the escapes
+# of iso-2022 and utf-7 are ascii bytes
+_ASCII_SAFE_CHARSETS = frozenset(("ascii", "utf-8", "euc_jp", "euc_kr", "koi8-r", "koi8-u"))
+_ASCII_SAFE_PREFIXES = ("iso8859-", "cp125")
+# undeclared charsets are validated by chunks of the body, not a copy of it
+_VALIDATE_CHUNK = 64 * 1024
+
+_REPEATS = tuple(getattr(sre_parse, name) for name in
+                 ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(sre_parse, name))
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+# `\d` matches the unicode digits in the text and only the ascii ones in the bytes,
+# accepted as the versions are ascii. `\w`, `\s` and the negations need the text
+_SAFE_CATEGORIES = (sre_parse.CATEGORY_DIGIT,)
+_UNSAFE_AT = (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY)
+
+
+def normalize_charset(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip().strip("'\"")).name
+    except LookupError:
+        return None
+
+
+def _byte_safe(parsed) -> bool:
+    """The regexp matches the same on the bytes as on the text of an ascii
+    compatible charset: only ascii literals, classes of them and `\\d`
+    """
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            if av >= 128:
+                return False
+        elif op is sre_parse.IN:
+            for iop, iav in av:
+                if iop is sre_parse.LITERAL and iav < 128:
+                    continue
+                if iop is sre_parse.RANGE and iav[1] < 128:
+                    continue
+                if iop is sre_parse.CATEGORY and iav in _SAFE_CATEGORIES:
+                    continue
+                return False
+        elif op is sre_parse.CATEGORY:
+            if av not in _SAFE_CATEGORIES:
+                return False
+        elif op is sre_parse.AT:
+            if av in _UNSAFE_AT:
+                return False
+        elif op is sre_parse.SUBPATTERN:
+            if not _byte_safe(av[-1]):
+                return False
+        elif op in _REPEATS:
+            if not _byte_safe(av[2]):
+                return False
+        elif op is sre_parse.BRANCH:
+            if not all(_byte_safe(b) for b in av[1]):
+                return False
+        elif op is _ATOMIC_GROUP:
+            if not _byte_safe(av):
+                return False
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            if not _byte_safe(av[1]):
+                return False
+        elif op is sre_parse.GROUPREF:
+            continue
+        else:
+            # ANY, NOT_LITERAL, GROUPREF_EXISTS...
+            return False
+    return True
+
+
+def bytes_pattern(regexp: str) -> Optional[Pattern]:
+    """Compile `regexp` for the raw bytes, None when it needs the decoded text
+    """
+    if not regexp.isascii():
+        return None
+    try:
+        if not _byte_safe(sre_parse.parse(regexp, re.I)):
+            return None
+        return re.compile(regexp.encode("ascii"), re.I)
+    except Exception:
+        return None
+
+
+def text_patterns(text: str) -> Optional[Mapping[Optional[str], Pattern]]:
+    """Encoded `text` needle by charset, None for ascii compatible charsets
+    """
+    if not text:
+        return None
+    if text.isascii():
+        return MappingProxyType({None: re.compile(re.escape(text.encode("ascii")))})
+    patterns = {}
+    for charset in COMMON_CHARSETS:
+        try:
+            patterns[normalize_charset(charset)] = re.compile(re.escape(text.encode(charset)))
+        except UnicodeEncodeError:
+            continue
+    return MappingProxyType(patterns)
+
+
+def ascii_compatible(charset: Optional[str], content) -> bool:
+    """ASCII needles found in the bytes are found in the decoded text, an undeclared
+    charset is safe only for ascii or utf-8 content
+    """
+    if charset is not None:
+        return charset in _ASCII_SAFE_CHARSETS or charset.startswith(_ASCII_SAFE_PREFIXES)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    is_ascii = True
+    with memoryview(content) as view:
+        try:
+            for i in range(0, len(view), _VALIDATE_CHUNK):
+                is_ascii = decoder.decode(view[i:i + _VALIDATE_CHUNK]).isascii() and is_ascii
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return False
+        if is_ascii:
+            # NUL of utf-16/32
+            return b"\x00" not in view[:1024].tobytes()
+    return True
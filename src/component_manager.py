@@ -95,23 +95,19 @@ class ComponentManager(ComponentGeneratorMixin, RemoteComponentMixin):
         self.init_database(db, user, password, host, port)
         for c in self.iter_components():
             c_info = self.select_component_with(c.name)
+            data = c.to_dict()
+            for k in ('properties', 'matches', 'implies', 'excludes'):
+                if data[k] is not None:
+                    data[k] = json.dumps(data[k], ensure_ascii=False)
             if c_info is None:
                 info = {
                     "c_id": get_uuid(),
                     "c_name": c.name,
                     "c_first": get_pinyin_first_letter(c.name),
                     "c_type": c.type,
-                    'author': c.author,
-                    'version': c.version,
-                    'website': c.website,
-                    "desc": c.desc,
-                    "producer": c.producer,
-                    "properties": c.properties if c.properties is None else json.dumps(c.properties, ensure_ascii=False),
-                    "matches": json.dumps(c.matches, ensure_ascii=False),
-                    "condition": c.condition,
-                    "implies": c.implies if c.implies is None else json.dumps(c.implies, ensure_ascii=False),
-                    "excludes": c.excludes if c.excludes is None else json.dumps(c.excludes, ensure_ascii=False)
                 }
+                for k in ('author', 'version', 'website', 'desc', 'producer', 'properties', 'matches', 'condition', 'implies', 'excludes'):
+                    info[k] = data[k]
                 echo.binfo("Add new component: %s" % c)
                 flag = self.insert_component(**info)
                 if flag:
@@ -119,14 +115,9 @@ class ComponentManager(ComponentGeneratorMixin, RemoteComponentMixin):
             elif updating:
                 info = {
                     "c_type": c.type,
-                    "desc": c.desc,
-                    "producer": c.producer,
-                    "properties": c.properties,
-                    "matches": json.dumps(c.matches, ensure_ascii=False),
-                    "condition": c.condition,
-                    "implies": c.implies if c.implies is None else json.dumps(c.implies, ensure_ascii=False),
-                    "excludes": c.excludes if c.excludes is None else json.dumps(c.excludes, ensure_ascii=False)
                 }
+                for k in ('author', 'desc', 'producer', 'properties', 'matches', 'condition', 'implies', 'excludes'):
+                    info[k] = data[k]
                 echo.binfo("Update component: %s" % c)
                 flag = self.update_component_with(c.name, **info)
                 if flag:
@@ -135,6 +126,46 @@ class ComponentManager(ComponentGeneratorMixin, RemoteComponentMixin):
         echo.succ("*Count: %s" %
                   " ".join("%s: %d" % (k, v) for k, v in count.items()))
 
+    def lint(self, top: int = 20) -> bool:
+        """Validate the components and show the most expensive ones,
+        :returns False when a component is broken
+        """
+        from src.lint import ERROR, lint_directory
+        linter = lint_directory(self.directory)
+        for issue in linter.issues:
+            show = echo.fail if issue.level == ERROR else echo.warn
+            show("[%s] '%s' %s: %s" % (issue.level, issue.path, issue.name or "-", issue.message))
+        if top:
+            echo.blod("Most expensive components (relative cost per target):")
+            for cost in linter.top_costs(top):
+                echo.binfo("- %8.1f  %s  '%s'  %s" % (cost.score, cost.name, cost.path,
+                                                      ", ".join(cost.reasons) or "-"))
+            echo.binfo("Aggressive requests per target: %d" % len(linter.urls))
+        errors = len(linter.errors)
+        echo.succ("*Count: files: %d errors: %d warnings: %d" %
+                  (linter.files, errors, len(linter.issues) - errors))
+        return errors == 0
+
+    def pack(self, path: str):
+        """Pack the components and their indexes into one bundle file
+        """
+        from src.bundle import pack_directory
+        header = pack_directory(self.directory, path)
+        echo.succ("*Packed %d components into '%s', digest: %s" % (header["count"], path, header["digest"]))
+
+    def unpack(self, path: str):
+        """Unpack the components of a bundle file into the directory
+        """
+        from src.bundle import Bundle
+        try:
+            with Bundle(path) as bundle:
+                count = bundle.unpack(self.directory)
+                digest = bundle.digest
+        except ValueError as err:
+            echo.fail(str(err))
+            return
+        echo.succ("*Unpacked %d components into '%s', digest: %s" % (count, self.directory, digest))
+
     def search(self, components: Tuple[str]):
         count = 0
         for c, c_path in self.iter_components(needpath=True):
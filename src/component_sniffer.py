@@ -2,23 +2,45 @@
 import queue
 import re
 import threading
-from typing import Dict, Iterable, List, Optional, Set, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Generator, Iterable, List, Optional, Set, Tuple
 
+from src import metrics
 from src.condition import Condition
-from src.core import (Component, ComponentGeneratorMixin, ComposeURLMixin,
-                      RequestManagerMixin)
+from src.core import (KEYED_VIEWS, Component, ComponentGeneratorMixin,
+                      ComposeURLMixin, Match, RequestManagerMixin)
+from src.hash_index import HASH_KEYS, HashIndex
 from src.log import logger
 from src.plugins import PluginsMixin
-from src.utils import fake_user_agent, monkeypatch_proxy, synchronized_property
+from src.prefilter import LiteralIndex
+from src.proxy_pool import ProxyPool, parse_proxy
+from src.utils import cached_property, fake_user_agent
+from src.version import VersionCandidate, candidate_weight, normalize_version, resolve
+
+# a matched component and its result
+Hit = Tuple[Component, Dict]
 
 
 class ComponentSniffer(ComponentGeneratorMixin, RequestManagerMixin, ComposeURLMixin, PluginsMixin):
-    def __init__(self, target: str, directory: str):
+    def __init__(self, target: str, directory: str, components: Optional[List[Component]] = None, session=None):
         self.target = target
         self.directory = directory
+        # preloaded components and connection pool of a long-running scanner
+        self.components = components
+        self.session = session
+        self.request_manager_history = {}
+        self.probe_history = {}
+        self.request_manager_lock = threading.Lock()
 
         self.aggression = False
+        # use HEAD for rules only check the status
+        self.probe_head = False
+        self.connect_timeout = 10
         self.timeout = 30
+        self.retries = 2
+        # seconds for the whole target, the remaining requests are cancelled after
+        self.target_timeout = None
         self.allow_redirect = True
         self.max_threads = 8
 
@@ -26,10 +48,10 @@ class ComponentSniffer(ComponentGeneratorMixin, RequestManagerMixin, ComposeURLM
             "user-agent": fake_user_agent()
         }
         self._cond_parser = Condition()
-        # threading lock variable
-        self._results = []
-        self._implies = set()
-        self._excludes = set()
+        # merged by `finish`
+        self.results = []
+        self.implies = set()
+        self.excludes = set()
 
     @property
     def headers(self):
@@ -58,224 +80,359 @@ class ComponentSniffer(ComponentGeneratorMixin, RequestManagerMixin, ComposeURLM
                 "'%s' object 'user_agent' type must be str", self.__class__.__name__)
         self._headers["user-agent"] = value
 
-    @synchronized_property
-    def results(self) -> List[Dict]:
-        return self._results
-
-    @synchronized_property
-    def implies(self) -> Set[str]:
-        return self._implies
-
-    @synchronized_property
-    def excludes(self) -> Set[str]:
-        return self._excludes
+    def configure(self, options: Dict):
+        """Apply the scan options: aggression, head_probe, headers, user_agent,
+        disallow_redirect, max_threads, connect_timeout, read_timeout, retries, target_timeout
+        """
+        self.aggression = bool(options.get("aggression", self.aggression))
+        self.probe_head = bool(options.get("head_probe", self.probe_head))
+        self.max_threads = int(options.get("max_threads", self.max_threads))
+        if options.get("retries") is not None:
+            self.retries = max(0, int(options["retries"]))
+        if options.get("connect_timeout"):
+            self.connect_timeout = float(options["connect_timeout"])
+        if options.get("read_timeout"):
+            self.timeout = float(options["read_timeout"])
+        if options.get("target_timeout"):
+            self.target_timeout = float(options["target_timeout"])
+        if options.get("headers"):
+            self.headers = options["headers"]
+        if options.get("user_agent"):
+            self.user_agent = options["user_agent"]
+        if options.get("disallow_redirect"):
+            self.allow_redirect = False
 
-    def set_proxy(self, proxy, rdns: bool):
+    def set_proxy(self, proxy, rdns: bool = True):
+        """Send the requests through one or many proxies, see `parse_proxy`
+        """
         if isinstance(proxy, str):
-            # "type/username@password/addr:port"
-            items = proxy.split("/")
-            if len(items) < 2:
-                raise ValueError("Set Proxy must need 'type/addr:port'")
-            proxy = {}
-            if len(items) == 2:
-                if not ":" in items[1]:
-                    raise ValueError("Set Proxy must need 'addr:port'")
-                addr, port = items[1].split(":")
-                proxy["addr"] = addr
-                try:
-                    proxy["port"] = int(port)
-                except ValueError:
-                    raise ValueError(
-                        "Set Proxy 'port' type must be int '%s'", port)
-            proxy["proxy_type"] = items[0]
-        monkeypatch_proxy(**proxy, rdns=rdns)
-
-    def load_plugins(self):
+            proxy = [proxy]
+        self.proxy_pool = ProxyPool([parse_proxy(p, rdns) for p in proxy])
+
+    def load_plugins(self) -> List[Dict]:
         resp = self.request(self.target)
         if resp:
-            self.results.append(self.get_title(resp["body"]))
+            title = self.get_title(resp["body"])
         else:
-            self.results.append(self.get_title(""))
-        self.results.append(self.get_ip(self.target_parsed.hostname))
+            title = self.get_title("")
+        return [title, self.get_ip(self.target_parsed.hostname)]
+
+    @cached_property
+    def hash_index(self) -> HashIndex:
+        return HashIndex.build(self.iter_components())
 
-    def _check_match(self, match: Dict) -> Tuple[bool, Optional[str]]:
+    @cached_property
+    def literal_index(self) -> LiteralIndex:
+        return LiteralIndex.build(self.iter_components())
+
+    def _literal_candidates(self) -> Optional[Set[int]]:
+        """id of the components may match the target, None when unknown
+        """
+        resp = self.request(self.target)
+        if not resp:
+            return None
+        candidates = self.literal_index.candidates(resp, self.aggression)
+        logger.debug("literal index: %d candidates", len(candidates))
+        return candidates
+
+    def _search_context(self, match: Match, resp: Dict):
+        """Select the search location of `match`, None when the key is not found
+        """
+        if match.search_key is not None:
+            # headers[key], meta[key], cookies[key]
+            values = resp[KEYED_VIEWS[match.search]]
+            key = match.search_key.lower() if match.search == "headers" else match.search_key
+            return values.get(key)
+        if match.search == 'all':
+            return resp['raw_response']
+        if match.search == 'headers':
+            return resp['raw_headers']
+        if match.search == 'cookies':
+            return resp['raw_cookies']
+        if match.search in ('script', 'title'):
+            return resp[match.search]
+        return resp.get('body')
+
+    def _check_match(self, match: Match) -> Tuple[bool, Optional[str]]:
         """check match
         :returns flag, version
         """
-        s = {"regexp", "text", "md5", "status"}
-        if not s.intersection(list(match.keys())):
+        if not match.checkable:
             return False, None
         # parse url
         resp = self.request(self.target)
-        if "url" in match:
-            if match['url'] == '/':  # 优化处理
-                pass
-            elif self.aggression:
-                resp = self.request(self.compose_url(match['url']))
-            else:
+        if match.is_remote:
+            if not self.aggression:
                 logger.debug(
-                    "match has url(%s) field, but aggression is false" % match['url'])
+                    "match has url(%s) field, but aggression is false" % match.url)
                 return False, None
+            if match.is_probe:
+                resp = self.probe(self.compose_url(match.url),
+                                  head=self.probe_head and match.md5 is None and match.mmh3 is None,
+                                  mmh3=match.mmh3 is not None)
+            else:
+                resp = self.request(self.compose_url(match.url))
+        if resp and match.mmh3 is not None and "mmh3" not in resp and match.is_probe:
+            resp = self.probe(resp['url'], mmh3=True)
         if not resp:
             return False, None
+        # status,md5,mmh3
+        if match.status is not None and match.status != resp['status']:
+            return False, None
+        if match.md5 is not None and match.md5 != resp['md5']:
+            return False, None
+        if match.mmh3 is not None and match.mmh3 != resp.get('mmh3'):
+            return False, None
         # parse search
-        search_context = resp['body']
-        if 'search' in match:
-            if match['search'] == 'all':
-                search_context = resp['raw_response']
-            elif match['search'] == 'headers':
-                search_context = resp['raw_headers']
-            elif match['search'] == 'script':
-                search_context = resp['script']
-            elif match['search'] == 'title':
-                search_context = resp['title']
-            elif match['search'] == 'cookies':
-                search_context = resp['raw_cookies']
-            elif match['search'].endswith(']'):
-                # headers[key], meta[key], cookies[key]
-                for i in ('headers', 'meta', 'cookies'):
-                    if not match['search'].startswith('%s[' % i):
-                        continue
+        if match.search_key is None and match.text is None and match.regexp is None:
+            return True, match.version
+        if match.search_key is None and match.search in ('body', 'all'):
+            checked = self._check_bytes(match, resp)
+            if checked is not None:
+                return checked
+        search_context = self._search_context(match, resp)
+        if search_context is None:
+            return False, None
+        _searchs = search_context
+        if isinstance(search_context, str):
+            _searchs = [search_context]
+        # text
+        if match.text is not None:
+            if not any(match.text in _context for _context in _searchs):
+                return False, None
+        # regexp
+        version = match.version
+        if match.regexp is not None:
+            if match.pattern is None:
+                return False, None
+            for _context in _searchs:
+                found = match.pattern.search(_context)
+                if found:
+                    version = self._version_of(match, found)
+                    break
+            else:
+                return False, None
 
-                    key = match['search'][len('%s[' % i):-1]
-                    if key not in resp[i]:
-                        return False, None
-                    search_context = resp[i].get(key, "")
-            match.pop('search')
-        # version
-        version = match.get('version', None)
-        # status,md5,text,regexp
-        for key in list(match.keys()):
-            if key == 'status':
-                if match[key] != resp[key]:
-                    return False, None
-
-            if key == 'md5':
-                if resp[key] != match[key]:
-                    return False, None
-
-            if key == 'text':
-                if isinstance(search_context, str):
-                    if match[key] not in search_context:
-                        return False, None
-                else:
-                    for _context in search_context:
-                        if match[key] not in search_context:
-                            continue
-                        break
-                    else:
-                        return False, None
-
-            if key == 'regexp':
-                _searchs = search_context
-                if isinstance(search_context, str):
-                    _searchs = [search_context]
-
-                for search_context in _searchs:
-                    try:
-                        regex = re.compile(match[key], re.I)
-                    except Exception as err:
-                        logger.error("%s re compile error: %s",
-                                     match[key], err)
-                        continue
-                    result = regex.findall(search_context)
-                    if not result:
-                        continue
+        return True, version
 
-                    if 'offset' in match:
-                        if isinstance(result[0], str):
-                            version = result[0]
-                        elif isinstance(result[0], tuple):
-                            if len(result[0]) > match['offset']:
-                                version = result[0][match['offset']]
-                            else:
-                                version = ''.join(result[0])
-                    break
-                else:
-                    return False, None
+    @staticmethod
+    def _version_of(match: Match, found: re.Match) -> Optional[str]:
+        """Version from the first match of the regexp: the whole match without groups,
+        the only group, or the `offset` group (all the groups joined when it is out of range)
+        """
+        version = match.version
+        if match.offset is not None:
+            empty = found.group(0)[:0]
+            groups = tuple(empty if g is None else g for g in found.groups())
+            if not groups:
+                version = found.group(0)
+            elif len(groups) == 1:
+                version = groups[0]
+            elif len(groups) > match.offset:
+                version = groups[match.offset]
+            else:
+                version = empty.join(groups)
+        if isinstance(version, bytes):
+            version = version.decode("iso-8859-1")
+        return version
 
+    def _check_bytes(self, match: Match, resp: Dict) -> Optional[Tuple[bool, Optional[str]]]:
+        """Check the `body`/`all` match on the raw bytes,
+        None when the match needs the decoded text
+        """
+        if 'content' not in resp:
+            return None
+        if match.regexp is not None and match.bpattern is None:
+            return None
+        needle = None
+        if match.text is not None:
+            if not match.btexts:
+                return None
+            needle = match.btexts.get(None) or match.btexts.get(resp['charset'])
+            if needle is None:
+                return None
+        if not resp['ascii_compatible']:
+            return None
+        context = resp['content'] if match.search == 'body' else resp['raw_response_bytes']
+        if needle is not None and not needle.search(context):
+            return False, None
+        version = match.version
+        if match.regexp is not None:
+            found = match.bpattern.search(context)
+            if not found:
+                return False, None
+            version = self._version_of(match, found)
         return True, version
 
     def _check_matches(self, component: Component) -> Optional[Dict]:
         """check component matches
         """
         cond_map = {}
-        result = {"name": component.name}
+        candidates = []
+        metrics.MATCH_EVALUATIONS.inc(len(component.matches))
         # TODO  当 condition 为 OR 时匹配出信息直接退出 减少检测次数
         for index, match in enumerate(component.matches):
             is_match, ver = self._check_match(match)
             cond_map[str(index)] = is_match
+            ver = normalize_version(ver) if is_match else None
             if ver:
-                result['version'] = ver
+                extracted = match.regexp is not None and match.offset is not None
+                candidates.append(VersionCandidate(ver, index, candidate_weight(match, extracted)))
         # default or
         if not component.condition:
             if any(cond_map.values()):
-                return result
+                return self._result_of(component, candidates)
             return None
         # calculation condition
         if self._cond_parser.parse(component.condition, cond_map):
-            return result
+            return self._result_of(component, candidates)
         return None
 
-    def _update_set_data(self, src: Set, value):
-        if not value:
-            return
-        if isinstance(value, str):
-            src.add(value)
-        else:
-            src.update(value)
-
-    def _update_result(self, c_name: str, value: Dict):
-        if c_name in self.excludes:
-            return
-        self.results.append(value)
+    @staticmethod
+    def _result_of(component: Component, candidates: List[VersionCandidate]) -> Dict:
+        """Result with the best version of the matched rules, its confidence is only
+        reported when the rules disagree
+        """
+        result = {"name": component.name}
+        version, confidence = resolve(candidates)
+        if version is not None:
+            result["version"] = version
+            if confidence < 1:
+                result["confidence"] = confidence
+        return result
 
-    def _process_check_matches_result(self, component):
+    def _check_component(self, component: Component) -> Optional[Hit]:
+        start = time.monotonic()
         result = self._check_matches(component)
+        metrics.STAGE_SECONDS.observe(time.monotonic() - start, stage="check")
         if not result:
-            return
+            return None
+        metrics.HITS.inc()
+        return component, result
+
+    @cached_property
+    def component_names(self) -> Dict[str, Component]:
+        """name -> the first component with the name
+        """
+        names = {}
+        for component in self.iter_components():
+            names.setdefault(component.name, component)
+        return names
+
+    @cached_property
+    def component_positions(self) -> Dict[int, int]:
+        """id of component -> its position in the components
+        """
+        return {id(c): i for i, c in enumerate(self.iter_components())}
+
+    def _merge_hits(self, hits: List[Hit]) -> List[Dict]:
+        """Merge the hits of all workers into results in the components order,
+        implied components are appended, excluded components are removed
+        """
+        position = self.component_positions
+        hits = sorted(hits, key=lambda hit: position.get(id(hit[0]), -1))
+
+        implies, excludes = set(), set()
+        for component, _ in hits:
+            implies.update(component.implies)
+            excludes.update(component.excludes)
         # Handling dependent and non dependent components of components
-        self._update_set_data(self.implies, component.implies)
-        self._update_set_data(self.excludes, component.excludes)
-        self._update_result(component.name, result)
-
-    def _process_implies(self):
-        # TODO 优化 O(n(m+z))
-        for imply in self.implies:
-            _result = {
-                'name': imply
-            }
-            for component in self.iter_components():
-                if component.name != imply:
+        found = {component.name for component, _ in hits}
+        implied = []
+        for imply in sorted(implies):
+            component = self.component_names.get(imply)
+            if component is None or imply in found:
+                continue
+            excludes.update(component.excludes)
+            implied.append({'name': imply})
+
+        self.implies, self.excludes = implies, excludes
+        results = [result for component, result in hits]
+        results.extend(implied)
+        return [r for r in results if r['name'] not in excludes]
+
+    def _fetch_hash_path(self, path: str) -> Optional[Dict]:
+        need_mmh3 = self.hash_index.needs(path, "mmh3")
+        url = self.target if path == '/' else self.compose_url(path)
+        if path == '/' and not need_mmh3:
+            return self.request(url)
+        return self.probe(url, mmh3=need_mmh3)
+
+    def _process_hash_index(self, max_workers: Optional[int] = None,
+                            fetched: Optional[Set[str]] = None) -> List[Hit]:
+        """Fetch every distinct path of the hash index once,
+        and look up its digests to resolve the hash only components
+        :param fetched: the paths fetched are added to it
+        """
+        paths = [p for p in self.hash_index.paths if p == '/' or self.aggression]
+        if not paths:
+            return []
+        # id of component -> (component, version candidates)
+        found = {}
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_threads) as executor:
+            for path, resp in zip(paths, executor.map(self._fetch_hash_path, paths)):
+                if not resp:
                     continue
-                self._update_set_data(self.excludes, component.excludes)
-                self._update_result(imply, _result)
-                break
+                if fetched is not None:
+                    fetched.add(path)
+                digests = {k: resp.get(k) for k in HASH_KEYS}
+                for component, match in self.hash_index.lookup(path, digests):
+                    if not self.hash_index.resolves(component):
+                        continue
+                    _, candidates = found.setdefault(id(component), (component, []))
+                    ver = normalize_version(match.version)
+                    if ver:
+                        candidates.append(VersionCandidate(ver, -1, candidate_weight(match, False)))
+        return [(component, self._result_of(component, candidates)) for component, candidates in found.values()]
+
+    def needs_network(self, component: Component) -> bool:
+        """Checking the component requests other urls than the target
+        """
+        return self.aggression and any(m.is_remote for m in component.matches)
+
+    def iter_tasks(self) -> Generator[Component, None, None]:
+        """Components need to check their matches: hash only components are resolved
+        by the hash index, components without the required literals in the target can't match
+        """
+        candidates = self._literal_candidates()
+        for component in self.iter_components():
+            if self.hash_index.resolves(component):
+                continue
+            if candidates is not None and id(component) not in candidates:
+                continue
+            yield component
 
-    def _multi_check_matches(self):
-        """Multi-thread check component matching
+    def _multi_check_matches(self) -> List[Hit]:
+        """Multi-thread check component matching, every worker keeps its own hits
         """
-        def _worker():
+        def _worker(hits: List[Hit]):
             nonlocal _task_q
             while True:
                 component_or_signal = _task_q.get()
                 if component_or_signal == "QUIT":
                     break
+                metrics.QUEUED_TASKS.dec()
                 component = component_or_signal
                 try:
-                    self._process_check_matches_result(component)
+                    hit = self._check_component(component)
                 except Exception as err:
                     logger.error(
                         "in _worker [%s] %s" % (component.name, err))
                     continue
+                if hit:
+                    hits.append(hit)
         _task_q = queue.Queue(maxsize=50)
         _ts = []
+        _partials = []
         for _ in range(self.max_threads):
-            _t = threading.Thread(target=_worker)
+            _hits = []
+            _t = threading.Thread(target=_worker, args=(_hits,))
             _t.start()
             _ts.append(_t)
+            _partials.append(_hits)
         # queue put task
-        for component in self.iter_components():
+        for component in self.iter_tasks():
+            metrics.QUEUED_TASKS.inc()
             _task_q.put(component)
         # queue put QUIT
         for _ in range(self.max_threads):
@@ -284,19 +441,45 @@ class ComponentSniffer(ComponentGeneratorMixin, RequestManagerMixin, ComposeURLM
         for _t in _ts:
             _t.join()
         del _ts, _task_q
+        return [hit for _hits in _partials for hit in _hits]
+
+    def prepare(self) -> List[Dict]:
+        """Load components and request the target, :returns plugins results
+        """
+        metrics.TARGETS.inc(state="started")
+        if self.target_timeout:
+            self.deadline = time.monotonic() + self.target_timeout
+        if self.components is None:
+            self.load_components()
+        with metrics.STAGE_SECONDS.time(stage="prepare"):
+            return self.load_plugins()
+
+    def finish(self, plugins: List[Dict], hits: List[Hit]) -> List[Dict]:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            logger.warning("'%s' exceeds the deadline of %ss, results may be incomplete",
+                           self.target, self.target_timeout)
+        with metrics.STAGE_SECONDS.time(stage="finish"):
+            self.results = plugins + self._merge_hits(hits)
+        metrics.TARGETS.inc(state="finished")
+        return self.results
 
     def test(self, components: Tuple[str]):
-        self.load_plugins()
+        plugins = self.prepare()
+        hits = []
         for component in self.iter_components():
             if not component.name in components:
                 continue
             logger.debug("test '%s' check matches", component.name)
-            self._process_check_matches_result(component)
-        self._process_implies()
-        return self.results
+            hit = self._check_component(component)
+            if hit:
+                hits.append(hit)
+        return self.finish(plugins, hits)
 
     def start(self):
-        self.load_plugins()
-        self._multi_check_matches()
-        self._process_implies()
-        return self.results
+        plugins = self.prepare()
+        if not self.request(self.target):
+            logger.warning("'%s' can't be requested, no component checked", self.target)
+            return self.finish(plugins, [])
+        hits = self._process_hash_index()
+        hits.extend(self._multi_check_matches())
+        return self.finish(plugins, hits)
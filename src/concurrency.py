@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from src import metrics
+from src.log import logger
+from src.scheduler import BACKOFF_STATUS, HostScheduler
+
+# `type(e).__name__` of the request errors that mean the network or the hosts are overloaded,
+# refused connections are dead hosts, not congestion
+TIMEOUT_KINDS = ("ConnectTimeout", "ReadTimeout", "Timeout", "TimeoutError", "timeout")
+
+
+class Sample(NamedTuple):
+    # responses and timed out requests
+    requests: int
+    # timed out or throttled (429/503) requests
+    congested: int
+    # average seconds until the response headers, None without responses
+    latency: Optional[float]
+    # process CPU seconds per second, the matching threads share one core because of the GIL
+    cpu: float
+    network_saturated: bool
+    match_saturated: bool
+
+
+class AdaptiveConcurrency:
+    """AIMD control of the running network and match tasks of a `HostScheduler`,
+    the two limits are tuned independently every `interval` seconds:
+
+    - network: doubled (slow start) and then +1 while the limit is reached and the
+      requests are healthy, halved when the average latency exceeds `latency_factor`
+      times its baseline or more than `max_congestion` of the requests time out or
+      are throttled
+    - match: +1 while the limit is reached and the process has CPU to spare, cut by a
+      quarter when the CPU is saturated, more threads only contend for the GIL then
+    """
+
+    def __init__(self, scheduler: HostScheduler, initial: int = 8, max_network: int = 64,
+                 max_match: Optional[int] = None, interval: float = 1.0,
+                 max_congestion: float = 0.05, latency_factor: float = 2.0,
+                 cpu_saturation: float = 0.9, min_samples: int = 10):
+        self.scheduler = scheduler
+        self.max_network = max(1, max_network)
+        self.max_match = max(1, max_match or max_network)
+        self.network = min(max(1, initial), self.max_network)
+        self.match = min(max(1, initial), self.max_match)
+        self.interval = interval
+        self.max_congestion = max_congestion
+        self.latency_factor = latency_factor
+        self.cpu_saturation = cpu_saturation
+        self.min_samples = min_samples
+        self.base_latency = None
+        self.slow_start = True
+        self.peak_network = self.network
+        # samples accumulated until `min_samples` requests
+        self._requests = self._congested = 0
+        self._latency_count, self._latency_sum = 0, 0.0
+        self._last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def max_threads(self) -> int:
+        """Workers the scheduler needs to reach both limits
+        """
+        return self.max_network + self.max_match
+
+    @property
+    def levels(self) -> Tuple[int, int]:
+        return self.network, self.match
+
+    def _apply(self):
+        self.scheduler.set_limits(self.network, self.match)
+        metrics.CONCURRENCY.set(self.network, kind="network")
+        metrics.CONCURRENCY.set(self.match, kind="match")
+
+    def _counters(self):
+        return (
+            time.monotonic(),
+            time.process_time(),
+            metrics.REQUESTS.value(),
+            sum(metrics.REQUEST_ERRORS.value(kind=k) for k in TIMEOUT_KINDS),
+            sum(metrics.REQUESTS.value(status=s) for s in BACKOFF_STATUS),
+        ) + metrics.REQUEST_SECONDS.count()
+
+    def sample(self) -> Sample:
+        now = self._counters()
+        last, self._last = self._last or now, now
+        wall, cpu, responses, timeouts, throttled, count, total = (a - b for a, b in zip(now, last))
+        network_saturated, match_saturated = self.scheduler.saturation()
+        return Sample(int(responses + timeouts), int(timeouts + throttled),
+                      total / count if count else None, cpu / wall if wall > 0 else 0.0,
+                      network_saturated, match_saturated)
+
+    def step(self, sample: Sample) -> Tuple[int, int]:
+        """Adjust the limits by one sample, :returns (network, match)
+        """
+        self._requests += sample.requests
+        self._congested += sample.congested
+        if sample.latency is not None and sample.requests:
+            self._latency_count += sample.requests
+            self._latency_sum += sample.latency * sample.requests
+        if self._requests >= self.min_samples:
+            latency = self._latency_sum / self._latency_count if self._latency_count else None
+            congested = self._congested / self._requests > self.max_congestion
+            if latency is not None and self.base_latency is not None:
+                congested = congested or latency > self.base_latency * self.latency_factor
+            if congested:
+                self.network = max(1, self.network // 2)
+                self.slow_start = False
+            elif sample.network_saturated:
+                self.network = min(self.max_network, self.network * 2 if self.slow_start else self.network + 1)
+            if latency is not None:
+                # the baseline drifts up slowly, the targets of a batch change over time
+                self.base_latency = latency if self.base_latency is None else min(latency, self.base_latency * 1.05)
+            self._requests = self._congested = 0
+            self._latency_count, self._latency_sum = 0, 0.0
+        if sample.cpu >= self.cpu_saturation:
+            self.match = max(1, self.match - max(1, self.match // 4))
+        elif sample.match_saturated:
+            self.match = min(self.max_match, self.match + 1)
+        self.peak_network = max(self.peak_network, self.network)
+        return self.network, self.match
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            levels = self.levels
+            if self.step(self.sample()) != levels:
+                self._apply()
+                logger.debug("concurrency: network %d, match %d", self.network, self.match)
+
+    def start(self):
+        self._apply()
+        self._last = self._counters()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("adaptive concurrency: network %d (peak %d), match %d",
+                    self.network, self.peak_network, self.match)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,19 +1,33 @@
 # -*- coding: utf-8 -*-
 
+import contextlib
 import datetime
 import enum
+import hashlib
+import heapq
+import http.cookiejar
+import itertools
 import json
 import os
+import random
+import re
+import socket
+import sys
 import threading
-import urllib
-from typing import Dict, Generator, List, Optional
-
-import pymysql
-from bs4 import BeautifulSoup
-
+import time
+import urllib.parse
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import (Dict, Generator, List, Mapping, NamedTuple, Optional,
+                    Pattern, Tuple)
+
+from src import metrics
+from src.bytes_match import (ascii_compatible, bytes_pattern,
+                              normalize_charset, text_patterns)
 from src.log import logger
-from src.requst_patch import requests
-from src.utils import cached_property, ignore_long_char, iter_files, plain2md5
+from src.proxy_pool import is_proxy_error
+from src.utils import (cached_property, favicon_hash, host_of,
+                       ignore_long_char, plain2md5)
 
 
 @enum.unique
@@ -33,57 +47,244 @@ class ComponentType(enum.Enum):
         return [c.name for c in cls]
 
 
-class Component:
-    def __init__(self, info: Dict):
-        self._info = info
+SEARCH_LOCATIONS = ("body", "all", "headers", "title", "script", "cookies", "meta")
+# locations searched by key: `headers[key]`, `meta[key]`, `cookies[key]`
+KEYED_SEARCH_LOCATIONS = ("headers", "meta", "cookies")
+# response field searched by key for each keyed location
+KEYED_VIEWS = {"headers": "header_map", "meta": "meta", "cookies": "cookie_map"}
 
-    @cached_property
-    def type(self):
-        t = self._info.get("type", None)
-        if t is None:
-            return ComponentType.others.name
-        t = t.lower()
-        if not t in ComponentType.all_kinds():
-            return ComponentType.others.name
-        return t
 
-    @cached_property
-    def desc(self):
-        desc = self._info.get("desc")
-        if not desc:
-            desc = self._info.get("description")
-        return desc
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _names(value) -> Tuple[str, ...]:
+    """'implies'/'excludes' is a string or a list of string
+    """
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = [value]
+    return tuple(sys.intern(v) for v in value if isinstance(v, str))
+
+
+def _int_or_none(value) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_search(search) -> Tuple[str, Optional[str]]:
+    """Normalize a `search` location into (location, key)
+    """
+    if not isinstance(search, str):
+        return "body", None
+    for location in KEYED_SEARCH_LOCATIONS:
+        if search.startswith("%s[" % location) and search.endswith("]"):
+            return location, sys.intern(search[len(location) + 1:-1])
+    if search in SEARCH_LOCATIONS and search != "meta":
+        return sys.intern(search), None
+    return "body", None
+
+
+class Match(NamedTuple):
+    """A compiled rule of a component, immutable and safe to share between threads
+    """
+    search: str = "body"
+    search_key: Optional[str] = None
+    regexp: Optional[str] = None
+    pattern: Optional[Pattern] = None
+    text: Optional[str] = None
+    md5: Optional[str] = None
+    mmh3: Optional[int] = None
+    status: Optional[int] = None
+    version: Optional[str] = None
+    offset: Optional[int] = None
+    url: Optional[str] = None
+    # compiled for the raw bytes, None when the decoded text is needed
+    bpattern: Optional[Pattern] = None
+    # charset -> compiled `text` needle, None is any ascii compatible charset
+    btexts: Optional[Mapping[Optional[str], Pattern]] = None
+
+    @classmethod
+    def from_dict(cls, info: Dict) -> "Match":
+        if not isinstance(info, dict):
+            raise ValueError("match must be an object: %r" % (info,))
+        search, search_key = parse_search(info.get("search"))
+        regexp = info.get("regexp")
+        pattern = bpattern = None
+        if regexp is not None:
+            try:
+                pattern = re.compile(regexp, re.I)
+                bpattern = bytes_pattern(regexp)
+            except Exception as err:
+                logger.error("%s re compile error: %s", regexp, err)
+        text = info.get("text")
+        md5 = info.get("md5")
+        return cls(
+            search=search,
+            search_key=search_key,
+            regexp=regexp,
+            pattern=pattern,
+            text=text,
+            md5=md5.lower() if isinstance(md5, str) else md5,
+            mmh3=_int_or_none(info.get("mmh3")),
+            status=_int_or_none(info.get("status")),
+            version=_intern(info.get("version")),
+            offset=_int_or_none(info.get("offset")),
+            url=_intern(info.get("url")),
+            bpattern=bpattern,
+            btexts=text_patterns(text) if isinstance(text, str) else None,
+        )
+
+    @property
+    def checkable(self) -> bool:
+        """The match has something to check
+        """
+        return any(v is not None for v in (self.regexp, self.text, self.md5, self.mmh3, self.status))
+
+    @property
+    def is_probe(self) -> bool:
+        """The match only checks `md5`/`mmh3`/`status` of the url
+        """
+        return self.regexp is None and self.text is None and self.search_key is None
 
-    def __getattr__(self, name):
-        return self._info.get(name, None)
+    @property
+    def is_remote(self) -> bool:
+        """The match needs to request its own url
+        """
+        return self.url is not None and self.url != "/"
+
+    def to_dict(self) -> Dict:
+        info = OrderedDict()
+        if self.search_key is not None:
+            info["search"] = "%s[%s]" % (self.search, self.search_key)
+        elif self.search != "body":
+            info["search"] = self.search
+        for k in ("url", "regexp", "text", "md5", "mmh3", "status", "version", "offset"):
+            v = getattr(self, k)
+            if v is not None:
+                info[k] = v
+        return info
+
+
+class Component(NamedTuple):
+    """A component and its compiled matches, immutable and safe to share between threads
+    """
+    name: str
+    type: str = ComponentType.others.name
+    matches: Tuple[Match, ...] = ()
+    condition: Optional[str] = None
+    implies: Tuple[str, ...] = ()
+    excludes: Tuple[str, ...] = ()
+    desc: Optional[str] = None
+    author: Optional[str] = None
+    version: Optional[str] = None
+    website: Optional[str] = None
+    producer: Optional[str] = None
+    properties: Optional[Mapping] = None
 
     def __str__(self):
         return "[%s] %s: %s" % (self.type, self.name, ignore_long_char(self.desc, 50))
 
+    @classmethod
+    def from_dict(cls, info: Dict) -> "Component":
+        if not isinstance(info, dict):
+            raise ValueError("component must be an object")
+        name = info.get("name")
+        if not isinstance(name, str) or not name:
+            raise ValueError("component need 'name'")
+        matches = info.get("matches") or []
+        if not isinstance(matches, list):
+            raise ValueError("component 'matches' must be an array")
+        t = info.get("type", None)
+        t = t.lower() if isinstance(t, str) else None
+        if not t in ComponentType.all_kinds():
+            t = ComponentType.others.name
+        properties = info.get("properties")
+        return cls(
+            name=sys.intern(name),
+            type=sys.intern(t),
+            matches=tuple(Match.from_dict(m) for m in matches),
+            condition=info.get("condition") or None,
+            implies=_names(info.get("implies")),
+            excludes=_names(info.get("excludes")),
+            desc=info.get("desc") or info.get("description"),
+            author=info.get("author"),
+            version=info.get("version"),
+            website=info.get("website"),
+            producer=info.get("producer"),
+            properties=MappingProxyType(properties) if isinstance(
+                properties, dict) else None,
+        )
+
+    def to_dict(self) -> Dict:
+        """The component as a JSON object of `templates/templates.md`
+        """
+        info = OrderedDict()
+        info["name"] = self.name
+        info["type"] = self.type
+        for k in ("author", "version", "desc", "website", "producer", "condition"):
+            info[k] = getattr(self, k)
+        info["properties"] = None if self.properties is None else dict(
+            self.properties)
+        info["matches"] = [m.to_dict() for m in self.matches]
+        for k in ("implies", "excludes"):
+            v = getattr(self, k)
+            info[k] = list(v) if v else None
+        return info
+
     @classmethod
     def make(cls, path: str):
         """Make a instance of 'Component' from JSON file
         """
         try:
             with open(path, 'r', encoding="utf-8") as f:
-                return cls(json.load(f))
+                return cls.from_dict(json.load(f))
         except Exception as err:
             logger.error("'%s' make error: %s", cls.__name__, err)
         return None
 
 
 class ComponentGeneratorMixin:
+    # components loaded once by `load_components`, shared by long-running scanners
+    components = None
+    # threads reading and parsing the component files
+    load_workers = 8
+    # `LoadStats` of the last directory load
+    load_stats = None
+
+    def load_components(self, ignore_dirs=["tests"]) -> List[Component]:
+        """Load all components in the `self.directory` and keep them in memory,
+        `self.directory` may also be a bundle of `manage --pack`
+        """
+        if os.path.isfile(self.directory):
+            # the precomputed indexes of the bundle are loaded too
+            from src import bundle
+            return bundle.load(self, self.directory)
+        self.components = list(self.iter_components(ignore_dirs))
+        if self.load_stats is not None:
+            logger.info("loaded %s", self.load_stats)
+        return self.components
+
     def iter_components(self, ignore_dirs=["tests"], needpath=False) -> Generator[Component, None, None]:
         """Iterate out all components in the `self.directory`
         """
-        for root, filename in iter_files(self.directory, ignore_dirs):
-            if not filename.endswith('.json'):
-                continue
-            c_path = os.path.join(root, filename)
-            component = Component.make(c_path)
-            if component is None:
-                continue
-            logger.debug("iter_components: %s", component)
+        if self.components is not None and needpath is False:
+            yield from self.components
+            return
+        if os.path.isfile(self.directory):
+            from src.bundle import Bundle
+            with Bundle(self.directory) as b:
+                for component, path in zip(b.components, b.paths()):
+                    yield component if needpath is False else (component, "%s#%s" % (self.directory, path))
+            return
+        from src.loader import LoadStats, iter_directory
+        self.load_stats = LoadStats()
+        for component, c_path in iter_directory(self.directory, ignore_dirs, self.load_workers, self.load_stats):
             if needpath is False:
                 yield component
             else:
@@ -101,71 +302,507 @@ class ComposeURLMixin:
         return urllib.parse.urljoin(self.target, path)
 
 
+def make_session(pool_maxsize: int = 10) -> "requests.Session":
+    """Make a `requests.Session` with a connection pool of `pool_maxsize`,
+    it never keeps cookies between requests
+    """
+    from src.requst_patch import patched_requests
+    requests = patched_requests()
+    session = requests.Session()
+    session.cookies.set_policy(
+        http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_maxsize,
+                                            pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# charset of `<meta charset>`, `<meta http-equiv content="...; charset=">` and `<?xml encoding>`
+_META_CHARSET = re.compile(rb'''<meta[^>]*?charset\s*=\s*["']?\s*([\w.:-]+)''', re.I)
+_XML_ENCODING = re.compile(rb'''^\s*<\?xml[^>]*?encoding\s*=\s*["']([\w.:-]+)''', re.I)
+
+
+def declared_charset(headers: Mapping[str, str], content: bytes) -> Optional[str]:
+    """Charset of the headers, or of the first 4KB of the html when the headers
+    have none or the default 'ISO-8859-1', like the patched `requests`
+    """
+    from requests.utils import get_encoding_from_headers
+    encoding = get_encoding_from_headers(headers)
+    if encoding == "ISO-8859-1":
+        head = bytes(content[:4096])
+        m = _META_CHARSET.search(head) or _XML_ENCODING.search(head)
+        encoding = m.group(1).decode("ascii") if m else None
+    return normalize_charset(encoding)
+
+
+def decode_body(headers: Mapping[str, str], content: bytes, charset: Optional[str] = None) -> str:
+    """Decode the body with the declared charset, or the detected one,
+    the memory-mapped body is decoded in place
+    """
+    if charset is None:
+        charset = declared_charset(headers, content)
+    if charset is None:
+        from requests.compat import chardet
+        charset = chardet.detect(bytes(content))["encoding"] or "utf-8"
+    try:
+        return str(content, charset, errors="replace")
+    except LookupError:
+        return str(content, "utf-8", errors="replace")
+
+
+def _parse_html(resp: "LazyResponse"):
+    # heavy dependencies are imported on first parse
+    from bs4 import BeautifulSoup
+    script = []
+    meta = {}
+    p = BeautifulSoup(resp["body"], "html5lib")
+
+    for data in p.find_all("script"):
+        script_src = data.get("src")
+        if script_src:
+            script.append(script_src)
+
+    for data in p.find_all("meta"):
+        meta_name = data.get("name")
+        meta_content = data.get("content", "")
+        if meta_name:
+            meta[meta_name] = meta_content
+
+    title = p.find("title")
+    if title:
+        title = title.text
+    else:
+        title = ""
+    return {"script": script, "meta": meta, "title": title}
+
+
+def _raw_headers(resp: "LazyResponse") -> str:
+    return '\n'.join('{}: {}'.format(k, v) for k, v in resp["headers"].items())
+
+
+def _cookie_map(resp: "LazyResponse") -> Dict[str, str]:
+    """The first value of every cookie name, a `RequestsCookieJar` scans all its cookies
+    on every lookup and raises when a name is set for several domains or paths
+    """
+    cookies = resp["cookies"]
+    if isinstance(cookies, dict):
+        return cookies
+    values = {}
+    for cookie in cookies:
+        values.setdefault(cookie.name, cookie.value or "")
+    return values
+
+
+# key -> function of the response, :returns the value or a dict of values
+_LAZY_FIELDS = {
+    "charset": lambda r: declared_charset(r["headers"], r["content"]),
+    "body": lambda r: decode_body(r["headers"], r["content"], r["charset"]),
+    "script": _parse_html,
+    "meta": _parse_html,
+    "title": _parse_html,
+    "raw_headers": _raw_headers,
+    # views of `headers[key]` and `cookies[key]`, header names are lower case
+    "header_map": lambda r: {k.lower(): v for k, v in r["headers"].items()},
+    "cookie_map": _cookie_map,
+    "raw_cookies": lambda r: r["headers"].get("set-cookie", ""),
+    "raw_response": lambda r: r["raw_headers"] + r["body"],
+    "raw_response_bytes": lambda r: r["raw_headers"].encode("iso-8859-1", "replace") + r["content"],
+    "ascii_compatible": lambda r: ascii_compatible(r["charset"], r["content"]),
+}
+
+
+class LazyResponse(dict):
+    """Response dict whose decoded and parsed fields are computed on first access,
+    a response which is only matched on its bytes is never decoded
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+
+    def __missing__(self, key):
+        compute = _LAZY_FIELDS.get(key)
+        if compute is None:
+            raise KeyError(key)
+        with self._lock:
+            if not dict.__contains__(self, key):
+                value = compute(self)
+                if compute is _parse_html:
+                    self.update(value)
+                else:
+                    self[key] = value
+            return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def build_response(url: str, status: int, headers: Mapping[str, str],
+                   content: bytes, cookies: Mapping[str, str]) -> Dict:
+    """Build the response dict which matches are checked on
+    :param headers: case insensitive headers
+    """
+    return LazyResponse({
+        "url": url,
+        "headers": headers,
+        "status": status,
+        "cookies": cookies,
+        "content": content,
+        "md5": plain2md5(content),
+    })
+
+
+def header_items(resp) -> List[Tuple[str, str]]:
+    """Headers of a `requests.Response`, the repeated headers are kept
+    """
+    raw = getattr(resp.raw, "headers", None)
+    if hasattr(raw, "iteritems"):
+        return list(raw.iteritems())
+    return list(resp.headers.items())
+
+
+def abort_response(resp):
+    """Shut the connection of a streamed response down, a read blocked in another
+    thread returns at once
+    """
+    sock = getattr(getattr(resp.raw, "_connection", None), "sock", None)
+    if sock is None:
+        # the connection lets the socket go when the response will close it,
+        # the `http.client` response keeps it under its buffered reader
+        fp = getattr(getattr(resp.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class Watchdog:
+    """Calls the callbacks at their `time.monotonic()` deadlines from one daemon thread
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, at: float, callback) -> list:
+        """:returns the entry to `cancel`
+        """
+        entry = [at, next(self._seq), callback]
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            # not inherited by a forked process
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry
+
+    def cancel(self, entry: list):
+        with self._cond:
+            entry[2] = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                callback = heapq.heappop(self._heap)[2]
+            try:
+                callback()
+            except Exception as err:
+                logger.error("watchdog callback error: %s", err)
+
+
+# cuts the streamed bodies which outlive the deadline of their target
+WATCHDOG = Watchdog()
+
+
+class DeadlineExceeded(Exception):
+    """The deadline of the target is exceeded, the request is cancelled
+    """
+
+
 class RequestManagerMixin:
     """This is a thread safe request manager with its own history
     """
     request_manager_history = {}
+    probe_history = {}
     request_manager_lock = threading.Lock()
+    # shared `requests.Session`, keeps connections alive between requests
+    session = None
+    # `HostScheduler` of a multi-host scan, applies the per-host rate and backoff
+    politeness = None
+    # seconds, `timeout` is the read timeout, connect timeout defaults to it
+    timeout = 30
+    connect_timeout = None
+    # retries of connection errors, the delay is doubled each time with jitter
+    retries = 0
+    retry_backoff = 0.5
+    # `time.monotonic()` after which no request is sent
+    deadline = None
+    # seconds a failed url is not requested again by this manager
+    failure_ttl = 60.0
+    # `ResponseStore` which keeps the raw responses for the snapshots
+    recorder = None
+    # `ProxyPool` which picks the proxy of every request
+    proxy_pool = None
+
+    def _remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("deadline exceeded")
+        return remaining
+
+    def _timeout(self) -> Tuple[Optional[float], Optional[float]]:
+        """(connect, read) timeout, bounded by the deadline
+        """
+        read = self.timeout
+        connect = self.connect_timeout if self.connect_timeout is not None else read
+        remaining = self._remaining()
+        if remaining is not None:
+            read = remaining if read is None else min(read, remaining)
+            connect = remaining if connect is None else min(connect, remaining)
+        return connect, read
+
+    @contextlib.contextmanager
+    def _send(self, method: str, url: str, **kwargs):
+        """Send a request with the manager settings, connection errors are retried.
+        The response is closed and its proxy is released on exit
+        """
+        from src.requst_patch import patched_requests
+        requests = patched_requests()
+        connection_errors = (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+        requester = self.session or requests
+        pool = self.proxy_pool
+        host = host_of(url)
+        attempt = 0
+        while True:
+            timeout = self._timeout()
+            if self.politeness is not None:
+                self.politeness.wait(host)
+            proxy = None
+            if pool is not None:
+                proxy = pool.acquire(self._remaining())
+                if proxy is None:
+                    raise DeadlineExceeded("no proxy available before the deadline")
+            start = time.monotonic()
+            # from the connect, a request stuck before its headers is in flight too
+            metrics.IN_FLIGHT.inc()
+            try:
+                resp = requester.request(method, url, headers=self.headers,
+                                         timeout=timeout, allow_redirects=self.allow_redirect, verify=False,
+                                         proxies=proxy.proxies if proxy is not None else None, **kwargs)
+                break
+            except connection_errors as err:
+                metrics.IN_FLIGHT.dec()
+                if proxy is not None:
+                    # a dead target is not a dead proxy
+                    pool.release(proxy, False if is_proxy_error(err) else None)
+                if attempt >= self.retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                remaining = self._remaining()
+                if remaining is not None and remaining <= delay:
+                    raise
+                attempt += 1
+                metrics.RETRIES.inc()
+                logger.debug("retry %d '%s' in %.2fs: %s", attempt, url, delay, err)
+                time.sleep(delay)
+            except Exception:
+                metrics.IN_FLIGHT.dec()
+                if proxy is not None:
+                    pool.release(proxy, None)
+                raise
+        # None unless the body is read or the proxy fails
+        ok = None
+        try:
+            metrics.REQUESTS.inc(method=method, status=resp.status_code)
+            metrics.REQUEST_SECONDS.observe(time.monotonic() - start, method=method)
+            if self.politeness is not None:
+                self.politeness.report(host, resp.status_code, resp.headers)
+            yield resp
+            ok = True
+        except connection_errors as err:
+            if is_proxy_error(err):
+                ok = False
+            raise
+        finally:
+            metrics.IN_FLIGHT.dec()
+            resp.close()
+            if proxy is not None:
+                pool.release(proxy, ok, time.monotonic() - start)
+
+    def _iter_body(self, resp) -> Generator[bytes, None, None]:
+        """Chunks of a streamed body. A read blocks until its whole chunk arrives, so at the
+        deadline the `WATCHDOG` cuts the connection: a slow body can't outlive it
+        """
+        if self.deadline is None:
+            yield from resp.iter_content(chunk_size=65536)
+            return
+        expired = threading.Event()
+
+        def _expire():
+            expired.set()
+            abort_response(resp)
+        entry = WATCHDOG.schedule(self.deadline, _expire)
+        try:
+            for chunk in resp.iter_content(chunk_size=65536):
+                self._remaining()
+                yield chunk
+        except Exception:
+            if expired.is_set():
+                raise DeadlineExceeded("deadline exceeded while reading the body")
+            raise
+        finally:
+            WATCHDOG.cancel(entry)
+        # a body without length just ends when its connection is cut
+        if expired.is_set():
+            raise DeadlineExceeded("deadline exceeded while reading the body")
+
+    def _read(self, resp) -> bytes:
+        """Read a streamed body, a slow body can't outlive the deadline
+        """
+        content = b"".join(self._iter_body(resp))
+        metrics.RESPONSE_BYTES.inc(len(content))
+        return content
+
+    def _failed_recently(self, key: str) -> bool:
+        failures = self.__dict__.get("request_failures")
+        at = failures.get(key) if failures else None
+        return at is not None and time.monotonic() - at < self.failure_ttl
+
+    def _record_failure(self, key: str):
+        """Failures are kept by the instance, the history may be shared by the class
+        """
+        with self.request_manager_lock:
+            self.__dict__.setdefault("request_failures", {})[key] = time.monotonic()
 
     def request(self, url: str, **kwargs) -> Optional[Dict]:
         with self.request_manager_lock:
             r = self.request_manager_history.get(plain2md5(url), None)
         if not r is None:
+            metrics.CACHE.inc(cache="request", result="hit")
             return r
+        if self._failed_recently(plain2md5(url)):
+            metrics.CACHE.inc(cache="request", result="hit")
+            return None
+        metrics.CACHE.inc(cache="request", result="miss")
         try:
-            resp = requests.get(url, headers=self.headers,
-                                timeout=self.timeout, allow_redirects=self.allow_redirect, verify=False)
+            # streamed to skip the charset detection, the body is decoded on demand
+            with self._send("GET", url, stream=True) as resp:
+                content = self._read(resp)
+        except DeadlineExceeded:
+            logger.debug("request cancelled: %s" % url)
+            metrics.REQUEST_ERRORS.inc(kind="deadline")
+            return None
         except Exception as e:
             logger.error("request error: %s" % str(e))
+            metrics.REQUEST_ERRORS.inc(kind=type(e).__name__)
+            # the retries are spent, a dead host would be retried by every match
+            self._record_failure(plain2md5(url))
             return None
 
-        script = []
-        meta = {}
-        p = BeautifulSoup(resp.text, "html5lib")
-
-        for data in p.find_all("script"):
-            script_src = data.get("src")
-            if script_src:
-                script.append(script_src)
-
-        for data in p.find_all("meta"):
-            meta_name = data.get("name")
-            meta_content = data.get("content", "")
-            if meta_name:
-                meta[meta_name] = meta_content
-
-        title = p.find("title")
-        if title:
-            title = title.text
-        else:
-            title = ""
-
-        raw_headers = '\n'.join('{}: {}'.format(k, v)
-                                for k, v in resp.headers.items())
-        resp = {
-            "url": url,
-            "body": resp.text,
-            "headers": resp.headers,
-            "status": resp.status_code,
-            "script": script,
-            "meta": meta,
-            "title": title,
-            "cookies": resp.cookies,
-            "raw_cookies": resp.headers.get("set-cookie", ""),
-            "raw_response": raw_headers + resp.text,
-            "raw_headers": raw_headers,
-            "md5": plain2md5(resp.content),
-        }
+        if self.recorder is not None:
+            self.recorder.add(url, resp.status_code, header_items(resp), content)
+        resp = build_response(url, resp.status_code, resp.headers,
+                              content, resp.cookies)
         with self.request_manager_lock:
             self.request_manager_history[plain2md5(url)] = resp
         return resp
 
+    def probe(self, url: str, head: bool = False, mmh3: bool = False) -> Optional[Dict]:
+        """Lightweight request for `md5`, `mmh3` and `status` matches, the raw body is
+        hashed while streaming, it is never decoded nor parsed
+        :param head: use HEAD method, only the status is needed
+        :param mmh3: also compute the favicon mmh3 hash of the body
+        """
+        key = plain2md5(url)
+        with self.request_manager_lock:
+            r = None
+            if not mmh3:
+                r = self.request_manager_history.get(key, None)
+            if r is None:
+                r = self.probe_history.get((key, head), None)
+        if r is None and self._failed_recently(key):
+            metrics.CACHE.inc(cache="probe", result="hit")
+            return None
+        if not r is None and (not mmh3 or "mmh3" in r):
+            metrics.CACHE.inc(cache="probe", result="hit")
+            return r
+        metrics.CACHE.inc(cache="probe", result="miss")
+
+        md5 = None
+        keep = mmh3 or self.recorder is not None
+        try:
+            if head:
+                with self._send("HEAD", url) as resp:
+                    status = resp.status_code
+                    headers = header_items(resp)
+                # HEAD is not allowed, fallback to GET
+                if status in (405, 501):
+                    return self.probe(url, mmh3=mmh3)
+                if self.recorder is not None:
+                    self.recorder.add(url, status, headers, None)
+            else:
+                with self._send("GET", url, stream=True) as resp:
+                    status = resp.status_code
+                    h = hashlib.md5()
+                    chunks = []
+                    size = 0
+                    for chunk in self._iter_body(resp):
+                        h.update(chunk)
+                        size += len(chunk)
+                        if keep:
+                            chunks.append(chunk)
+                    md5 = h.hexdigest()
+                    metrics.RESPONSE_BYTES.inc(size)
+                    if self.recorder is not None:
+                        self.recorder.add(url, status, header_items(resp), b"".join(chunks))
+        except DeadlineExceeded:
+            logger.debug("probe cancelled: %s" % url)
+            metrics.REQUEST_ERRORS.inc(kind="deadline")
+            return None
+        except Exception as e:
+            logger.error("probe error: %s" % str(e))
+            metrics.REQUEST_ERRORS.inc(kind=type(e).__name__)
+            return None
+
+        r = {
+            "url": url,
+            "status": status,
+            "md5": md5,
+        }
+        if mmh3 and not head:
+            r["mmh3"] = favicon_hash(b"".join(chunks))
+        with self.request_manager_lock:
+            self.probe_history[(key, head)] = r
+        return r
+
 
 class RemoteComponentMixin:
     def init_database(self, db,
                       user, password,
                       host="127.0.0.1", port=3306,
                       charset='utf8mb4'):
+        import pymysql
         self._cnx = pymysql.connect(host=host,
                                     port=port,
                                     user=user,
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from src import metrics
+from src.core import Component, Match
+
+# headers whose values change between requests or hosts serving the same page,
+# only their names are part of the fingerprint
+VOLATILE_HEADERS = frozenset((
+    "date", "expires", "age", "last-modified", "set-cookie",
+    "x-request-id", "x-amz-request-id", "x-amz-cf-id", "x-amzn-requestid", "x-amzn-trace-id",
+    "cf-ray", "x-runtime", "x-timer", "x-served-by", "x-cache-hits",
+    "server-timing", "report-to", "nel", "traceparent", "x-trace-id", "x-correlation-id",
+))
+
+
+def response_fingerprint(resp: Dict) -> str:
+    """Content address of a response: status, body md5, header names, the values
+    of the non-volatile headers and the cookie names
+    """
+    h = hashlib.sha1()
+    h.update(("%s\n%s\n" % (resp["status"], resp["md5"])).encode("utf-8"))
+    for k, v in sorted(resp["header_map"].items()):
+        if k in VOLATILE_HEADERS:
+            v = ""
+        h.update(("%s: %s\n" % (k, v)).encode("utf-8", "surrogateescape"))
+    cookies = resp["cookie_map"]
+    if cookies:
+        h.update(("cookies: %s\n" % ",".join(sorted(cookies.keys()))).encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
+def _reads_volatile(match: Match) -> bool:
+    """The match may read values which are not in the fingerprint: the cookies, a volatile
+    header, or any header through the raw headers
+    """
+    if match.search in ("cookies", "all"):
+        return True
+    if match.search == "headers":
+        return match.search_key is None or match.search_key.lower() in VOLATILE_HEADERS
+    return False
+
+
+def is_passive(component: Component) -> bool:
+    """The component is only checked on the target response and reads nothing left out of
+    the fingerprint, its result is the same for every target with the same fingerprint
+    """
+    return all(not m.is_remote and m.mmh3 is None and not _reads_volatile(m) for m in component.matches)
+
+
+class ResultCache:
+    """Passive hits by response fingerprint, the least recently used entries are evicted
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint: str) -> Optional[List]:
+        with self._lock:
+            hits = self._entries.get(fingerprint)
+            if hits is not None:
+                self._entries.move_to_end(fingerprint)
+        metrics.CACHE.inc(cache="passive", result="miss" if hits is None else "hit")
+        return hits
+
+    def put(self, fingerprint: str, hits: List):
+        with self._lock:
+            self._entries[fingerprint] = hits
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
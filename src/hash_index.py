@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.core import Component, Match
+
+HASH_KEYS = ("md5", "mmh3")
+
+
+class HashIndex:
+    """Index of the `md5`/`mmh3` matches of all components:
+        path -> hash type -> digest -> [(component, match)]
+
+    Every distinct path is fetched once and its digest is looked up in the index,
+    instead of testing the hash matches of each component one at a time.
+    """
+
+    def __init__(self):
+        self.paths = {}
+        # id of the components resolved entirely by the index,
+        # no need to check their matches again
+        self.components = set()
+
+    @staticmethod
+    def is_hash_match(match: Match) -> bool:
+        """The match only checks the `md5`/`mmh3` of its url
+        """
+        return (match.is_probe and match.status is None and match.offset is None
+                and (match.md5 is not None or match.mmh3 is not None))
+
+    @classmethod
+    def build(cls, components: Iterable[Component]) -> "HashIndex":
+        index = cls()
+        for component in components:
+            if not component.matches:
+                continue
+            hash_matches = [m for m in component.matches if cls.is_hash_match(m)]
+            if not hash_matches:
+                continue
+            for match in hash_matches:
+                path = match.url or "/"
+                for k in HASH_KEYS:
+                    digest = cls.normalize(k, getattr(match, k))
+                    if digest is None:
+                        continue
+                    index.paths.setdefault(path, {}).setdefault(k, {}) \
+                        .setdefault(digest, []).append((component, match))
+            # default 'or' condition, all matches are hash matches
+            if not component.condition and len(hash_matches) == len(component.matches):
+                index.components.add(id(component))
+        return index
+
+    @staticmethod
+    def normalize(hash_type: str, digest) -> Optional[str]:
+        if hash_type == "mmh3":
+            try:
+                return str(int(digest))
+            except (TypeError, ValueError):
+                return None
+        if not isinstance(digest, str):
+            return None
+        return digest.lower()
+
+    def resolves(self, component: Component) -> bool:
+        return id(component) in self.components
+
+    def needs(self, path: str, hash_type: str) -> bool:
+        return hash_type in self.paths.get(path, {})
+
+    def lookup(self, path: str, digests: Dict) -> List[Tuple[Component, Match]]:
+        """Look up the fetched `digests` {hash type: digest} of `path`
+        """
+        hits = []
+        by_type = self.paths.get(path, {})
+        for k, digest in digests.items():
+            if digest is None or k not in by_type:
+                continue
+            hits.extend(by_type[k].get(self.normalize(k, digest), []))
+        return hits
+
+    def __len__(self):
+        return sum(len(d) for p in self.paths.values() for d in p.values())
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from src.log import logger
+
+
+class ScanJournal:
+    """Append-only JSON lines checkpoint of a batch scan, one finished target per line:
+        {"target": "...", "results": [...]}
+
+    A target is written only when it is finished, the targets in progress when the scan
+    is interrupted are not in the journal and are scanned again on restart.
+    Entries may carry more fields, the last entry of a target wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = self.load()
+
+    def load(self) -> Dict[str, Dict]:
+        done = OrderedDict()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    if not isinstance(entry.get("results"), list):
+                        raise ValueError("no results")
+                    done[entry["target"]] = entry
+                except (ValueError, KeyError, TypeError, AttributeError) as err:
+                    # the last line is cut when the scan is killed while writing
+                    logger.warning("journal '%s' line %d is broken: %s", self.path, lineno, err)
+        return done
+
+    def get(self, target: str) -> Optional[List[Dict]]:
+        entry = self._done.get(target)
+        return entry["results"] if entry is not None else None
+
+    def entry(self, target: str) -> Optional[Dict]:
+        return self._done.get(target)
+
+    def targets(self) -> List[str]:
+        return list(self._done)
+
+    def __contains__(self, target: str) -> bool:
+        return target in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def record(self, target: str, results: List[Dict], **fields):
+        entry = dict(fields, target=target, results=results)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                # a broken line is ended before appending
+                if f.tell() and not self._ends_with_newline():
+                    f.write("\n")
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._done[target] = entry
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
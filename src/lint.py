@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.condition import Condition, ParseException
+from src.core import (KEYED_SEARCH_LOCATIONS, SEARCH_LOCATIONS, Component,
+                      ComponentType)
+from src.prefilter import LiteralIndex
+from src.utils import iter_files
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+ERROR = "error"
+WARNING = "warning"
+
+# fields of `templates/templates.md`
+COMPONENT_FIELDS = {
+    "name": str, "type": str, "author": str, "version": str, "desc": str, "description": str,
+    "website": str, "producer": str, "properties": dict, "matches": list, "condition": str,
+    "implies": (str, list), "excludes": (str, list),
+}
+REQUIRED_FIELDS = ("name", "type", "matches")
+MATCH_FIELDS = {
+    "search": str, "regexp": str, "text": str, "version": str, "offset": int,
+    "md5": str, "mmh3": int, "url": str, "status": int,
+}
+# the locations of the engine, a bare `meta` is searched as `body` like `parse_search`
+SEARCHES = tuple(s for s in SEARCH_LOCATIONS if s != "meta")
+KEYED_SEARCHES = KEYED_SEARCH_LOCATIONS
+
+# relative cost of the search locations, `all` is the whole raw response
+SEARCH_COSTS = {"all": 4, "body": 3, "script": 2}
+# an aggressive url is one more request on every target
+REQUEST_COST = 50
+# components which can't be prefiltered by a literal are checked on every target
+PREFILTERED_FACTOR = 0.2
+
+_REPEATS = tuple(getattr(sre_parse, name) for name in
+                 ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(sre_parse, name))
+_MD5 = re.compile(r"^[0-9a-fA-F]{32}$")
+
+
+class Issue(NamedTuple):
+    level: str
+    path: str
+    name: Optional[str]
+    message: str
+
+
+class RuleCost(NamedTuple):
+    path: str
+    name: str
+    score: float
+    # aggressive urls requested on every target
+    urls: Tuple[str, ...]
+    reasons: Tuple[str, ...]
+
+
+def _is_type(value, types) -> bool:
+    if isinstance(value, bool):
+        return types is bool
+    return isinstance(value, types)
+
+
+def _nested_repeat(parsed, inside: bool = False) -> bool:
+    """A repeat inside an unbounded repeat, like `(a+)+`, may backtrack exponentially
+    """
+    for op, av in parsed:
+        if op in _REPEATS:
+            unbounded = av[1] is sre_parse.MAXREPEAT or av[1] > 1
+            if inside and unbounded:
+                return True
+            if _nested_repeat(av[2], inside or av[1] is sre_parse.MAXREPEAT):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            if _nested_repeat(av[-1], inside):
+                return True
+        elif op is sre_parse.BRANCH:
+            if any(_nested_repeat(b, inside) for b in av[1]):
+                return True
+    return False
+
+
+def _leading_wildcard(parsed) -> bool:
+    """`.*foo` is tried from every position of the searched text
+    """
+    items = list(parsed)
+    if not items:
+        return False
+    op, av = items[0]
+    return op in _REPEATS and av[0] == 0 and len(av[2]) == 1 and av[2][0][0] is sre_parse.ANY
+
+
+def regexp_problems(regexp: str) -> List[str]:
+    try:
+        parsed = sre_parse.parse(regexp, re.I)
+    except Exception:
+        return []
+    problems = []
+    if _nested_repeat(parsed):
+        problems.append("nested repeats may backtrack")
+    if _leading_wildcard(parsed):
+        problems.append("leading wildcard")
+    return problems
+
+
+class RuleLinter:
+    """Validates the components against `templates/templates.md` and estimates their cost
+    """
+
+    def __init__(self):
+        self.issues: List[Issue] = []
+        self.costs: List[RuleCost] = []
+        # name -> paths
+        self._names: Dict[str, List[str]] = {}
+        # (path, name, implies, excludes)
+        self._refs = []
+        self.files = 0
+
+    def _issue(self, level: str, path: str, name: Optional[str], message: str, *args):
+        self.issues.append(Issue(level, path, name, message % args if args else message))
+
+    @property
+    def errors(self) -> List[Issue]:
+        return [i for i in self.issues if i.level == ERROR]
+
+    def lint_file(self, path: str):
+        self.files += 1
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError) as err:
+            self._issue(ERROR, path, None, "invalid JSON: %s", err)
+            return
+        self.lint_dict(info, path)
+
+    def lint_dict(self, info, path: str = "") -> Optional[Component]:
+        if not isinstance(info, dict):
+            self._issue(ERROR, path, None, "component must be an object")
+            return None
+        name = info.get("name")
+        name = name if isinstance(name, str) else None
+        for field in REQUIRED_FIELDS:
+            if info.get(field) in (None, "", []):
+                # a missing type is loaded as 'others'
+                self._issue(WARNING if field == "type" else ERROR, path, name,
+                            "missing required field '%s'", field)
+        for field, value in info.items():
+            types = COMPONENT_FIELDS.get(field)
+            if types is None:
+                self._issue(WARNING, path, name, "unknown field '%s'", field)
+            elif value is not None and not _is_type(value, types):
+                self._issue(ERROR, path, name, "field '%s' must be %s", field, _type_names(types))
+        t = info.get("type")
+        if isinstance(t, str) and t.lower() not in ComponentType.all_kinds():
+            self._issue(WARNING, path, name, "unknown type '%s' is treated as 'others'", t)
+        for field in ("implies", "excludes"):
+            if isinstance(info.get(field), list) and not all(isinstance(v, str) for v in info[field]):
+                self._issue(ERROR, path, name, "field '%s' must be a string or an array of strings", field)
+        matches = info.get("matches")
+        if isinstance(matches, list):
+            for index, match in enumerate(matches):
+                self._lint_match(match, index, path, name)
+        try:
+            component = Component.from_dict(info)
+        except Exception as err:
+            if name is not None:
+                self._issue(ERROR, path, name, "component can't be loaded: %s", err)
+            return None
+        self._lint_condition(component, path)
+        self._names.setdefault(component.name, []).append(path)
+        self._refs.append((path, component.name, component.implies, component.excludes))
+        self.costs.append(self.estimate(component, path))
+        return component
+
+    def _lint_match(self, info, index: int, path: str, name: Optional[str]):
+        where = "match %d" % index
+        if not isinstance(info, dict):
+            self._issue(ERROR, path, name, "%s must be an object", where)
+            return
+        for field, value in info.items():
+            types = MATCH_FIELDS.get(field)
+            if types is None:
+                self._issue(WARNING, path, name, "%s: unknown field '%s'", where, field)
+            elif value is None:
+                continue
+            elif types is int and isinstance(value, str) and re.match(r"^-?\d+$", value):
+                self._issue(WARNING, path, name, "%s: '%s' should be an integer", where, field)
+            elif not _is_type(value, types):
+                self._issue(ERROR, path, name, "%s: '%s' must be %s", where, field, _type_names(types))
+        search = info.get("search")
+        if isinstance(search, str) and search not in SEARCHES and not any(
+                search.startswith("%s[" % k) and search.endswith("]") and len(search) > len(k) + 2
+                for k in KEYED_SEARCHES):
+            self._issue(ERROR, path, name, "%s: unknown search '%s', it is searched as 'body'", where, search)
+        regexp = info.get("regexp")
+        groups = None
+        if isinstance(regexp, str):
+            try:
+                groups = re.compile(regexp, re.I).groups
+            except re.error as err:
+                self._issue(ERROR, path, name, "%s: regexp '%s' can't be compiled: %s", where, regexp, err)
+            else:
+                for problem in regexp_problems(regexp):
+                    self._issue(WARNING, path, name, "%s: regexp '%s' %s", where, regexp, problem)
+        offset = info.get("offset")
+        if offset is not None:
+            if regexp is None:
+                self._issue(WARNING, path, name, "%s: 'offset' without 'regexp' is ignored", where)
+            elif isinstance(offset, int) and groups and not 0 <= offset < groups:
+                self._issue(WARNING, path, name, "%s: 'offset' %d is out of the %d groups of the regexp",
+                            where, offset, groups)
+        md5 = info.get("md5")
+        if isinstance(md5, str) and not _MD5.match(md5):
+            self._issue(ERROR, path, name, "%s: 'md5' is not a md5 hex digest", where)
+        url = info.get("url")
+        if isinstance(url, str) and not url.startswith(("/", "http://", "https://")):
+            self._issue(WARNING, path, name, "%s: 'url' should start with '/'", where)
+        if all(info.get(k) is None for k in ("regexp", "text", "md5", "mmh3", "status")):
+            self._issue(ERROR, path, name, "%s has nothing to check, it is never true", where)
+
+    def _lint_condition(self, component: Component, path: str):
+        if not component.condition:
+            return
+        symbols = {str(i): True for i in range(len(component.matches))}
+        try:
+            Condition().parse(component.condition, symbols)
+        except ParseException as err:
+            message = err.args[0] % err.args[1:] if len(err.args) > 1 else str(err)
+            self._issue(ERROR, path, component.name, "condition '%s' is invalid: %s",
+                        component.condition, message)
+            return
+        used = set(re.findall(r"[a-z0-9_]+", component.condition.lower())) - {"and", "or", "not"}
+        unused = [i for i in symbols if i not in used]
+        if unused:
+            self._issue(WARNING, path, component.name, "matches %s are not used by the condition",
+                        ", ".join(unused))
+
+    def estimate(self, component: Component, path: str = "") -> RuleCost:
+        """Relative cost of checking the component on one target
+        """
+        urls = tuple(dict.fromkeys(m.url for m in component.matches if m.is_remote))
+        reasons = []
+        if urls:
+            reasons.append("%d aggressive urls" % len(urls))
+        cost = 0.0
+        for match in component.matches:
+            weight = SEARCH_COSTS.get(match.search, 1) if match.search_key is None else 1
+            if match.regexp is not None:
+                weight *= 2
+                problems = regexp_problems(match.regexp)
+                if problems:
+                    weight *= 5
+                    reasons.extend(problems)
+                if match.search in ("body", "all") and match.search_key is None and match.bpattern is None:
+                    reasons.append("regexp on the decoded text")
+            if match.search == "all" and match.search_key is None and (match.regexp or match.text):
+                reasons.append("searches the raw response")
+            cost += weight
+        prefiltered = all(m.is_remote or LiteralIndex.match_literal(m) is not None for m in component.matches) \
+            and not (component.condition and "not" in component.condition.lower())
+        if not prefiltered:
+            reasons.append("no literal to prefilter")
+        else:
+            cost *= PREFILTERED_FACTOR
+        cost += REQUEST_COST * len(urls)
+        return RuleCost(path, component.name, round(cost, 1), urls, tuple(dict.fromkeys(reasons)))
+
+    def finish(self):
+        """Checks across the components
+        """
+        for name, paths in self._names.items():
+            if len(paths) > 1:
+                for path in paths[1:]:
+                    self._issue(WARNING, path, name, "duplicate name, also in '%s'", paths[0])
+        for path, name, implies, excludes in self._refs:
+            for field, refs in (("implies", implies), ("excludes", excludes)):
+                for ref in refs:
+                    if ref == name:
+                        self._issue(WARNING, path, name, "'%s' refers to itself", field)
+                    elif ref not in self._names:
+                        self._issue(WARNING, path, name, "'%s' refers to unknown component '%s'", field, ref)
+        return self
+
+    @property
+    def urls(self) -> set:
+        """Aggressive urls of all the components, each is requested once per target
+        """
+        return {url for c in self.costs for url in c.urls}
+
+    def top_costs(self, n: int = 20) -> List[RuleCost]:
+        return sorted(self.costs, key=lambda c: c.score, reverse=True)[:n]
+
+
+def _type_names(types) -> str:
+    if not isinstance(types, tuple):
+        types = (types,)
+    names = {str: "a string", int: "an integer", dict: "an object", list: "an array"}
+    return " or ".join(names[t] for t in types)
+
+
+def lint_directory(directory: str, ignore_dirs=["tests"]) -> RuleLinter:
+    linter = RuleLinter()
+    for root, filename in iter_files(directory, ignore_dirs):
+        if filename.endswith(".json"):
+            linter.lint_file(os.path.join(root, filename))
+    return linter.finish()
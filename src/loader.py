@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, List, Optional, Tuple
+
+from src import metrics
+from src.core import Component
+from src.log import logger
+
+try:
+    # optional, a faster parser
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_PARSER = "orjson" if orjson is not None else "json"
+# files loaded by one task
+CHUNK_SIZE = 16
+
+
+def loads(data: bytes):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # `json` also accepts NaN and Infinity, and explains the errors better
+            pass
+    return json.loads(data.decode("utf-8"))
+
+
+class LoadStats:
+    def __init__(self):
+        self.files = 0
+        self.loaded = 0
+        # (path, error)
+        self.failed: List[Tuple[str, str]] = []
+        self.seconds = 0.0
+        self.parser = JSON_PARSER
+
+    def __str__(self):
+        return "%d components of %d files in %.3fs (%s), %d failed" % (
+            self.loaded, self.files, self.seconds, self.parser, len(self.failed))
+
+
+def list_files(directory: str, ignore_dirs=["tests"], suffix: str = ".json") -> List[str]:
+    """Paths of the `suffix` files under `directory`, sorted so the components always
+    have the same order, like `os.walk` the `ignore_dirs` are skipped at any depth
+    and the links to directories are not followed
+    """
+    paths, dirs = [], [directory]
+    while dirs:
+        try:
+            with os.scandir(dirs.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in ignore_dirs:
+                            dirs.append(entry.path)
+                    elif entry.name.endswith(suffix) and entry.is_file():
+                        paths.append(entry.path)
+        except OSError as err:
+            logger.warning("can't list '%s': %s", err.filename, err.strerror)
+    paths.sort()
+    return paths
+
+
+def load_file(path: str) -> Tuple[Optional[Component], Optional[str]]:
+    """:returns (component, None), or (None, error)
+    """
+    try:
+        with open(path, "rb") as f:
+            return Component.from_dict(loads(f.read())), None
+    except Exception as err:
+        return None, str(err) or type(err).__name__
+
+
+def _load_chunk(paths: List[str]) -> List[Tuple[Optional[Component], Optional[str]]]:
+    return [load_file(path) for path in paths]
+
+
+def iter_directory(directory: str, ignore_dirs=["tests"], max_workers: int = 8,
+                   stats: Optional[LoadStats] = None) -> Generator[Tuple[Component, str], None, None]:
+    """Read and parse the component files in `max_workers` threads, a slow file system
+    is read in parallel. The components are yielded in the `list_files` order as soon as
+    their chunk of `CHUNK_SIZE` files is ready, at most 4 chunks per thread are loaded ahead
+    """
+    stats = stats if stats is not None else LoadStats()
+    start = time.monotonic()
+    paths = list_files(directory, ignore_dirs)
+    stats.files = len(paths)
+    max_workers = max(1, max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunks = (paths[i:i + CHUNK_SIZE] for i in range(0, len(paths), CHUNK_SIZE))
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(_load_chunk, chunk)))
+                if len(pending) >= 4 * max_workers:
+                    break
+            while pending:
+                chunk, future = pending.popleft()
+                following = next(chunks, None)
+                if following is not None:
+                    pending.append((following, executor.submit(_load_chunk, following)))
+                for path, (component, error) in zip(chunk, future.result()):
+                    if component is None:
+                        stats.failed.append((path, error))
+                        logger.error("'%s' make error: %s", path, error)
+                        continue
+                    stats.loaded += 1
+                    yield component, path
+    finally:
+        stats.seconds = time.monotonic() - start
+        metrics.STAGE_SECONDS.observe(stats.seconds, stage="load")
+        logger.debug("load '%s': %s", directory, stats)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.log import logger
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    items = ['%s="%s"' % (n, _escape(str(v))) for n, v in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return "{%s}" % ",".join(items) if items else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def _select(self, labels: Dict) -> List:
+        """Values of the series having the labels, every series when none is given
+        """
+        wanted = [(i, str(labels[n])) for i, n in enumerate(self.labels) if n in labels]
+        return [v for k, v in self._values.items() if all(k[i] == l for i, l in wanted)]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.kind)]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append("%s%s %s" % (self.name, _labels_text(self.labels, key), _number(value)))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Sum of the series having the labels
+        """
+        with self._lock:
+            return sum(self._select(labels))
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # bucket counts, sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def count(self, **labels) -> Tuple[int, float]:
+        """:returns (count, sum) of the series having the labels
+        """
+        with self._lock:
+            states = self._select(labels)
+            return sum(s[2] for s in states), sum(s[1] for s in states)
+
+    def render(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.kind)]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts + [count - sum(counts)]):
+                cumulative += n
+                lines.append("%s_bucket%s %d" % (self.name, _labels_text(self.labels, key, 'le="%s"' % _number(bound)),
+                                                 cumulative))
+            lines.append("%s_sum%s %s" % (self.name, _labels_text(self.labels, key), _number(total)))
+            lines.append("%s_count%s %d" % (self.name, _labels_text(self.labels, key), count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format
+        """
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+    def reset(self):
+        for m in self.metrics:
+            m.reset()
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("webhunt_requests_total", "HTTP responses received", ("method", "status"))
+REQUEST_ERRORS = REGISTRY.counter("webhunt_request_errors_total", "Requests failed after the retries", ("kind",))
+RETRIES = REGISTRY.counter("webhunt_request_retries_total", "Retried connection errors")
+RESPONSE_BYTES = REGISTRY.counter("webhunt_response_bytes_total", "Response body bytes read")
+REQUEST_SECONDS = REGISTRY.histogram("webhunt_request_seconds", "Seconds until the response headers", ("method",))
+IN_FLIGHT = REGISTRY.gauge("webhunt_requests_in_flight", "Requests being sent or read")
+CACHE = REGISTRY.counter("webhunt_cache_total", "Response cache lookups", ("cache", "result"))
+MATCH_EVALUATIONS = REGISTRY.counter("webhunt_match_evaluations_total", "Matches evaluated")
+HITS = REGISTRY.counter("webhunt_hits_total", "Components found")
+QUEUED_TASKS = REGISTRY.gauge("webhunt_queued_tasks", "Check tasks waiting for a worker thread")
+STAGE_SECONDS = REGISTRY.histogram("webhunt_stage_seconds", "Seconds of the scan stages", ("stage",))
+TARGETS = REGISTRY.counter("webhunt_targets_total", "Targets started and finished", ("state",))
+CONCURRENCY = REGISTRY.gauge("webhunt_concurrency_limit", "Running tasks allowed by the adaptive concurrency", ("kind",))
+
+
+def stats() -> Dict:
+    """Summary of the metrics for the stats lines and the progress bar
+    """
+    hits, misses = CACHE.value(result="hit"), CACHE.value(result="miss")
+    checks, check_seconds = STAGE_SECONDS.count(stage="check")
+    return {
+        "targets_started": TARGETS.value(state="started"),
+        "targets_finished": TARGETS.value(state="finished"),
+        "requests": REQUESTS.value(),
+        "errors": REQUEST_ERRORS.value(),
+        "retries": RETRIES.value(),
+        "bytes": RESPONSE_BYTES.value(),
+        "in_flight": IN_FLIGHT.value(),
+        "queued_tasks": QUEUED_TASKS.value(),
+        "component_checks": checks,
+        "match_evaluations": MATCH_EVALUATIONS.value(),
+        "hits": HITS.value(),
+        "cache_hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+        "check_seconds_avg": round(check_seconds / checks, 4) if checks else None,
+        "network_limit": CONCURRENCY.value(kind="network") or None,
+        "match_limit": CONCURRENCY.value(kind="match") or None,
+    }
+
+
+def serve_metrics(host: str, port: int, registry: Registry = REGISTRY):
+    """Serve `GET /metrics` in a daemon thread, :returns the `ThreadingHTTPServer`
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+class StatsReporter:
+    """Writes a JSON stats line every `interval` seconds and/or redraws a progress bar,
+    to stderr so the results on stdout are not mixed
+    """
+
+    def __init__(self, interval: float = 0, progress: bool = False, total: Optional[int] = None, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        # the bar needs a terminal
+        self.progress = progress and self.stream.isatty()
+        self.total = total
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+        self._last = (0.0, 0)
+
+    def line(self) -> str:
+        now = time.monotonic()
+        s = stats()
+        last_time, last_requests = self._last
+        s["elapsed"] = round(now - self._start, 1)
+        s["req_per_sec"] = round((s["requests"] - last_requests) / max(now - last_time, 1e-6), 1)
+        self._last = (now, s["requests"])
+        return json.dumps(s)
+
+    def bar(self, width: int = 30) -> str:
+        s = stats()
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        done = int(s["targets_finished"])
+        if self.total:
+            filled = int(width * min(done, self.total) / self.total)
+            head = "[%s%s] %d/%d" % ("#" * filled, "." * (width - filled), done, self.total)
+        else:
+            head = "%d targets" % done
+        return "\r%s  %.1f req/s  %d in flight  %d queued  %d errors " % (
+            head, s["requests"] / elapsed, s["in_flight"], s["queued_tasks"], s["errors"])
+
+    def _run(self):
+        next_line = time.monotonic() + self.interval
+        while not self._stop.wait(0.5 if self.progress else self.interval):
+            if self.progress:
+                self.stream.write(self.bar())
+                self.stream.flush()
+            if self.interval and time.monotonic() >= next_line:
+                next_line += self.interval
+                self.stream.write(("\n" if self.progress else "") + self.line() + "\n")
+                self.stream.flush()
+
+    def start(self):
+        if not self.interval and not self.progress:
+            return self
+        self._start = time.monotonic()
+        self._last = (self._start, 0)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        if self.progress:
+            self.stream.write(self.bar() + "\n")
+        if self.interval:
+            self.stream.write(self.line() + "\n")
+        self.stream.flush()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+import base64
+import datetime
+import gzip
+import http
+import json
+import os
+import urllib.parse
+import zlib
+from collections import OrderedDict
+from http.cookies import CookieError, SimpleCookie
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.component_sniffer import ComponentSniffer
+from src.core import build_response
+from src.log import logger
+from src.utils import favicon_hash, host_of, plain2md5
+
+# status, headers, body, the body is None when only the headers are captured
+RawResponse = Tuple[int, List[Tuple[str, str]], Optional[bytes]]
+# headers which describe the wire format, the saved body is already decoded
+_WIRE_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+
+
+def normalize_url(url: str) -> str:
+    """Captured responses are looked up by the normalized url
+    """
+    url, _ = urllib.parse.urldefrag(url.strip())
+    parsed = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit((parsed.scheme.lower(), parsed.netloc.lower(),
+                                    parsed.path or "/", parsed.query, ""))
+
+
+def dechunk(body: bytes) -> bytes:
+    """Decode `Transfer-Encoding: chunked` body, a truncated body is kept as far as it goes
+    """
+    out, pos = [], 0
+    while pos < len(body):
+        end = body.find(b"\n", pos)
+        if end < 0:
+            break
+        size = body[pos:end].split(b";", 1)[0].strip()
+        try:
+            size = int(size, 16)
+        except ValueError:
+            break
+        if size == 0:
+            break
+        pos = end + 1
+        out.append(body[pos:pos + size])
+        pos += size
+        # chunk ends with CRLF
+        if body[pos:pos + 2] == b"\r\n":
+            pos += 2
+        elif body[pos:pos + 1] == b"\n":
+            pos += 1
+    return b"".join(out)
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    encoding = encoding.strip().lower()
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            return gzip.decompress(body)
+        if encoding == "deflate":
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                # raw deflate without zlib header
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+    except (OSError, EOFError, zlib.error) as err:
+        logger.debug("decompress %s error: %s", encoding, err)
+    return body
+
+
+def parse_http_response(raw: bytes) -> Optional[RawResponse]:
+    """Parse a raw HTTP/1.x response: status line, headers and body,
+    the chunked transfer encoding and gzip/deflate content encoding are decoded
+    """
+    while True:
+        head, sep, body = raw.partition(b"\r\n\r\n")
+        if not sep:
+            head, sep, body = raw.partition(b"\n\n")
+        lines = head.decode("iso-8859-1").splitlines()
+        if not lines or not lines[0].startswith("HTTP/"):
+            return None
+        try:
+            status = int(lines[0].split(None, 2)[1])
+        except (IndexError, ValueError):
+            return None
+        # skip the interim responses, e.g. '100 Continue'
+        if 100 <= status < 200 and body.startswith(b"HTTP/"):
+            raw = body
+            continue
+        break
+    headers = []
+    for line in lines[1:]:
+        if ":" not in line:
+            continue
+        k, v = line.split(":", 1)
+        headers.append((k.strip(), v.strip()))
+    names = {k.lower(): v for k, v in headers}
+    if "chunked" in names.get("transfer-encoding", "").lower():
+        body = dechunk(body)
+    for encoding in reversed(names.get("content-encoding", "").split(",")):
+        if encoding.strip():
+            body = decompress(body, encoding)
+    return status, headers, body
+
+
+def parse_cookies(set_cookies: List[str]) -> Dict[str, str]:
+    cookies = {}
+    for value in set_cookies:
+        jar = SimpleCookie()
+        try:
+            jar.load(value)
+        except CookieError:
+            continue
+        for name, morsel in jar.items():
+            cookies[name] = morsel.value
+    return cookies
+
+
+class ResponseStore:
+    """Captured responses by url, the response dicts are built on request
+    """
+
+    def __init__(self, raws=None):
+        # normalized url -> raw response, in memory or a `SnapshotFile`
+        self.raws = raws if raws is not None else OrderedDict()
+        # host -> server ips
+        self.ips = {}
+
+    def add(self, url: str, status: int, headers: List[Tuple[str, str]], body: Optional[bytes],
+            ip: Optional[str] = None):
+        url = normalize_url(url)
+        if not urllib.parse.urlsplit(url).netloc:
+            return
+        # the first capture of the url wins, unless it has no body
+        raw = self.raws.get(url)
+        if raw is None or (raw[2] is None and body is not None):
+            self.raws[url] = (status, headers, body)
+        if ip:
+            ips = self.ips.setdefault(host_of(url), [])
+            if ip not in ips:
+                ips.append(ip)
+
+    def __len__(self):
+        return len(self.raws)
+
+    def targets(self) -> List[str]:
+        """The root of every host, or its first captured url when the root is not captured
+        """
+        targets = OrderedDict()
+        for url in self.raws:
+            parsed = urllib.parse.urlsplit(url)
+            root = "%s://%s/" % (parsed.scheme, parsed.netloc)
+            if root in self.raws:
+                targets.setdefault(root, root)
+            else:
+                targets.setdefault(root, url)
+        return list(targets.values())
+
+    def response(self, url: str) -> Optional[Dict]:
+        url = normalize_url(url)
+        raw = self.raws.get(url)
+        if raw is None or raw[2] is None:
+            return None
+        from requests.structures import CaseInsensitiveDict
+        status, header_list, body = raw
+        headers = CaseInsensitiveDict()
+        for k, v in header_list:
+            # repeated headers are joined like `requests`
+            headers[k] = "%s, %s" % (headers[k], v) if k in headers else v
+        cookies = parse_cookies([v for k, v in header_list if k.lower() == "set-cookie"])
+        return build_response(url, status, headers, body, cookies)
+
+    def probe(self, url: str, mmh3: bool = False) -> Optional[Dict]:
+        url = normalize_url(url)
+        raw = self.raws.get(url)
+        if raw is None:
+            return None
+        status, _, body = raw
+        r = {"url": url, "status": status, "md5": None if body is None else plain2md5(body)}
+        if mmh3 and body is not None:
+            r["mmh3"] = favicon_hash(body)
+        return r
+
+    def save_warc(self, path: str):
+        """Save the responses as a gzipped WARC, a response without body is marked
+        'WARC-Truncated', `load` reads it back
+        """
+        date = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            for url, (status, headers, body) in self.raws.items():
+                try:
+                    reason = http.HTTPStatus(status).phrase
+                except ValueError:
+                    reason = ""
+                lines = ["HTTP/1.1 %d %s" % (status, reason)]
+                lines.extend("%s: %s" % (k, v) for k, v in headers
+                             if k.lower() not in _WIRE_HEADERS)
+                lines.append("Content-Length: %d" % len(body or b""))
+                block = ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1", "replace") + (body or b"")
+                fields = [
+                    "WARC/1.0",
+                    "WARC-Type: response",
+                    "WARC-Target-URI: %s" % url,
+                    "WARC-Date: %s" % date,
+                    "Content-Type: application/http; msgtype=response",
+                ]
+                if body is None:
+                    fields.append("WARC-Truncated: length")
+                fields.append("Content-Length: %d" % len(block))
+                record = ("\r\n".join(fields) + "\r\n\r\n").encode("utf-8") + block + b"\r\n\r\n"
+                # one gzip member per record
+                f.write(gzip.compress(record))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ResponseStore":
+        """Load a HAR file, a WARC file, a snapshot file or a directory of saved responses
+        """
+        if path.lower().endswith(".snap"):
+            from src.snapshot_file import SnapshotFile
+            return cls(SnapshotFile(path))
+        store = cls()
+        if os.path.isdir(path):
+            records = iter_dir(path)
+        elif path.lower().endswith(".har"):
+            records = iter_har(path)
+        elif path.lower().endswith((".warc", ".warc.gz")):
+            records = iter_warc(path)
+        else:
+            raise ValueError("Unknown offline input '%s', need .har, .warc(.gz), .snap or directory" % path)
+        for url, raw, ip in records:
+            store.add(url, *raw, ip=ip)
+        logger.debug("offline: %d responses of %d hosts loaded from '%s'",
+                    len(store), len(store.targets()), path)
+        return store
+
+
+def iter_har(path: str) -> Iterator[Tuple[str, RawResponse, Optional[str]]]:
+    with open(path, "r", encoding="utf-8") as f:
+        har = json.load(f)
+    for entry in har.get("log", {}).get("entries", []):
+        try:
+            url = entry["request"]["url"]
+            response = entry["response"]
+            status = int(response["status"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        # the content of HAR is already decoded
+        headers = [(h["name"], h["value"]) for h in response.get("headers", [])
+                   if h.get("name", "").lower() not in ("content-encoding", "transfer-encoding")]
+        content = response.get("content", {})
+        text = content.get("text") or ""
+        if content.get("encoding") == "base64":
+            body = base64.b64decode(text)
+        else:
+            body = text.encode("utf-8")
+        yield url, (status, headers, body), entry.get("serverIPAddress")
+
+
+def iter_warc(path: str) -> Iterator[Tuple[str, RawResponse, Optional[str]]]:
+    opener = gzip.open if path.lower().endswith(".gz") else open
+    with opener(path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if not line.startswith(b"WARC/"):
+                continue
+            fields = {}
+            for line in iter(f.readline, b""):
+                line = line.strip()
+                if not line:
+                    break
+                k, _, v = line.decode("utf-8", "replace").partition(":")
+                fields[k.strip().lower()] = v.strip()
+            try:
+                length = int(fields.get("content-length", 0))
+            except ValueError:
+                continue
+            block = f.read(length)
+            if fields.get("warc-type") != "response":
+                continue
+            url = fields.get("warc-target-uri", "").strip("<>")
+            raw = parse_http_response(block)
+            if url and raw:
+                if "warc-truncated" in fields and not raw[2]:
+                    raw = raw[0], raw[1], None
+                yield url, raw, fields.get("warc-ip-address")
+
+
+def iter_dir(path: str) -> Iterator[Tuple[str, RawResponse, Optional[str]]]:
+    """Directory of a mirror like `wget -x --save-headers`: <host>/<path>,
+    optionally under a 'http' or 'https' directory. A file is a raw HTTP response,
+    or the bare body of a 200 response. 'index.html' is the response of its directory.
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file = os.path.join(root, name)
+            parts = os.path.relpath(file, path).split(os.sep)
+            scheme = "http"
+            if parts[0] in ("http", "https") and len(parts) > 2:
+                scheme = parts.pop(0)
+            if len(parts) < 2:
+                continue
+            host, parts = parts[0], parts[1:]
+            if parts[-1] == "index.html":
+                parts[-1] = ""
+            url = "%s://%s/%s" % (scheme, host, "/".join(parts))
+            with open(file, "rb") as f:
+                data = f.read()
+            raw = parse_http_response(data) if data.startswith(b"HTTP/") else None
+            yield url, raw or (200, [], data), None
+
+
+class OfflineSniffer(ComponentSniffer):
+    """Check the components on captured responses of a `ResponseStore`, nothing is sent
+    """
+
+    def __init__(self, target: str, directory: str, store: ResponseStore, components=None):
+        super().__init__(target, directory, components=components)
+        self.store = store
+
+    def _record(self, url: str):
+        if self.recorder is not None:
+            raw = self.store.raws.get(normalize_url(url))
+            if raw is not None:
+                self.recorder.add(url, *raw)
+
+    def request(self, url: str, **kwargs) -> Optional[Dict]:
+        # the built responses live as long as the target
+        key = normalize_url(url)
+        with self.request_manager_lock:
+            resp = self.request_manager_history.get(key)
+        if resp is not None:
+            return resp
+        self._record(url)
+        resp = self.store.response(url)
+        if resp is not None:
+            with self.request_manager_lock:
+                resp = self.request_manager_history.setdefault(key, resp)
+        return resp
+
+    def probe(self, url: str, head: bool = False, mmh3: bool = False) -> Optional[Dict]:
+        self._record(url)
+        return self.store.probe(url, mmh3=mmh3)
+
+    def load_plugins(self) -> List[Dict]:
+        resp = self.request(self.target)
+        title = self.get_title(resp["body"] if resp else "")
+        return [title, {"name": "ip", "ips": list(self.store.ips.get(host_of(self.target), []))}]
+
+    def needs_network(self, component) -> bool:
+        return False
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+from src.core import SEARCH_LOCATIONS, Component, Match
+from src.log import logger
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+# literals shorter than this are too common to filter anything
+MIN_LITERAL_LENGTH = 3
+
+_REPEATS = tuple(getattr(sre_parse, name) for name in
+                 ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT") if hasattr(sre_parse, name))
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+# with IGNORECASE, ascii letters also match these characters
+_IGNORECASE_EXTRA = str.maketrans(
+    {"İ": "i", "ı": "i", "ſ": "s", "K": "k"})
+
+
+def _literal_runs(parsed) -> List[str]:
+    """All the literal runs which are required by the parsed regexp
+    """
+    runs, run = [], []
+
+    def flush():
+        if run:
+            runs.append("".join(run))
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            runs.extend(_literal_runs(av[-1]))
+        elif op is _ATOMIC_GROUP:
+            runs.extend(_literal_runs(av))
+        elif op in _REPEATS and av[0] >= 1:
+            runs.extend(_literal_runs(av[2]))
+    flush()
+    return runs
+
+
+def regexp_literal(pattern: str) -> Optional[str]:
+    """The longest literal which any match of `pattern` must contain
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.I)
+    except Exception as err:
+        logger.debug("%s parse error: %s", pattern, err)
+        return None
+    runs = _literal_runs(parsed)
+    if not runs:
+        return None
+    return max(runs, key=len)
+
+
+def trigrams(s: str) -> Set[str]:
+    return {s[i:i + MIN_LITERAL_LENGTH] for i in range(len(s) - MIN_LITERAL_LENGTH + 1)}
+
+
+def fold(s: str) -> str:
+    """Fold the case like `re.I` does, a literal found in a text is found in the folded text
+    """
+    if not s.isascii():
+        s = s.translate(_IGNORECASE_EXTRA)
+    return s.casefold()
+
+
+class LiteralIndex:
+    """Inverted index: required literal -> components
+
+    A component is a candidate of a target only when one of its matches can be true,
+    i.e. the literal required by a match is in the target response. Components whose
+    matches can't all be reduced to literals are always candidates.
+    """
+
+    def __init__(self):
+        # literal -> id of the components
+        self.literals = {}
+        # literal -> its trigrams
+        self.grams = {}
+        # id of the components which are always candidates
+        self.always = set()
+        # id of the components which are candidates in aggression mode
+        self.remote = set()
+        # search locations of the literals, None is all of them
+        self.locations: Optional[Set[str]] = None
+
+    @staticmethod
+    def match_literal(match: Match):
+        """:returns the required literal, None when unknown, False when it can never be true
+        """
+        if not match.checkable:
+            return False
+        literals = []
+        if isinstance(match.text, str):
+            literals.append(match.text)
+        if isinstance(match.regexp, str):
+            literals.append(regexp_literal(match.regexp))
+        literals = [fold(l) for l in literals if l and len(l) >= MIN_LITERAL_LENGTH]
+        if not literals:
+            return None
+        return max(literals, key=len)
+
+    @classmethod
+    def build(cls, components: Iterable[Component]) -> "LiteralIndex":
+        index = cls()
+        index.locations = set()
+        for component in components:
+            if not component.matches:
+                continue
+            # a condition with 'not' can be true when every match is false
+            if component.condition and "not" in component.condition.lower():
+                index.always.add(id(component))
+                continue
+            literals, locations, remote, unknown = set(), set(), False, False
+            for match in component.matches:
+                if match.is_remote:
+                    remote = True
+                    continue
+                literal = cls.match_literal(match)
+                if literal is None:
+                    unknown = True
+                    break
+                if literal:
+                    literals.add(literal)
+                    locations.add(match.search)
+            if unknown:
+                index.always.add(id(component))
+                continue
+            if remote:
+                index.remote.add(id(component))
+            for literal in literals:
+                index.literals.setdefault(literal, set()).add(id(component))
+            index.locations.update(locations)
+        index.grams = {l: tuple(trigrams(l)) for l in index.literals}
+        return index
+
+    @staticmethod
+    def haystack(resp: Dict, locations: Optional[Set[str]] = None) -> str:
+        """The text of a response that the literals may be searched in, case folded,
+        only the `locations` are built: a response whose rules only search the body
+        is never parsed nor are its headers joined
+        """
+        if locations is None:
+            locations = SEARCH_LOCATIONS
+        parts = []
+        if "all" in locations or ("body" in locations and "headers" in locations):
+            parts.append(resp["raw_response"])
+        elif "body" in locations:
+            parts.append(resp["body"])
+        elif "headers" in locations:
+            parts.append(resp["raw_headers"])
+        if "cookies" in locations:
+            parts.append(resp["raw_cookies"])
+        if "title" in locations:
+            parts.append(resp["title"])
+        if "script" in locations:
+            parts.extend(resp["script"])
+        if "meta" in locations:
+            parts.extend(resp["meta"].values())
+        return fold("\n".join(parts))
+
+    def candidates(self, resp: Dict, aggression: bool = False) -> Set[int]:
+        """id of the components that may match the target response `resp`
+        """
+        text = self.haystack(resp, self.locations)
+        grams = trigrams(text)
+        ids = set(self.always)
+        if aggression:
+            ids.update(self.remote)
+        for literal, c_ids in self.literals.items():
+            if c_ids <= ids:
+                continue
+            # cheap trigram check first
+            if not all(g in grams for g in self.grams[literal]):
+                continue
+            if literal in text:
+                ids.update(c_ids)
+        return ids
+
+    def __len__(self):
+        return len(self.literals)
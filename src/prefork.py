@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import gc
+import multiprocessing
+import os
+import queue
+import zlib
+from typing import Callable, Generator, List, Tuple
+
+from src.log import logger
+from src.utils import host_of
+
+# cached properties of `BatchSniffer` built before forking
+SHARED_INDEXES = ("hash_index", "literal_index", "component_names", "component_positions", "passive_components")
+
+
+def can_fork() -> bool:
+    return hasattr(os, "fork") and "fork" in multiprocessing.get_all_start_methods()
+
+
+def shard_targets(targets: List[str], n: int) -> List[List[str]]:
+    """Split the targets in `n` shards by host, all the targets of a host are in one shard
+    so the per-host limits of the scheduler still hold
+    """
+    shards = [[] for _ in range(n)]
+    for target in targets:
+        shards[zlib.crc32(host_of(target).encode("utf-8")) % n].append(target)
+    return shards
+
+
+def share(batch):
+    """Load the components and build the indexes of `batch` once in the parent, then
+    move every object to the permanent generation of the GC: the collections of the
+    children never touch them, so their pages stay shared copy-on-write after fork
+    """
+    gc.disable()
+    if batch.components is None:
+        batch.load_components()
+    for name in SHARED_INDEXES:
+        getattr(batch, name)
+    gc.collect()
+    gc.freeze()
+
+
+class Prefork:
+    """Forks `processes` children sharing the rule set which `share` prepared,
+    the children report their items to the parent through one queue
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._ctx = multiprocessing.get_context("fork")
+        self._queue = self._ctx.Queue()
+        self._children = []
+
+    def _child(self, index: int, run: Callable[[int, Callable], None]):
+        gc.enable()
+        try:
+            run(index, lambda *item: self._queue.put(item))
+        finally:
+            # the end of this child
+            self._queue.put(None)
+
+    def start(self, run: Callable[[int, Callable], None]) -> "Prefork":
+        """Fork the children, each calls `run(index, emit)`, `emit(*item)` sends an item to
+        `items`. Start threads in the parent only after, a lock held by a thread while
+        forking is never released in the children
+        """
+        for index in range(self.processes):
+            child = self._ctx.Process(target=self._child, args=(index, run), daemon=True)
+            child.start()
+            self._children.append(child)
+        gc.enable()
+        logger.info("forked %d processes: %s", self.processes, " ".join(str(c.pid) for c in self._children))
+        return self
+
+    def items(self) -> Generator[Tuple, None, None]:
+        """Items emitted by the children, until all of them are finished
+        """
+        running = len(self._children)
+        while running:
+            try:
+                item = self._queue.get(timeout=1)
+            except queue.Empty:
+                # killed without saying goodbye
+                if not any(c.is_alive() for c in self._children):
+                    break
+                continue
+            if item is None:
+                running -= 1
+                continue
+            yield item
+        self.join()
+
+    def join(self) -> int:
+        """Wait for the children, :returns the number of failed children
+        """
+        failed = 0
+        for child in self._children:
+            child.join()
+            if child.exitcode != 0:
+                failed += 1
+                logger.error("process %d exits with %s", child.pid, child.exitcode)
+        return failed
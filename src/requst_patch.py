@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import ssl
+import threading
 
 import requests
 import urllib3
@@ -42,8 +43,8 @@ def session_request(self, method, url,
     }
     send_kwargs.update(settings)
     resp = self.send(prep, **send_kwargs)
-    # parse coding 'ISO-8859-1'
-    if resp.encoding == 'ISO-8859-1':
+    # parse coding 'ISO-8859-1', streamed body is left for the caller
+    if not stream and resp.encoding == 'ISO-8859-1':
         encodings = get_encodings_from_content(resp.text)
         if encodings:
             encoding = encodings[0]
@@ -54,11 +55,24 @@ def session_request(self, method, url,
     return resp
 
 
+_patch_lock = threading.Lock()
+_patched = False
+
+
 def requst_patch():
-    urllib3.disable_warnings()
-    # remove ssl verify
-    ssl._create_default_https_context = ssl._create_unverified_context
-    Session.request = session_request
+    global _patched
+    with _patch_lock:
+        if _patched:
+            return
+        urllib3.disable_warnings()
+        # remove ssl verify
+        ssl._create_default_https_context = ssl._create_unverified_context
+        Session.request = session_request
+        _patched = True
 
 
-requst_patch()
+def patched_requests():
+    """Get `requests` module, the patch is applied on first use instead of on import
+    """
+    requst_patch()
+    return requests
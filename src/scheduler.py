@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+from src import metrics
+from src.log import logger
+
+# statuses that ask the client to slow down
+BACKOFF_STATUS = (429, 503)
+
+
+class HostState:
+    def __init__(self, host: str):
+        self.host = host
+        # tasks which request the host, limited by `max_in_flight`
+        self.network = deque()
+        # tasks only work on cached responses
+        self.local = deque()
+        self.in_flight = 0
+        self.in_ring = False
+        # politeness
+        self.next_request = 0.0
+        self.backoff = 0.0
+        self.backoff_until = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self.network) + len(self.local)
+
+
+class HostScheduler:
+    """Schedules the tasks of many hosts on one pool of workers
+
+    Hosts are served round-robin. A host runs at most `max_in_flight` network tasks
+    at once and is skipped while it backs off after 429/503, idle workers pick up
+    the tasks of other hosts instead of waiting for a slow one.
+    Requests also pass `wait`/`report`, which apply the per-host request rate.
+    """
+
+    def __init__(self, max_in_flight: int = 4,
+                 rate: float = 0.0,
+                 backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.max_in_flight = max(1, max_in_flight)
+        # requests per second per host, 0 is unlimited
+        self.rate = rate
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # limits of the running network and local tasks of all hosts, None is the number
+        # of workers, `AdaptiveConcurrency` tunes them at runtime
+        self.network_limit: Optional[int] = None
+        self.local_limit: Optional[int] = None
+
+        self._cond = threading.Condition()
+        self._hosts = {}
+        self._ring = deque()
+        self._running = 0
+        self._network_running = 0
+        self._local_running = 0
+        self._network_queued = 0
+        self._local_queued = 0
+
+    def _host(self, host: str) -> HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = HostState(host)
+        return state
+
+    def submit(self, host: str, task: Callable[[], None], network: bool = True):
+        with self._cond:
+            state = self._host(host)
+            if network:
+                state.network.append(task)
+                self._network_queued += 1
+            else:
+                state.local.append(task)
+                self._local_queued += 1
+            if not state.in_ring:
+                state.in_ring = True
+                self._ring.append(host)
+            metrics.QUEUED_TASKS.inc()
+            self._cond.notify()
+
+    def _pick(self, now: float):
+        """:returns (state, task, network), seconds to wait when nothing is ready
+        """
+        network_ok = self.network_limit is None or self._network_running < self.network_limit
+        local_ok = self.local_limit is None or self._local_running < self.local_limit
+        if not network_ok and not local_ok:
+            return None, None
+        wait = None
+        for _ in range(len(self._ring)):
+            host = self._ring.popleft()
+            state = self._hosts[host]
+            if not state.queued:
+                state.in_ring = False
+                continue
+            self._ring.append(host)
+            if network_ok and state.network and state.in_flight < self.max_in_flight:
+                if state.backoff_until <= now:
+                    state.in_flight += 1
+                    self._network_running += 1
+                    self._network_queued -= 1
+                    return (state, state.network.popleft(), True), None
+                delay = state.backoff_until - now
+                wait = delay if wait is None else min(wait, delay)
+            if local_ok and state.local:
+                self._local_running += 1
+                self._local_queued -= 1
+                return (state, state.local.popleft(), False), None
+        return None, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    picked, wait = self._pick(time.monotonic())
+                    if picked:
+                        self._running += 1
+                        metrics.QUEUED_TASKS.dec()
+                        break
+                    if self._running == 0 and not self._ring:
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(wait)
+            state, task, network = picked
+            try:
+                task()
+            except Exception as err:
+                logger.error("in scheduler worker [%s] %s", state.host, err)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    if network:
+                        state.in_flight -= 1
+                        self._network_running -= 1
+                    else:
+                        self._local_running -= 1
+                    self._cond.notify_all()
+
+    def run(self, max_threads: int = 8):
+        """Run until all the tasks, including the tasks submitted by tasks, are finished
+        """
+        _ts = []
+        for _ in range(max(1, max_threads)):
+            _t = threading.Thread(target=self._worker)
+            _t.start()
+            _ts.append(_t)
+        for _t in _ts:
+            _t.join()
+
+    def set_limits(self, network: Optional[int], local: Optional[int]):
+        with self._cond:
+            self.network_limit, self.local_limit = network, local
+            self._cond.notify_all()
+
+    def saturation(self) -> Tuple[bool, bool]:
+        """:returns whether network and local tasks are waiting for the limits
+        """
+        with self._cond:
+            return (self.network_limit is not None and self._network_queued > 0
+                    and self._network_running >= self.network_limit,
+                    self.local_limit is not None and self._local_queued > 0
+                    and self._local_running >= self.local_limit)
+
+    def wait(self, host: str):
+        """Called before requesting `host`, sleeps for the rate limit and the backoff
+        """
+        with self._cond:
+            state = self._host(host)
+            now = time.monotonic()
+            start = max(now, state.backoff_until)
+            if self.rate > 0:
+                start = max(start, state.next_request)
+                state.next_request = start + 1.0 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+    def report(self, host: str, status: int, headers: Optional[Dict] = None):
+        """Called after requesting `host`, backs off on 429/503
+        """
+        with self._cond:
+            state = self._host(host)
+            if status not in BACKOFF_STATUS:
+                state.backoff = 0.0
+                return
+            retry_after = None
+            if headers:
+                try:
+                    retry_after = float(headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    pass
+            if state.backoff:
+                state.backoff = min(self.max_backoff, state.backoff * 2)
+            else:
+                state.backoff = self.backoff
+            delay = min(self.max_backoff, retry_after) if retry_after else state.backoff
+            state.backoff_until = max(state.backoff_until, time.monotonic() + delay)
+            logger.debug("'%s' responds %d, back off %.1fs", host, status, delay)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from src import metrics
+from src.component_sniffer import ComponentSniffer
+from src.core import ComponentGeneratorMixin, make_session
+from src.hash_index import HashIndex
+from src.log import logger
+from src.prefilter import LiteralIndex
+from src.utils import get_uuid
+
+
+class JobStatus:
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+# options a client can set per job, the other scan options are settings of the server
+JOB_OPTIONS = ("url", "aggression", "components")
+
+
+class ScanJob:
+    def __init__(self, options: Dict):
+        self.id = get_uuid()
+        self.options = options
+        self.status = JobStatus.queued
+        self.results = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.done, JobStatus.failed)
+
+    def to_dict(self, with_results=True) -> Dict:
+        info = {
+            "id": self.id,
+            "url": self.options["url"],
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error:
+            info["error"] = self.error
+        if with_results and self.results is not None:
+            info["results"] = self.results
+        return info
+
+
+class ScanServer(ComponentGeneratorMixin):
+    """A long-running scanner, keeps the components and connection pool warm
+    and runs the scan jobs from a queue with limited concurrency
+    """
+
+    def __init__(self, directory: str,
+                 max_jobs: int = 4,
+                 queue_size: int = 100,
+                 max_threads: int = 8,
+                 keep_jobs: int = 1000):
+        self.directory = directory
+        self.max_jobs = max_jobs
+        self.max_threads = max_threads
+        self.keep_jobs = keep_jobs
+
+        self.load_components()
+        # a bundle comes with its indexes
+        if not hasattr(self, "hash_index"):
+            self.hash_index = HashIndex.build(self.components)
+            self.literal_index = LiteralIndex.build(self.components)
+        self.session = make_session(max_jobs * max_threads)
+
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._job_q = queue.Queue(maxsize=queue_size)
+        self._workers = []
+
+    def start_workers(self):
+        for _ in range(self.max_jobs):
+            _t = threading.Thread(target=self._worker, daemon=True)
+            _t.start()
+            self._workers.append(_t)
+
+    def stop_workers(self):
+        for _ in self._workers:
+            self._job_q.put(None)
+        for _t in self._workers:
+            _t.join()
+        self._workers = []
+
+    def submit(self, options: Dict) -> ScanJob:
+        """Queue a scan job, raises `queue.Full` when the queue is full
+        and `ValueError` when the options are invalid
+        """
+        unknown = sorted(k for k in options if k not in JOB_OPTIONS)
+        if unknown:
+            raise ValueError("Scan job options not allowed: %s" % ", ".join(map(str, unknown)))
+        if not isinstance(options.get("url"), str) or not options["url"]:
+            raise ValueError("Scan job need 'url'")
+        components = options.get("components")
+        # a string would be checked as its characters
+        if components is not None and (not isinstance(components, list)
+                                       or not all(isinstance(c, str) for c in components)):
+            raise ValueError("Scan job 'components' must be a list of component names")
+        if not isinstance(options.get("aggression", False), bool):
+            raise ValueError("Scan job 'aggression' must be a boolean")
+        job = ScanJob(options)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        try:
+            self._job_q.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                self._jobs.pop(job.id, None)
+            raise
+        self._evict_jobs()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[ScanJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[ScanJob]:
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def make_sniffer(self, options: Dict) -> ComponentSniffer:
+        sniffer = ComponentSniffer(options["url"], self.directory,
+                                   components=self.components, session=self.session)
+        sniffer.hash_index = self.hash_index
+        sniffer.literal_index = self.literal_index
+        sniffer.max_threads = self.max_threads
+        sniffer.configure({k: options[k] for k in JOB_OPTIONS if k in options})
+        return sniffer
+
+    def run_job(self, job: ScanJob):
+        job.status = JobStatus.running
+        job.started_at = time.time()
+        try:
+            sniffer = self.make_sniffer(job.options)
+            if job.options.get("components"):
+                job.results = sniffer.test(tuple(job.options["components"]))
+            else:
+                job.results = sniffer.start()
+            job.status = JobStatus.done
+        except Exception as err:
+            logger.error("scan job [%s] error: %s", job.id, err)
+            job.error = str(err)
+            job.status = JobStatus.failed
+        job.finished_at = time.time()
+
+    def _worker(self):
+        while True:
+            job = self._job_q.get()
+            if job is None:
+                break
+            self.run_job(job)
+
+    def _evict_jobs(self):
+        """Forget the oldest finished jobs beyond `self.keep_jobs`
+        """
+        with self._jobs_lock:
+            overflow = len(self._jobs) - self.keep_jobs
+            for job_id in [j.id for j in self._jobs.values() if j.finished]:
+                if overflow <= 0:
+                    break
+                del self._jobs[job_id]
+                overflow -= 1
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8000):
+        httpd = ThreadingHTTPServer((host, port), make_handler(self))
+        self.start_workers()
+        logger.info("serving on http://%s:%d with %d components",
+                    host, port, len(self.components))
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+            self.stop_workers()
+
+
+def make_handler(server: ScanServer):
+    class ScanRequestHandler(BaseHTTPRequestHandler):
+        """HTTP/JSON API:
+            POST /scans       queue a scan job {"url": ..., "aggression": ..., "components": [...]}
+            GET  /scans       list scan jobs
+            GET  /scans/<id>  scan job status and results
+            GET  /health      server status
+            GET  /metrics     Prometheus metrics
+        """
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+        def _send_json(self, status: int, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _path_parts(self) -> Tuple[str, ...]:
+            return tuple(p for p in self.path.split("?", 1)[0].split("/") if p)
+
+        def do_GET(self):
+            parts = self._path_parts()
+            if parts == ("health",):
+                self._send_json(200, {
+                    "status": "ok",
+                    "components": len(server.components),
+                    "queued": server._job_q.qsize(),
+                })
+            elif parts == ("metrics",):
+                body = metrics.REGISTRY.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif parts == ("scans",):
+                self._send_json(200, [j.to_dict(with_results=False)
+                                      for j in server.list_jobs()])
+            elif len(parts) == 2 and parts[0] == "scans":
+                job = server.get_job(parts[1])
+                if job is None:
+                    self._send_json(404, {"error": "job not found"})
+                else:
+                    self._send_json(200, job.to_dict())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self._path_parts() != ("scans",):
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                options = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(options, dict):
+                    raise ValueError("Scan job must be a JSON object")
+                job = server.submit(options)
+            except queue.Full:
+                self._send_json(503, {"error": "job queue is full"})
+                return
+            except ValueError as err:
+                self._send_json(400, {"error": str(err)})
+                return
+            self._send_json(202, job.to_dict())
+
+    return ScanRequestHandler
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional
+
+from src.component_sniffer import ComponentSniffer, Hit
+from src.core import Component
+from src.journal import ScanJournal
+from src.log import logger
+from src.offline import OfflineSniffer, ResponseStore
+from src.snapshot_file import SnapshotFile
+
+
+def component_digest(component: Component) -> str:
+    """Content hash of a component, changes whenever its rule changes
+    """
+    data = json.dumps(component.to_dict(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class SnapshotStore:
+    """Response snapshots and per-component hits of the scanned targets, a rescan checks
+    only the new or changed components on the snapshots and merges the stored hits
+
+        <path>/targets.jsonl    last entry of every target, a `ScanJournal`
+        <path>/responses.snap   captured responses of all targets, a `SnapshotFile`
+        <path>/rulesets/        digests of the components a target is checked with
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.join(path, "rulesets"), exist_ok=True)
+        self.journal = ScanJournal(os.path.join(path, "targets.jsonl"))
+        self.responses = ResponseStore(SnapshotFile(os.path.join(path, "responses.snap")))
+        self._digests = {}
+
+    def digest(self, component: Component) -> str:
+        d = self._digests.get(id(component))
+        if d is None:
+            d = self._digests[id(component)] = component_digest(component)
+        return d
+
+    def save_ruleset(self, components: Iterable[Component]) -> str:
+        digests = sorted({self.digest(c) for c in components})
+        ruleset = hashlib.sha1("\n".join(digests).encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(self.path, "rulesets", ruleset + ".json")
+        if not os.path.exists(path):
+            # targets finishing at once write the same ruleset, each one in its own file
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path),
+                                             suffix=".tmp", delete=False) as f:
+                json.dump(digests, f)
+            os.replace(f.name, path)
+        return ruleset
+
+    def load_ruleset(self, ruleset: str) -> set:
+        path = os.path.join(self.path, "rulesets", ruleset + ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return set(json.load(f))
+        except (OSError, ValueError) as err:
+            logger.warning("ruleset '%s' can't be loaded: %s", ruleset, err)
+            return set()
+
+    def save(self, target: str, responses: Optional[ResponseStore], plugins: List[Dict],
+             hits: List[Hit], results: List[Dict], ruleset: str):
+        """Save the snapshot of a finished target
+        :param ruleset: `save_ruleset` of the components the target is checked with
+        """
+        if responses is not None:
+            for url, raw in responses.raws.items():
+                self.responses.raws[url] = raw
+        self.journal.record(target, results,
+                            ruleset=ruleset,
+                            plugins=plugins,
+                            hits=[{"digest": self.digest(c), "result": r} for c, r in hits])
+
+    def rescan(self, sniffer: ComponentSniffer) -> Optional[List[Dict]]:
+        """Check the components of `sniffer` which are not in the ruleset of its target
+        on the snapshot, :returns the merged results, None when the target has no snapshot
+        """
+        entry = self.journal.entry(sniffer.target)
+        if entry is None:
+            return None
+        checked = self.load_ruleset(entry.get("ruleset", ""))
+        current = {}
+        for component in sniffer.iter_components():
+            current.setdefault(self.digest(component), component)
+        # hits of the unchanged components are kept, removed components are dropped
+        hits = [(current[h["digest"]], h["result"]) for h in entry.get("hits", [])
+                if h.get("digest") in current and h["digest"] in checked]
+        changed = [c for d, c in current.items() if d not in checked]
+        logger.info("'%s' rescan %d new or changed components", sniffer.target, len(changed))
+        for component in changed:
+            hit = sniffer._check_component(component)
+            if hit:
+                hits.append(hit)
+        plugins = entry.get("plugins", [])
+        results = sniffer.finish(plugins, hits)
+        self.save(sniffer.target, None, plugins, hits, results, self.save_ruleset(current.values()))
+        return results
+
+    def make_sniffer(self, target: str, directory: str, components: List[Component]) -> OfflineSniffer:
+        return OfflineSniffer(target, directory, self.responses, components=components)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import struct
+import threading
+from collections.abc import MutableMapping
+from typing import Iterator, List, Optional, Tuple
+
+from src.log import logger
+
+# magic, status, url length, headers length, body length
+_RECORD = struct.Struct("<4sHIIQ")
+_MAGIC = b"WHR1"
+# body length of a response without body
+_NO_BODY = 2 ** 64 - 1
+
+
+def _encode_headers(headers: List[Tuple[str, str]]) -> bytes:
+    return "".join("%s: %s\r\n" % (k, v) for k, v in headers).encode("utf-8", "surrogateescape")
+
+
+def _decode_headers(data: bytes) -> List[Tuple[str, str]]:
+    headers = []
+    for line in data.decode("utf-8", "surrogateescape").split("\r\n"):
+        if line:
+            k, _, v = line.partition(": ")
+            headers.append((k, v))
+    return headers
+
+
+class SnapshotFile(MutableMapping):
+    """Append-only file of raw responses, memory mapped for reading:
+        url -> (status, headers, body)
+
+    Records are appended to `<path>` and their offsets to the index `<path>.idx`,
+    the last record of a url wins. Bodies are `memoryview`s of the mapped file,
+    they are never copied into the Python heap until they are decoded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        # url -> offset of its last record
+        self._offsets = {}
+        self._lock = threading.Lock()
+        self._mm = None
+        open(path, "ab").close()
+        self._size = self._recover()
+
+    def _read_header(self, f, offset: int):
+        f.seek(offset)
+        data = f.read(_RECORD.size)
+        if len(data) < _RECORD.size:
+            return None
+        magic, status, url_len, headers_len, body_len = _RECORD.unpack(data)
+        if magic != _MAGIC:
+            return None
+        end = offset + _RECORD.size + url_len + headers_len + (0 if body_len == _NO_BODY else body_len)
+        return url_len, end
+
+    def _recover(self) -> int:
+        """Load the index, the records after the last indexed one are scanned,
+        a broken record at the end is cut
+        """
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8", errors="surrogateescape") as f:
+                for line in f:
+                    offset, sep, url = line.rstrip("\n").partition("\t")
+                    if sep and offset.isdigit():
+                        self._offsets[url] = int(offset)
+        size = os.path.getsize(self.path)
+        end = 0
+        with open(self.path, "rb") as f:
+            if self._offsets:
+                last = self._read_header(f, max(self._offsets.values()))
+                if last is None or last[1] > size:
+                    # the index is not consistent with the data, rebuild it
+                    logger.warning("snapshot index '%s' is broken, rebuilding", self.index_path)
+                    self._offsets.clear()
+                    open(self.index_path, "w").close()
+                else:
+                    end = last[1]
+            recovered = []
+            while end < size:
+                header = self._read_header(f, end)
+                if header is None or header[1] > size:
+                    break
+                url = f.read(header[0]).decode("utf-8", "surrogateescape")
+                recovered.append((url, end))
+                end = header[1]
+        if end < size:
+            logger.warning("snapshot '%s' has a broken record at %d, cut", self.path, end)
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        if recovered:
+            self._write_index(recovered)
+        return end
+
+    def _write_index(self, entries: List[Tuple[str, int]]):
+        with open(self.index_path, "a", encoding="utf-8", errors="surrogateescape") as f:
+            for url, offset in entries:
+                f.write("%d\t%s\n" % (offset, url))
+                self._offsets[url] = offset
+
+    def _map(self, end: int) -> mmap.mmap:
+        mm = self._mm
+        if mm is None or len(mm) < end:
+            with open(self.path, "rb") as f:
+                # views of the old map keep it alive
+                mm = self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm
+
+    def __getitem__(self, url: str) -> Tuple[int, List[Tuple[str, str]], Optional[memoryview]]:
+        offset = self._offsets[url]
+        with self._lock:
+            mm = self._map(offset + _RECORD.size)
+        _, status, url_len, headers_len, body_len = _RECORD.unpack_from(mm, offset)
+        pos = offset + _RECORD.size + url_len
+        if body_len != _NO_BODY and len(mm) < pos + headers_len + body_len:
+            with self._lock:
+                mm = self._map(pos + headers_len + body_len)
+        headers = _decode_headers(mm[pos:pos + headers_len])
+        pos += headers_len
+        body = None if body_len == _NO_BODY else memoryview(mm)[pos:pos + body_len]
+        return status, headers, body
+
+    def __setitem__(self, url: str, raw):
+        status, headers, body = raw
+        url_data = url.encode("utf-8", "surrogateescape")
+        headers_data = _encode_headers(headers)
+        record = _RECORD.pack(_MAGIC, status, len(url_data), len(headers_data),
+                              _NO_BODY if body is None else len(body))
+        with self._lock:
+            with open(self.path, "ab") as f:
+                f.write(record)
+                f.write(url_data)
+                f.write(headers_data)
+                if body is not None:
+                    f.write(body)
+            offset = self._size
+            self._size += len(record) + len(url_data) + len(headers_data) + (len(body) if body is not None else 0)
+            self._write_index([(url, offset)])
+
+    def __delitem__(self, url: str):
+        raise TypeError("'%s' is append-only" % self.__class__.__name__)
+
+    def __contains__(self, url) -> bool:
+        return url in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._offsets))
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def close(self):
+        self._mm = None
@@ -1,17 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import base64
 import hashlib
 import os
 import random
-import socket
 import threading
-import urllib
+import urllib.parse
 import uuid
-from typing import Generator, Tuple
-
-import socks
-import urllib3
-from pypinyin import Style, pinyin
+from typing import Generator, List, Tuple
 
 from src.log import logger
 
@@ -61,31 +57,6 @@ class synchronized_property(property):
             return self.func(obj)
 
 
-def monkeypatch_proxy(proxy_type: str,
-                      addr: str,
-                      port: int,
-                      username: str = None,
-                      password: str = None,
-                      rdns: bool = True):
-    _proxy_type = None
-    if proxy_type == 'HTTP':
-        _proxy_type = socks.PROXY_TYPE_HTTP
-    elif proxy_type == 'SOCKS4':
-        _proxy_type = socks.PROXY_TYPE_SOCKS4
-    elif proxy_type == 'SOCKS5':
-        _proxy_type = socks.PROXY_TYPE_SOCKS5
-    else:
-        raise Exception('不支持的代理类型 %s' % proxy_type)
-    socks.set_default_proxy(
-        proxy_type=_proxy_type,
-        addr=addr,
-        port=port,
-        rdns=rdns,
-        username=username,
-        password=password)
-    socket.socket = socks.socksocket
-
-
 def fake_user_agent() -> str:
     """Fake UserAgent
     """
@@ -103,11 +74,54 @@ def fake_user_agent() -> str:
 def plain2md5(s: str, encoding='utf8'):
     if isinstance(s, str):
         s = s.encode(encoding)
-    elif not isinstance(s, bytes):
+    elif not isinstance(s, (bytes, bytearray, memoryview)):
         raise TypeError("Only str and bytes are supported")
     return hashlib.md5(s).hexdigest()
 
 
+def murmur3_32(data: bytes, seed: int = 0) -> int:
+    """MurmurHash3 x86 32-bit, signed like `mmh3.hash`
+    """
+    c1, c2 = 0xcc9e2d51, 0x1b873593
+    h = seed & 0xffffffff
+    length = len(data)
+    tail = length & ~3
+    for i in range(0, tail, 4):
+        k = int.from_bytes(data[i:i + 4], "little")
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+        h = ((h << 13) | (h >> 19)) & 0xffffffff
+        h = (h * 5 + 0xe6546b64) & 0xffffffff
+    k = 0
+    rest = length & 3
+    if rest:
+        k = int.from_bytes(data[tail:], "little")
+        k = (k * c1) & 0xffffffff
+        k = ((k << 15) | (k >> 17)) & 0xffffffff
+        k = (k * c2) & 0xffffffff
+        h ^= k
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h - 0x100000000 if h & 0x80000000 else h
+
+
+def favicon_hash(content: bytes) -> int:
+    """Favicon hash used by shodan/fofa: mmh3 of the base64 encoded content
+    """
+    data = base64.encodebytes(content)
+    try:
+        import mmh3
+    except ImportError:
+        return murmur3_32(data)
+    return mmh3.hash(data)
+
+
 def iter_files(root_dir: str, ignore_dirs=[]) -> Generator[Tuple[str, str], None, None]:
     """Iterate all components in directory `root_dir`
     :returns (root, filename)
@@ -121,6 +135,24 @@ def iter_files(root_dir: str, ignore_dirs=[]) -> Generator[Tuple[str, str], None
             yield (root, filename)
 
 
+def host_of(url: str) -> str:
+    """The 'host[:port]' of `url`, lower case
+    """
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def read_targets(path: str) -> List[str]:
+    """Read targets from file, one per line, blank lines and '#' comments are ignored
+    """
+    targets = []
+    with open(path, 'r', encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                targets.append(line)
+    return targets
+
+
 def ignore_long_char(src: str, length: int) -> str:
     """Ignore long characters in string
     """
@@ -136,6 +168,8 @@ def get_uuid():
 
 
 def get_pinyin_first_letter(name: str):
+    # pypinyin loads large dictionaries, import it only when needed
+    from pypinyin import Style, pinyin
     f = 'a'
     try:
         # https://github.com/mozillazg/python-pinyin
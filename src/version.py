@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+# weight of a candidate by how the version was found
+EXTRACTED = 1.0  # captured by the regexp `offset` group
+DIGEST = 1.0  # `version` of a md5/mmh3 match, the exact file is served
+DECLARED = 0.5  # `version` of a text, regexp or status match
+
+PRE_RELEASES = frozenset(("dev", "a", "alpha", "b", "beta", "pre", "preview", "rc"))
+
+_PARTS = re.compile(r"\d+|[a-zA-Z]+")
+_PREFIX = re.compile(r"^(?:version|ver|v)[\s:/]*(?=\d)", re.I)
+_UNDERSCORED = re.compile(r"(?<=\d)_(?=\d)")
+
+
+class VersionCandidate(NamedTuple):
+    version: str
+    # index of the match in the component, -1 for the hash index
+    source: int
+    weight: float
+
+
+def normalize_version(value) -> Optional[str]:
+    """`v5.4.2` `Version 5.4.2` and `5_4_2` are `5.4.2`, None when nothing is left
+    """
+    if value is None:
+        return None
+    version = _UNDERSCORED.sub(".", _PREFIX.sub("", str(value).strip()))
+    version = version.strip(" .-_;,")
+    return version or None
+
+
+def version_key(version: str) -> Tuple:
+    """Sort key of a normalized version, numbers are compared as numbers
+    and pre-releases are before the release: 5.4 < 5.4.2rc1 < 5.4.2 < 5.4.10
+    """
+    key = []
+    for part in _PARTS.findall(version):
+        if part.isdigit():
+            key.append((2, int(part), ""))
+        elif part.lower() in PRE_RELEASES:
+            key.append((0, 0, part.lower()))
+        else:
+            key.append((1, 0, part.lower()))
+    # the end is after a pre-release and before a number
+    key.append((1, 0, ""))
+    return tuple(key)
+
+
+def candidate_weight(match, extracted: bool) -> float:
+    if extracted:
+        return EXTRACTED
+    if match.md5 is not None or match.mmh3 is not None:
+        return DIGEST
+    return DECLARED
+
+
+def _supports(version: str, other: str) -> bool:
+    """`5.4` is a less specific `5.4.2`
+    """
+    return version == other or other.startswith(version + ".")
+
+
+def resolve(candidates: Iterable[VersionCandidate]) -> Tuple[Optional[str], float]:
+    """Best version of the candidates and its confidence in (0, 1]: the weight of the
+    candidates agreeing with it over the weight of all. The most supported version wins,
+    then the most specific, then the highest, so the result doesn't depend on the order
+    :returns (version, confidence), (None, 0) without candidates
+    """
+    weights = {}
+    for c in candidates:
+        weights[c.version] = weights.get(c.version, 0) + c.weight
+    if not weights:
+        return None, 0.0
+    total = sum(weights.values())
+    scores = {v: sum(w for other, w in weights.items() if _supports(other, v)) for v in weights}
+    best = max(scores, key=lambda v: (scores[v], len(v.split(".")), version_key(v), v))
+    return best, round(scores[best] / total, 2)
+
+
+def sort_versions(versions: Iterable[str]) -> List[str]:
+    return sorted(versions, key=lambda v: (version_key(v), v))
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.log import logger
+from src.utils import get_uuid
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'pending',
+    lease TEXT,
+    worker TEXT,
+    expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    done_seq INTEGER,
+    results TEXT
+);
+CREATE INDEX IF NOT EXISTS targets_state ON targets (state, id);
+CREATE INDEX IF NOT EXISTS targets_lease ON targets (lease);
+CREATE INDEX IF NOT EXISTS targets_done ON targets (done_seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Lease(NamedTuple):
+    id: str
+    targets: List[str]
+
+
+class WorkQueue:
+    """Targets of a distributed scan in a SQLite database shared by the coordinator and the workers
+
+    A worker claims a lease of pending targets and heartbeats it while scanning, the
+    targets of a lease which is not heartbeated for `lease_ttl` seconds, because its
+    worker died, are pending again. A target leased `max_attempts` times is failed.
+    The database must be on a local disk or a filesystem with working locks, leases
+    expire by the wall clock so the clocks of the nodes must be in sync.
+    """
+
+    def __init__(self, path: str, lease_ttl: Optional[float] = None, max_attempts: Optional[int] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # the settings of the coordinator are shared by the workers
+        if lease_ttl is not None:
+            self.set_meta("lease_ttl", lease_ttl)
+        if max_attempts is not None:
+            self.set_meta("max_attempts", max_attempts)
+        self.lease_ttl = float(self.get_meta("lease_ttl", 60.0))
+        self.max_attempts = int(self.get_meta("max_attempts", 3))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                r = fn(self._conn, *args)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return r
+
+    def _query(self, sql: str, *args) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                               (key, json.dumps(value, ensure_ascii=False)))
+
+    def get_meta(self, key: str, default=None):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", key)
+        return json.loads(rows[0][0]) if rows else default
+
+    @property
+    def options(self) -> Dict:
+        """Scan options of the coordinator, like `ComponentSniffer.configure`
+        """
+        return self.get_meta("options", {})
+
+    @options.setter
+    def options(self, options: Dict):
+        self.set_meta("options", options)
+
+    def add(self, targets: Iterable[str]) -> int:
+        """Queue the targets, the queued ones are ignored, :returns number of the new targets
+        """
+        def _add(conn, rows):
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO targets (target) VALUES (?)", rows)
+            return conn.total_changes - before
+        return self._transaction(_add, [(t,) for t in targets])
+
+    def _expire(self, conn, now: float):
+        conn.execute("UPDATE targets SET state = ?, lease = NULL WHERE state = ? AND expires_at < ? "
+                     "AND attempts >= ?", (FAILED, LEASED, now, self.max_attempts))
+        expired = conn.execute("UPDATE targets SET state = ?, lease = NULL WHERE state = ? AND expires_at < ?",
+                               (PENDING, LEASED, now)).rowcount
+        if expired:
+            logger.warning("%d targets of expired leases are pending again", expired)
+
+    def claim(self, worker: str, size: int) -> Optional[Lease]:
+        """Lease at most `size` pending targets to `worker`, None when no target is pending
+        """
+        def _claim(conn):
+            now = time.time()
+            self._expire(conn, now)
+            rows = conn.execute("SELECT id, target FROM targets WHERE state = ? ORDER BY id LIMIT ?",
+                                (PENDING, size)).fetchall()
+            if not rows:
+                return None
+            lease = Lease(get_uuid(), [target for _, target in rows])
+            conn.executemany("UPDATE targets SET state = ?, lease = ?, worker = ?, expires_at = ?, "
+                             "attempts = attempts + 1 WHERE id = ?",
+                             [(LEASED, lease.id, worker, now + self.lease_ttl, i) for i, _ in rows])
+            return lease
+        return self._transaction(_claim)
+
+    def heartbeat(self, lease: Lease) -> bool:
+        """Extend the lease, :returns False when it is lost
+        """
+        def _heartbeat(conn):
+            return conn.execute("UPDATE targets SET expires_at = ? WHERE lease = ? AND state = ?",
+                                (time.time() + self.lease_ttl, lease.id, LEASED)).rowcount
+        return self._transaction(_heartbeat) > 0
+
+    def complete(self, target: str, results: List[Dict]) -> bool:
+        """Save the results of `target`, :returns False when it was already done by another worker
+        """
+        def _complete(conn):
+            return conn.execute("UPDATE targets SET state = ?, lease = NULL, results = ?, "
+                                "done_seq = (SELECT COALESCE(MAX(done_seq), 0) + 1 FROM targets) "
+                                "WHERE target = ? AND state != ?",
+                                (DONE, json.dumps(results, ensure_ascii=False), target, DONE)).rowcount
+        return self._transaction(_complete) > 0
+
+    def release(self, lease: Lease, scanned: bool = False):
+        """Give back the unfinished targets of the lease
+        :param scanned: the targets were scanned and still not completed, they count as an
+        attempt and are failed after `max_attempts`, otherwise they were not started and don't
+        """
+        def _release(conn):
+            if scanned:
+                conn.execute("UPDATE targets SET state = ?, lease = NULL WHERE lease = ? AND state = ? "
+                             "AND attempts >= ?", (FAILED, lease.id, LEASED, self.max_attempts))
+                conn.execute("UPDATE targets SET state = ?, lease = NULL WHERE lease = ? AND state = ?",
+                             (PENDING, lease.id, LEASED))
+            else:
+                conn.execute("UPDATE targets SET state = ?, lease = NULL, attempts = attempts - 1 "
+                             "WHERE lease = ? AND state = ?", (PENDING, lease.id, LEASED))
+        self._transaction(_release)
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        counts.update(self._query("SELECT state, COUNT(*) FROM targets GROUP BY state"))
+        return counts
+
+    @property
+    def finished(self) -> bool:
+        counts = self.counts()
+        return not counts[PENDING] and not counts[LEASED]
+
+    def results(self, after: int = 0) -> List[Tuple[int, str, List[Dict]]]:
+        """:returns (seq, target, results) of the targets done after `seq`
+        """
+        rows = self._query("SELECT done_seq, target, results FROM targets WHERE done_seq > ? "
+                           "ORDER BY done_seq", after)
+        return [(seq, target, json.loads(results)) for seq, target, results in rows]
+
+    def failed(self) -> List[str]:
+        return [t for t, in self._query("SELECT target FROM targets WHERE state = ? ORDER BY id", FAILED)]
+
+
+class ScanWorker:
+    """Pulls leases from a `WorkQueue` and scans them with one `BatchSniffer`,
+    the components and their indexes are loaded once for all leases
+    """
+
+    def __init__(self, work_queue: WorkQueue,
+                 worker_id: Optional[str] = None,
+                 lease_size: int = 16,
+                 poll_interval: float = 1.0):
+        self.queue = work_queue
+        self.worker_id = worker_id or "%s-%d" % (socket.gethostname(), os.getpid())
+        self.lease_size = lease_size
+        self.poll_interval = poll_interval
+        self.scanned = 0
+
+    def _heartbeat(self, lease: Lease, stop: threading.Event):
+        while not stop.wait(self.queue.lease_ttl / 3):
+            try:
+                if not self.queue.heartbeat(lease):
+                    logger.warning("lease %s is lost", lease.id)
+                    return
+            except sqlite3.Error as err:
+                logger.error("heartbeat of lease %s: %s", lease.id, err)
+
+    def _on_result(self, target: str, results: List[Dict]):
+        if self.queue.complete(target, results):
+            self.scanned += 1
+        else:
+            logger.info("'%s' is already done by another worker", target)
+
+    def run_lease(self, batch, lease: Lease):
+        logger.info("worker %s scans lease %s of %d targets", self.worker_id, lease.id, len(lease.targets))
+        stop = threading.Event()
+        _t = threading.Thread(target=self._heartbeat, args=(lease, stop), daemon=True)
+        _t.start()
+        scanned = False
+        try:
+            batch.targets = lease.targets
+            batch.start()
+            scanned = True
+        finally:
+            stop.set()
+            _t.join()
+            # targets which are not completed: not started when the scan breaks,
+            # or their results are lost and retrying them forever won't help
+            self.queue.release(lease, scanned)
+
+    def run(self, batch, wait: bool = False) -> int:
+        """Scan leases with `batch` until the queue is finished, or forever when `wait`
+        :returns number of the targets scanned by this worker
+        """
+        options = self.queue.options
+        batch.options = options
+        if options.get("components"):
+            batch.only_components = set(options["components"])
+        batch.journal = None
+        batch.on_result = self._on_result
+        while True:
+            lease = self.queue.claim(self.worker_id, self.lease_size)
+            if lease is not None:
+                self.run_lease(batch, lease)
+                continue
+            # the leases of other workers may expire and be pending again
+            if self.queue.finished and not wait:
+                return self.scanned
+            time.sleep(self.poll_interval)
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.batch import BatchSniffer
+from src.bundle import Bundle, is_bundle, pack_directory
+from src.offline import ResponseStore
+
+TARGET = "http://example.com/"
+COMPONENTS = {
+    "server/Nginx.json": {"name": "Nginx", "type": "middleware",
+                          "matches": [{"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]},
+    "cms/Hello.json": {"name": "Hello", "type": "cms", "matches": [{"text": "hello"}], "implies": "PHP"},
+    "PHP.json": {"name": "PHP", "type": "others", "matches": [{"text": "never-there"}]},
+    "Favicon.json": {"name": "Favicon", "matches": [{"url": "/favicon.ico", "md5": "a" * 32}]},
+    "Admin.json": {"name": "Admin", "matches": [{"url": "/admin", "status": 403}, {"text": "x"}], "condition": "0 and not 1"},
+}
+
+
+class BundleTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.components = os.path.join(self.dir, "components")
+        for path, info in COMPONENTS.items():
+            path = os.path.join(self.components, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(info, f)
+        self.path = os.path.join(self.dir, "rules.whb")
+        self.header = pack_directory(self.components, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_pack_load(self):
+        self.assertTrue(is_bundle(self.path))
+        self.assertFalse(is_bundle(self.components))
+        self.assertEqual(self.header["count"], 5)
+        # the same rules are the same digest
+        self.assertEqual(pack_directory(self.components, self.path + "2")["digest"], self.header["digest"])
+        with Bundle(self.path) as bundle:
+            names = [c.name for c in bundle.components]
+            self.assertEqual(names, ["Admin", "Favicon", "PHP", "Hello", "Nginx"])
+            self.assertIs(bundle.component_names()["Hello"], bundle.components[3])
+            literal_index = bundle.literal_index()
+            self.assertEqual(literal_index.literals["hello"], {id(bundle.components[3])})
+            self.assertEqual(literal_index.always, {id(bundle.components[0])})
+            self.assertEqual(literal_index.locations, {"body", "headers"})
+            hash_index = bundle.hash_index()
+            favicon = bundle.components[1]
+            self.assertEqual(hash_index.lookup("/favicon.ico", {"md5": "A" * 32}), [(favicon, favicon.matches[0])])
+            self.assertTrue(hash_index.resolves(favicon))
+
+    def test_scan(self):
+        store = ResponseStore()
+        store.add(TARGET, 200, [("Server", "nginx/1.18.0")], b"hello")
+        store.add(TARGET + "admin", 403, [], None)
+        results = []
+        for directory in (self.components, self.path):
+            batch = BatchSniffer([TARGET], directory)
+            batch.options = {"aggression": True}
+            batch.store = store
+            results.append(sorted(batch.start()[TARGET][2:], key=lambda r: r["name"]))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([r["name"] for r in results[1]], ["Admin", "Hello", "Nginx", "PHP"])
+
+    def test_unpack(self):
+        out = os.path.join(self.dir, "out")
+        with Bundle(self.path) as bundle:
+            self.assertEqual(bundle.unpack(out), 5)
+        with open(os.path.join(out, "cms", "Hello.json")) as f:
+            self.assertEqual(json.load(f)["implies"], ["PHP"])
+        self.assertEqual(pack_directory(out, self.path + "2")["digest"], self.header["digest"])
+
+    def test_corrupted(self):
+        with open(self.path, "r+b") as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b"xxx")
+        with Bundle(self.path) as bundle:
+            bundle.section("components")
+            with self.assertRaises(ValueError):
+                bundle.section("hash_index")
+        with open(self.path, "wb") as f:
+            f.write(b"{}")
+        with self.assertRaises(ValueError):
+            Bundle(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from requests.structures import CaseInsensitiveDict
+
+from src.bytes_match import ascii_compatible, bytes_pattern, text_patterns
+from src.component_sniffer import ComponentSniffer
+from src.core import Match, build_response, declared_charset
+
+
+def response(content: bytes, content_type="text/html"):
+    headers = CaseInsensitiveDict({"Content-Type": content_type, "Server": "nginx"})
+    return build_response("http://a/", 200, headers, content, {})
+
+
+class BytesMatchTest(unittest.TestCase):
+    def test_bytes_pattern(self):
+        self.assertIsNotNone(bytes_pattern(r"jquery[.-]([\d.]+)\.js"))
+        self.assertIsNotNone(bytes_pattern(r"(?:wp-content|wp-includes)/"))
+        # need the text semantics
+        for regexp in (r"Powered by (\w+)", r"<title>(.+)</title>", r"[^<]+", r"\bwp\b", "织梦"):
+            self.assertIsNone(bytes_pattern(regexp), regexp)
+        self.assertIsNone(bytes_pattern("("))
+
+    def test_text_patterns(self):
+        self.assertEqual(list(text_patterns("hello")), [None])
+        patterns = text_patterns("织梦")
+        self.assertIn("utf-8", patterns)
+        # could match inside other characters
+        self.assertNotIn("gbk", patterns)
+        for charset in ("utf-8", "iso8859-1", "cp1252", "euc_jp", "ascii"):
+            self.assertTrue(ascii_compatible(charset, b"abc"), charset)
+        for charset in ("gbk", "gb18030", "big5", "shift_jis", "iso2022_jp", "utf-7", "utf-16-le"):
+            self.assertFalse(ascii_compatible(charset, b"abc"), charset)
+        self.assertTrue(ascii_compatible(None, b"abc"))
+        self.assertTrue(ascii_compatible(None, "织梦".encode("utf-8")))
+        self.assertFalse(ascii_compatible(None, "abc".encode("utf-16")))
+        self.assertFalse(ascii_compatible(None, "织梦".encode("gbk")))
+        # the utf-8 characters cut by the chunks of a memory-mapped body
+        body = memoryview(("a" + "织梦" * 40000).encode("utf-8"))
+        self.assertTrue(ascii_compatible(None, body))
+        self.assertFalse(ascii_compatible(None, body[:-1]))
+
+    def test_declared_charset(self):
+        html = CaseInsensitiveDict({"Content-Type": "text/html"})
+        for page, charset in ((b'<meta charset="gbk">', "gbk"),
+                              (b"<META http-equiv='Content-Type' content='text/html; charset=Shift_JIS'>", "shift_jis"),
+                              (b'<?xml version="1.0" encoding="UTF-8"?>', "utf-8"),
+                              (b'<meta name="x" content="y">', None),
+                              (b" " * 4096 + b'<meta charset="gbk">', None)):
+            self.assertEqual(declared_charset(html, page), charset, page[-40:])
+        big5 = CaseInsensitiveDict({"Content-Type": "text/html; charset=big5"})
+        self.assertEqual(declared_charset(big5, b'<meta charset="gbk">'), "big5")
+
+    def test_trail_bytes(self):
+        # the second byte of "一" in big5 is "@", of "表" in shift_jis is "\\"
+        sniffer = ComponentSniffer("http://a/", "")
+        for page, charset, needle in (("一", "big5", "@"), ("表", "shift_jis", "\\")):
+            self.assertIn(needle.encode("ascii"), page.encode(charset))
+            resp = response(page.encode(charset), "text/html; charset=%s" % charset)
+            sniffer.request = lambda url: resp
+            self.assertEqual(sniffer._check_match(Match.from_dict({"text": needle})), (False, None), charset)
+
+    def test_lazy_response(self):
+        resp = response(b"<html><title>Demo</title>jquery-1.12.4.js</html>")
+        sniffer = ComponentSniffer("http://a/", "")
+        sniffer.request = lambda url: resp
+        ok, version = sniffer._check_match(Match.from_dict({"regexp": r"jquery-([\d.]+)\.js", "offset": 0}))
+        self.assertEqual((ok, version), (True, "1.12.4"))
+        self.assertEqual(sniffer._check_match(Match.from_dict({"text": "missing"})), (False, None))
+        # matched on the bytes, never decoded nor parsed
+        self.assertNotIn("body", resp)
+        self.assertNotIn("title", resp)
+        self.assertEqual(resp["title"], "Demo")
+        self.assertEqual(resp.get("body"), "<html><title>Demo</title>jquery-1.12.4.js</html>")
+
+    def test_charsets(self):
+        sniffer = ComponentSniffer("http://a/", "")
+        page = "<html><title>织梦内容管理系统</title></html>"
+        for content_type, charset in (("text/html; charset=gbk", "gbk"),
+                                      ("text/html", "utf-8"),
+                                      ("text/html; charset=utf-16", "utf-16")):
+            resp = response(page.encode(charset), content_type)
+            sniffer.request = lambda url: resp
+            self.assertEqual(sniffer._check_match(Match.from_dict({"text": "织梦"})), (True, None), charset)
+            self.assertEqual(sniffer._check_match(Match.from_dict({"text": "title"})), (True, None), charset)
+            self.assertEqual(sniffer._check_match(Match.from_dict({"search": "all", "text": "nginx"})),
+                             (True, None), charset)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@ import os
 import unittest
 from typing import Generator
 
-from src.core import Component, ComponentGeneratorMixin, ComponentType
+from src.core import Component, ComponentGeneratorMixin, ComponentType, Match
 
 
 class ComponentTest(unittest.TestCase):
@@ -12,6 +12,42 @@ class ComponentTest(unittest.TestCase):
         self.assertIsNotNone(component)
         print("Component.make:", component)
 
+    def test_cls_from_dict(self):
+        info = {
+            "name": "WordPress",
+            "type": "CMS",
+            "description": "blog",
+            "implies": "PHP",
+            "matches": [
+                {"search": "headers[X-Powered-By]", "regexp": "wordpress ([\\d.]+)", "offset": "0"},
+                {"search": "title", "text": "WordPress"},
+                {"url": "/favicon.ico", "md5": "BEB816A701A4CEE3C2F586171458CEEC"},
+            ]
+        }
+        component = Component.from_dict(info)
+        self.assertEqual(component.type, "cms")
+        self.assertEqual(component.desc, "blog")
+        self.assertEqual(component.implies, ("PHP",))
+        m0, m1, m2 = component.matches
+        self.assertEqual((m0.search, m0.search_key), ("headers", "X-Powered-By"))
+        self.assertEqual(m0.offset, 0)
+        self.assertIsNotNone(m0.pattern)
+        self.assertEqual((m1.search, m1.search_key), ("title", None))
+        self.assertTrue(m2.is_remote and m2.is_probe)
+        self.assertEqual(m2.md5, "beb816a701a4cee3c2f586171458ceec")
+        self.assertEqual(component.to_dict()["matches"][0]["search"], "headers[X-Powered-By]")
+        with self.assertRaises(AttributeError):
+            component.name = "x"
+        with self.assertRaises(AttributeError):
+            m0.search = "body"
+
+    def test_cls_from_dict_invalid(self):
+        with self.assertRaises(ValueError):
+            Component.from_dict({"matches": []})
+        with self.assertRaises(ValueError):
+            Component.from_dict({"name": "x", "matches": ["text"]})
+        self.assertIsNone(Match.from_dict({"regexp": "(unclosed"}).pattern)
+
 
 class ComponentTypeTest(unittest.TestCase):
     def test_get_memeber_name(self):
@@ -0,0 +1,50 @@
+import random
+import unittest
+
+from requests.cookies import RequestsCookieJar
+
+from src.component_sniffer import ComponentSniffer
+from src.core import Component, Match, build_response
+
+
+class ComponentSnifferTest(unittest.TestCase):
+    def setUp(self):
+        self.components = [
+            Component.from_dict({"name": "Apache", "matches": []}),
+            Component.from_dict({"name": "WordPress", "implies": ["PHP", "MySQL"], "matches": []}),
+            Component.from_dict({"name": "PHP", "matches": []}),
+            Component.from_dict({"name": "MySQL", "excludes": "Apache", "matches": []}),
+            Component.from_dict({"name": "Nginx", "matches": []}),
+        ]
+        self.sniffer = ComponentSniffer("http://127.0.0.1/", "", components=self.components)
+
+    def test_merge_hits(self):
+        apache, wordpress, php, _, nginx = self.components
+        hits = [(nginx, {"name": "Nginx"}), (apache, {"name": "Apache"}),
+                (php, {"name": "PHP"}), (wordpress, {"name": "WordPress", "version": "5.4"})]
+        expected = [{"name": "WordPress", "version": "5.4"}, {"name": "PHP"},
+                    {"name": "Nginx"}, {"name": "MySQL"}]
+        for _ in range(5):
+            random.shuffle(hits)
+            self.assertEqual(self.sniffer._merge_hits(hits), expected)
+        self.assertEqual(self.sniffer.implies, {"PHP", "MySQL"})
+        self.assertEqual(self.sniffer.excludes, {"Apache"})
+
+    def test_keyed_search(self):
+        jar = RequestsCookieJar()
+        jar.set("PHPSESSID", "abc", domain="a", path="/")
+        jar.set("PHPSESSID", "def", domain="b", path="/")
+        resp = build_response("http://a/", 200, {"X-Powered-By": "PHP/7.4"}, b"", jar)
+        self.sniffer.request = lambda url: resp
+        check = self.sniffer._check_match
+        # header names are case insensitive, also in a plain dict
+        self.assertTrue(check(Match.from_dict({"search": "headers[x-powered-by]", "text": "PHP"}))[0])
+        self.assertFalse(check(Match.from_dict({"search": "headers[Server]", "text": "nginx"}))[0])
+        # a name set for two domains is not an error, cookie names are case sensitive
+        self.assertTrue(check(Match.from_dict({"search": "cookies[PHPSESSID]", "text": "abc"}))[0])
+        self.assertFalse(check(Match.from_dict({"search": "cookies[phpsessid]", "text": "abc"}))[0])
+        self.assertEqual(resp["cookie_map"], {"PHPSESSID": "abc"})
+
+
+if __name__ == "__main__":
+    unittest.main()
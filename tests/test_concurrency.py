@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+
+from src import metrics
+from src.concurrency import AdaptiveConcurrency, Sample
+from src.scheduler import HostScheduler
+
+
+def sample(requests=20, congested=0, latency=0.1, cpu=0.2, network=True, match=True):
+    return Sample(requests, congested, latency, cpu, network, match)
+
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+    def test_network(self):
+        controller = AdaptiveConcurrency(HostScheduler(), initial=4, max_network=20)
+        # slow start, then halved on timeouts and increased by one
+        self.assertEqual(controller.step(sample())[0], 8)
+        self.assertEqual(controller.step(sample())[0], 16)
+        self.assertEqual(controller.step(sample(congested=5))[0], 8)
+        self.assertEqual(controller.step(sample())[0], 9)
+        # not at the limit, nothing to gain
+        self.assertEqual(controller.step(sample(network=False))[0], 9)
+        # latency over twice the baseline
+        self.assertEqual(controller.step(sample(latency=0.5))[0], 4)
+        # too few requests to judge
+        self.assertEqual(controller.step(sample(requests=3, congested=3))[0], 4)
+        self.assertEqual(controller.step(sample(requests=7))[0], 2)
+        for _ in range(30):
+            controller.step(sample())
+        self.assertEqual(controller.network, 20)
+        self.assertEqual(controller.peak_network, 20)
+
+    def test_match(self):
+        controller = AdaptiveConcurrency(HostScheduler(), initial=8, max_network=10)
+        self.assertEqual(controller.step(sample(cpu=0.95))[1], 6)
+        self.assertEqual(controller.step(sample(cpu=0.5))[1], 7)
+        self.assertEqual(controller.step(sample(cpu=0.5, match=False))[1], 7)
+        for _ in range(10):
+            controller.step(sample(cpu=1.0))
+        self.assertEqual(controller.match, 1)
+
+    def test_run(self):
+        metrics.REGISTRY.reset()
+        scheduler = HostScheduler(max_in_flight=32)
+        controller = AdaptiveConcurrency(scheduler, initial=1, max_network=4, max_match=2,
+                                         interval=0.02, min_samples=1)
+        lock = threading.Lock()
+        running, peak = 0, 0
+
+        def task():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.01)
+            metrics.REQUESTS.inc(method="GET", status=200)
+            metrics.REQUEST_SECONDS.observe(0.01, method="GET")
+            with lock:
+                running -= 1
+        for _ in range(60):
+            scheduler.submit("a", task)
+        with controller:
+            scheduler.run(controller.max_threads)
+        self.assertGreater(controller.peak_network, 1)
+        self.assertLessEqual(peak, 4)
+        self.assertEqual(metrics.CONCURRENCY.value(kind="network"), controller.network)
+        self.assertEqual(metrics.stats()["match_limit"], controller.match)
+
+
+if __name__ == "__main__":
+    unittest.main()
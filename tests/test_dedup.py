@@ -0,0 +1,81 @@
+import unittest
+
+from src import metrics
+from src.batch import BatchSniffer
+from src.core import Component
+from src.dedup import ResultCache, is_passive, response_fingerprint
+from src.offline import ResponseStore
+
+PARKED = b"<html><head><title>Parked</title><meta name=\"generator\" content=\"WordPress 5.4.2\"></head></html>"
+RULES = (
+    {"name": "Nginx", "matches": [{"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]},
+    {"name": "WordPress", "matches": [{"search": "meta[generator]", "regexp": r"WordPress ([\d.]+)", "offset": 0}]},
+    {"name": "Admin", "matches": [{"url": "/admin", "status": 403}]},
+)
+
+
+def make_store() -> ResponseStore:
+    store = ResponseStore()
+    for host, date in (("a.com", "Mon, 01 Jun 2020 00:00:00 GMT"), ("b.com", "Tue, 02 Jun 2020 00:00:00 GMT")):
+        store.add("http://%s/" % host, 200, [("Server", "nginx/1.18.0"), ("Date", date)], PARKED)
+    store.add("http://a.com/admin", 403, [], b"no")
+    store.add("http://c.com/", 200, [("Server", "nginx/1.18.0")], b"<html><title>Other</title></html>")
+    return store
+
+
+class DedupTest(unittest.TestCase):
+    def test_fingerprint(self):
+        store = make_store()
+        a, b, c = (store.response("http://%s/" % h) for h in ("a.com", "b.com", "c.com"))
+        self.assertEqual(response_fingerprint(a), response_fingerprint(b))
+        self.assertNotEqual(response_fingerprint(a), response_fingerprint(c))
+        store.add("http://d.com/", 200, [("Server", "nginx/1.18.0"), ("Date", "x"), ("X-Powered-By", "PHP")], PARKED)
+        self.assertNotEqual(response_fingerprint(a), response_fingerprint(store.response("http://d.com/")))
+
+    def test_is_passive(self):
+        passive = [is_passive(Component.from_dict(r)) for r in RULES]
+        self.assertEqual(passive, [True, True, False])
+        # the values of the cookies and volatile headers are not in the fingerprint
+        for search in ("cookies", "cookies[PHPSESSID]", "headers", "headers[Set-Cookie]", "all"):
+            component = Component.from_dict({"name": "S", "matches": [{"search": search, "text": "x"}]})
+            self.assertFalse(is_passive(component), search)
+
+    def test_lru(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", [])
+        cache.put("b", [])
+        cache.get("a")
+        cache.put("c", [])
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def scan(self, dedup: bool):
+        batch = BatchSniffer([], "", components=[Component.from_dict(r) for r in RULES])
+        batch.store = make_store()
+        batch.options = {"aggression": True}
+        if not dedup:
+            batch.result_cache = None
+        results = {}
+        # one target per run, so the first one is finished before the next starts
+        for target in ("http://a.com/", "http://b.com/", "http://c.com/"):
+            batch.targets = [target]
+            results.update(batch.start())
+        return results
+
+    def test_batch(self):
+        metrics.REGISTRY.reset()
+        results = self.scan(dedup=True)
+        self.assertEqual(metrics.CACHE.value(cache="passive", result="hit"), 1)
+        self.assertEqual(metrics.CACHE.value(cache="passive", result="miss"), 2)
+        self.assertEqual(results, self.scan(dedup=False))
+        self.assertEqual(results["http://b.com/"][2:], [
+            {"name": "Nginx", "version": "1.18.0"},
+            {"name": "WordPress", "version": "5.4.2"},
+        ])
+        # the aggressive check still runs on every target
+        self.assertIn({"name": "Admin"}, results["http://a.com/"])
+
+
+if __name__ == "__main__":
+    unittest.main()
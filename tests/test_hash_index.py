@@ -0,0 +1,40 @@
+import unittest
+
+from src.core import Component
+from src.hash_index import HashIndex
+
+
+class HashIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.favicon = Component.from_dict({"name": "Favicon", "matches": [
+            {"url": "/favicon.ico", "md5": "BEB816A701A4CEE3C2F586171458CEEC"},
+            {"url": "/favicon.ico", "mmh3": "-1277324294", "version": "2.0"},
+        ]})
+        self.mixed = Component.from_dict({"name": "Mixed", "matches": [
+            {"url": "/favicon.ico", "md5": "beb816a701a4cee3c2f586171458ceec"},
+            {"text": "mixed"},
+        ]})
+        self.cond = Component.from_dict({"name": "Cond", "condition": "0 and 1", "matches": [
+            {"url": "/a.png", "md5": "00000000000000000000000000000000"},
+            {"url": "/b.png", "md5": "11111111111111111111111111111111"},
+        ]})
+        self.index = HashIndex.build([self.favicon, self.mixed, self.cond])
+
+    def test_build(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertTrue(self.index.resolves(self.favicon))
+        self.assertFalse(self.index.resolves(self.mixed))
+        self.assertFalse(self.index.resolves(self.cond))
+        self.assertTrue(self.index.needs("/favicon.ico", "mmh3"))
+        self.assertFalse(self.index.needs("/a.png", "mmh3"))
+
+    def test_lookup(self):
+        hits = self.index.lookup("/favicon.ico", {
+            "md5": "beb816a701a4cee3c2f586171458ceec", "mmh3": -1277324294})
+        self.assertEqual([c.name for c, _ in hits], ["Favicon", "Mixed", "Favicon"])
+        self.assertEqual(self.index.lookup("/favicon.ico", {"md5": None}), [])
+        self.assertEqual(self.index.lookup("/missing", {"md5": "x"}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from src.batch import BatchSniffer
+from src.journal import ScanJournal
+
+
+class ScanJournalTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_record_load(self):
+        journal = ScanJournal(self.path)
+        journal.record("http://a", [{"name": "Nginx"}])
+        journal.record("http://b", [])
+        journal = ScanJournal(self.path)
+        self.assertEqual(len(journal), 2)
+        self.assertIn("http://a", journal)
+        self.assertEqual(journal.get("http://a"), [{"name": "Nginx"}])
+
+    def test_broken_line(self):
+        journal = ScanJournal(self.path)
+        journal.record("http://a", [])
+        with open(self.path, "a") as f:
+            f.write('{"target": "http://b", "resu')
+        journal = ScanJournal(self.path)
+        self.assertEqual(len(journal), 1)
+        journal.record("http://c", [])
+        journal = ScanJournal(self.path)
+        self.assertEqual(list(journal.load()), ["http://a", "http://c"])
+
+    def test_batch_skips_finished(self):
+        journal = ScanJournal(self.path)
+        journal.record("http://127.0.0.1:1/", [{"name": "Done"}])
+        batch = BatchSniffer(["http://127.0.0.1:1/"], "", components=[])
+        batch.journal = journal
+        results = batch.start()
+        self.assertEqual(results["http://127.0.0.1:1/"], [{"name": "Done"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
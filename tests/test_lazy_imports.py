@@ -0,0 +1,27 @@
+import subprocess
+import sys
+import unittest
+
+
+def loaded_modules(stmt, modules):
+    code = "import sys; %s; print(' '.join(m for m in %r if m in sys.modules))" % (
+        stmt, modules)
+    out = subprocess.run([sys.executable, "-c", code],
+                         stdout=subprocess.PIPE, check=True)
+    return out.stdout.decode().split()
+
+
+class LazyImportsTest(unittest.TestCase):
+    def test_sniffer_import(self):
+        self.assertEqual(loaded_modules("import src.component_sniffer",
+                                        ("pymysql", "bs4", "html5lib", "pypinyin", "socks")), [])
+
+    def test_no_patch_on_import(self):
+        code = "import src.component_sniffer, requests; print(requests.Session.request.__module__)"
+        out = subprocess.run([sys.executable, "-c", code],
+                             stdout=subprocess.PIPE, check=True)
+        self.assertEqual(out.stdout.decode().strip(), "requests.sessions")
+
+
+if __name__ == "__main__":
+    unittest.main()
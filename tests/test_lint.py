@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.core import KEYED_SEARCH_LOCATIONS, SEARCH_LOCATIONS, parse_search
+from src.lint import ERROR, WARNING, RuleLinter, lint_directory, regexp_problems
+
+
+def messages(linter, level=None):
+    return [i.message for i in linter.issues if level is None or i.level == level]
+
+
+class RuleLinterTest(unittest.TestCase):
+    def lint(self, *components):
+        linter = RuleLinter()
+        for i, info in enumerate(components):
+            linter.lint_dict(info, "%d.json" % i)
+        return linter.finish()
+
+    def test_valid(self):
+        linter = self.lint({"name": "A", "type": "cms", "matches": [{"text": "abc"}, {"regexp": r"ver (\d+)", "offset": 0}],
+                            "condition": "0 and 1"})
+        self.assertEqual(linter.issues, [])
+
+    def test_schema(self):
+        linter = self.lint({"type": "cms", "matches": [], "foo": 1},
+                           {"name": "B", "type": "cms", "matches": [{"search": "header[x]", "text": "y"}, {"url": "/x"},
+                                                                    {"md5": "xyz", "status": "200"}]})
+        self.assertIn("missing required field 'name'", messages(linter, ERROR))
+        self.assertIn("missing required field 'matches'", messages(linter, ERROR))
+        self.assertIn("unknown field 'foo'", messages(linter, WARNING))
+        self.assertIn("match 0: unknown search 'header[x]', it is searched as 'body'", messages(linter, ERROR))
+        self.assertIn("match 1 has nothing to check, it is never true", messages(linter, ERROR))
+        self.assertIn("match 2: 'md5' is not a md5 hex digest", messages(linter, ERROR))
+        self.assertIn("match 2: 'status' should be an integer", messages(linter, WARNING))
+
+    def test_searches(self):
+        # the linter agrees with the engine
+        searches = list(SEARCH_LOCATIONS) + ["%s[x]" % k for k in KEYED_SEARCH_LOCATIONS] + ["header[x]"]
+        for search in searches:
+            linter = self.lint({"name": "A", "type": "cms", "matches": [{"search": search, "text": "y"}]})
+            unknown = any("unknown search" in m for m in messages(linter, ERROR))
+            self.assertEqual(unknown, parse_search(search)[0] == "body" and search != "body", search)
+        self.assertIn("meta", SEARCH_LOCATIONS)
+
+    def test_regexp_condition(self):
+        linter = self.lint({"name": "A", "type": "cms", "matches": [{"regexp": "x("}, {"regexp": r"v(\d)", "offset": 2}],
+                            "condition": "0 and 5"},
+                           {"name": "B", "type": "cms", "matches": [{"text": "a"}, {"text": "b"}], "condition": "0 or"},
+                           {"name": "C", "type": "cms", "matches": [{"text": "a"}, {"text": "b"}], "condition": "not 1"})
+        errors = messages(linter, ERROR)
+        self.assertTrue(any(m.startswith("match 0: regexp 'x(' can't be compiled") for m in errors))
+        self.assertIn("condition '0 and 5' is invalid: 5 does not exists", errors)
+        self.assertIn('condition \'0 or\' is invalid: invalid condition "0 or"', errors)
+        self.assertIn("match 1: 'offset' 2 is out of the 1 groups of the regexp", messages(linter, WARNING))
+        self.assertIn("matches 0 are not used by the condition", messages(linter, WARNING))
+
+    def test_names(self):
+        linter = self.lint({"name": "A", "type": "cms", "matches": [{"text": "a"}], "implies": ["PHP", "A"]},
+                           {"name": "A", "type": "cms", "matches": [{"text": "b"}], "excludes": "B"},
+                           {"name": "B", "type": "cms", "matches": [{"text": "c"}]})
+        warnings = messages(linter, WARNING)
+        self.assertIn("duplicate name, also in '0.json'", warnings)
+        self.assertIn("'implies' refers to unknown component 'PHP'", warnings)
+        self.assertIn("'implies' refers to itself", warnings)
+        self.assertEqual(len(warnings), 3)
+
+    def test_cost(self):
+        self.assertEqual(regexp_problems("(a+)+b"), ["nested repeats may backtrack"])
+        self.assertEqual(regexp_problems(".*ver"), ["leading wildcard"])
+        self.assertEqual(regexp_problems(r"ver\d+"), [])
+        linter = self.lint({"name": "Remote", "type": "cms", "matches": [{"url": "/readme.html", "text": "WordPress"}]},
+                           {"name": "Slow", "type": "cms", "matches": [{"search": "all", "regexp": "(\\w+\\s?)*x"}]},
+                           {"name": "Cheap", "type": "cms", "matches": [{"search": "headers[server]", "text": "nginx"}]},
+                           {"name": "Same", "type": "cms", "matches": [{"url": "/readme.html", "text": "Foo"}]})
+        top = linter.top_costs(3)
+        self.assertEqual([c.name for c in top], ["Remote", "Same", "Slow"])
+        self.assertEqual(top[0].urls, ("/readme.html",))
+        self.assertIn("no literal to prefilter", top[2].reasons)
+        self.assertIn("searches the raw response", top[2].reasons)
+        self.assertEqual(linter.urls, {"/readme.html"})
+
+    def test_directory(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, "a.json"), "w") as f:
+                json.dump({"name": "A", "type": "cms", "matches": [{"text": "a"}]}, f)
+            with open(os.path.join(directory, "b.json"), "w") as f:
+                f.write("{broken")
+            linter = lint_directory(directory)
+            self.assertEqual(linter.files, 2)
+            self.assertEqual(len(linter.errors), 1)
+            self.assertTrue(linter.errors[0].message.startswith("invalid JSON"))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.core import ComponentGeneratorMixin
+from src.loader import LoadStats, iter_directory, list_files, loads
+
+
+def write(directory, path, data):
+    path = os.path.join(directory, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+
+
+class LoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for i in range(40):
+            write(self.directory, "cms/c%02d.json" % i, {"name": "C%02d" % i, "matches": [{"text": "c%d" % i}]})
+        write(self.directory, "a.json", {"name": "A", "matches": [{"regexp": r"a(\d)", "offset": 0}]})
+        write(self.directory, "tests/t.json", {"name": "Test", "matches": [{"text": "t"}]})
+        write(self.directory, "README.md", "not a component")
+        write(self.directory, "broken.json", "{")
+        write(self.directory, "noname.json", {"matches": []})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_list_files(self):
+        paths = [os.path.relpath(p, self.directory) for p in list_files(self.directory)]
+        self.assertEqual(paths[:3], ["a.json", "broken.json", os.path.join("cms", "c00.json")])
+        self.assertEqual(len(paths), 43)
+        self.assertNotIn(os.path.join("tests", "t.json"), paths)
+
+    def test_iter_directory(self):
+        expected = ["A"] + ["C%02d" % i for i in range(40)]
+        for workers in (1, 3, 8):
+            stats = LoadStats()
+            names = [c.name for c, _ in iter_directory(self.directory, max_workers=workers, stats=stats)]
+            self.assertEqual(names, expected)
+            self.assertEqual((stats.files, stats.loaded), (43, 41))
+            self.assertEqual(sorted(os.path.basename(p) for p, _ in stats.failed), ["broken.json", "noname.json"])
+        # stopped early
+        it = iter_directory(self.directory, max_workers=2)
+        self.assertEqual(next(it)[0].name, "A")
+        it.close()
+
+    def test_mixin(self):
+        loader = ComponentGeneratorMixin()
+        loader.directory = self.directory
+        self.assertEqual(len(loader.load_components()), 41)
+        self.assertEqual(loader.load_stats.loaded, 41)
+
+    def test_loads(self):
+        self.assertEqual(loads(b'{"a": [1, "\\u4e2d"]}'), {"a": [1, "中"]})
+        self.assertEqual(loads(b'{"a": Infinity}'), {"a": float("inf")})
+        with self.assertRaises(ValueError):
+            loads(b"{")
+
+
+if __name__ == "__main__":
+    unittest.main()
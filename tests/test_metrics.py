@@ -0,0 +1,111 @@
+import io
+import json
+import threading
+import time
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import metrics
+from src.core import RequestManagerMixin
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "5")
+        self.end_headers()
+        self.wfile.write(b"hello")
+
+
+class SlowHandler(PageHandler):
+    def do_GET(self):
+        time.sleep(0.3)
+        super().do_GET()
+
+
+class MetricsTest(unittest.TestCase):
+    def test_render(self):
+        registry = metrics.Registry()
+        counter = registry.counter("t_total", "Test", ("kind", "result"))
+        counter.inc(kind="a", result="hit")
+        counter.inc(2, kind="b", result="hit")
+        counter.inc(kind="b", result="miss")
+        self.assertEqual(counter.value(), 4)
+        self.assertEqual(counter.value(result="hit"), 3)
+        self.assertEqual(counter.value(kind="b", result="miss"), 1)
+        hist = registry.histogram("t_seconds", "Test", buckets=(0.1, 1))
+        for v in (0.05, 0.5, 5):
+            hist.observe(v)
+        self.assertEqual(hist.count(), (3, 5.55))
+        text = registry.render()
+        self.assertIn('t_total{kind="b",result="hit"} 2\n', text)
+        self.assertIn('t_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('t_seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('t_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn("t_seconds_count 3\n", text)
+        self.assertIn("# TYPE t_seconds histogram\n", text)
+
+    def test_request_metrics(self):
+        page = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        threading.Thread(target=page.serve_forever, daemon=True).start()
+        httpd = metrics.serve_metrics("127.0.0.1", 0)
+        try:
+            reqm = RequestManagerMixin()
+            reqm.headers = {}
+            reqm.allow_redirect = True
+            reqm.request_manager_history = {}
+            before = metrics.stats()
+            url = "http://127.0.0.1:%d/" % page.server_port
+            reqm.request(url)
+            reqm.request(url)
+            after = metrics.stats()
+            self.assertEqual(after["requests"] - before["requests"], 1)
+            self.assertEqual(after["bytes"] - before["bytes"], 5)
+            self.assertEqual(after["in_flight"], 0)
+            self.assertGreaterEqual(metrics.CACHE.value(cache="request", result="hit"), 1)
+            with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % httpd.server_port) as resp:
+                text = resp.read().decode()
+            self.assertIn('webhunt_requests_total{method="GET",status="200"}', text)
+            self.assertIn("webhunt_request_seconds_bucket", text)
+        finally:
+            page.shutdown()
+            page.server_close()
+            httpd.shutdown()
+            httpd.server_close()
+
+    def test_in_flight_before_headers(self):
+        page = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        threading.Thread(target=page.serve_forever, daemon=True).start()
+        try:
+            reqm = RequestManagerMixin()
+            reqm.headers = {}
+            reqm.allow_redirect = True
+            reqm.request_manager_history = {}
+            before = metrics.IN_FLIGHT.value()
+            _t = threading.Thread(target=reqm.request, args=("http://127.0.0.1:%d/" % page.server_port,))
+            _t.start()
+            time.sleep(0.1)
+            # waiting for the headers
+            self.assertEqual(metrics.IN_FLIGHT.value() - before, 1)
+            _t.join()
+            self.assertEqual(metrics.IN_FLIGHT.value(), before)
+        finally:
+            page.shutdown()
+            page.server_close()
+
+    def test_stats_lines(self):
+        stream = io.StringIO()
+        with metrics.StatsReporter(interval=0.05, progress=True, stream=stream):
+            time.sleep(0.12)
+        lines = stream.getvalue().splitlines()
+        # no bar without a terminal
+        self.assertGreaterEqual(len(lines), 2)
+        self.assertIn("req_per_sec", json.loads(lines[-1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import base64
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from src.core import Component
+from src.offline import (OfflineSniffer, ResponseStore, dechunk, normalize_url,
+                         parse_http_response)
+
+PAGE = b"<html><head><title>Demo</title><meta name=\"generator\" content=\"WordPress 5.4.2\"></head></html>"
+
+
+class OfflineTest(unittest.TestCase):
+    def test_parse_http_response(self):
+        body = gzip.compress(PAGE)
+        raw = (b"HTTP/1.1 100 Continue\r\n\r\n"
+               b"HTTP/1.1 200 OK\r\nServer: nginx\r\nContent-Encoding: gzip\r\n"
+               b"Transfer-Encoding: chunked\r\n\r\n"
+               + b"%x\r\n%s\r\n%x\r\n%s\r\n0\r\n\r\n" % (5, body[:5], len(body) - 5, body[5:]))
+        status, headers, content = parse_http_response(raw)
+        self.assertEqual(status, 200)
+        self.assertIn(("Server", "nginx"), headers)
+        self.assertEqual(content, PAGE)
+        self.assertIsNone(parse_http_response(b"not http"))
+        self.assertEqual(dechunk(b"3\r\nabc\r\n5\r\nde"), b"abcde")
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url("HTTP://Example.com#top"), "http://example.com/")
+        self.assertEqual(normalize_url("http://a.com/x?y=1"), "http://a.com/x?y=1")
+
+    def test_har_scan(self):
+        entries = [{
+            "request": {"url": "http://example.com/"},
+            "response": {"status": 200,
+                         "headers": [{"name": "Server", "value": "nginx/1.18.0"},
+                                     {"name": "Set-Cookie", "value": "PHPSESSID=1; path=/"}],
+                         "content": {"text": base64.b64encode(PAGE).decode(), "encoding": "base64"}},
+            "serverIPAddress": "10.0.0.1",
+        }, {
+            "request": {"url": "http://example.com/admin"},
+            "response": {"status": 403, "headers": [], "content": {"text": "no"}},
+        }]
+        fd, path = tempfile.mkstemp(suffix=".har")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"log": {"entries": entries}}, f)
+        try:
+            store = ResponseStore.load(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(store.targets(), ["http://example.com/"])
+        components = [Component.from_dict(c) for c in (
+            {"name": "Nginx", "matches": [{"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]},
+            {"name": "WordPress", "matches": [{"search": "meta[generator]", "regexp": r"WordPress ([\d.]+)", "offset": 0}]},
+            {"name": "PHP", "matches": [{"search": "cookies[PHPSESSID]", "regexp": r"\w+"}]},
+            {"name": "Admin", "matches": [{"url": "/admin", "status": 403}]},
+        )]
+        sniffer = OfflineSniffer("http://example.com", "", store, components=components)
+        sniffer.aggression = True
+        results = sniffer.start()
+        self.assertEqual(results[0], {"name": "title", "title": "Demo"})
+        self.assertEqual(results[1], {"name": "ip", "ips": ["10.0.0.1"]})
+        self.assertEqual(results[2:], [
+            {"name": "Nginx", "version": "1.18.0"},
+            {"name": "WordPress", "version": "5.4.2"},
+            {"name": "PHP"},
+            {"name": "Admin"},
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
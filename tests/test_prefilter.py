@@ -0,0 +1,74 @@
+import unittest
+
+from src.core import Component, build_response
+from src.prefilter import LiteralIndex, fold, regexp_literal
+
+
+def make_resp(body, headers=""):
+    return {
+        "raw_response": headers + body,
+        "title": "",
+        "raw_cookies": "",
+        "script": [],
+        "meta": {},
+    }
+
+
+class RegexpLiteralTest(unittest.TestCase):
+    def test_regexp_literal(self):
+        self.assertEqual(regexp_literal(r"wp-content/themes/(\w+)"), "wp-content/themes/")
+        self.assertEqual(regexp_literal(r"nginx/([\d.]+)"), "nginx/")
+        self.assertEqual(regexp_literal(r"(?:powered by )+discuz"), "powered by ")
+        self.assertEqual(regexp_literal(r"(?:abc)?de"), "de")
+        self.assertIsNone(regexp_literal(r"abc|xyz"))
+        self.assertIsNone(regexp_literal(r"[a-z]+"))
+        self.assertIsNone(regexp_literal(r"(unclosed"))
+
+    def test_fold(self):
+        self.assertEqual(fold("X-Powered-By: PHP"), "x-powered-by: php")
+        self.assertIn(fold("session"), fold("ſESSION"))
+
+
+class LiteralIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.wordpress = Component.from_dict({"name": "WordPress", "matches": [
+            {"regexp": "wp-content/themes/(\\w+)", "offset": 0},
+            {"text": "wp-includes"},
+        ]})
+        self.php = Component.from_dict({"name": "PHP", "matches": [
+            {"search": "headers", "regexp": "X-Powered-By: PHP/?([\\d.]+)?"}]})
+        self.status = Component.from_dict({"name": "Status", "matches": [{"status": 403}]})
+        self.negated = Component.from_dict({"name": "Negated", "condition": "0 and not 1", "matches": [
+            {"text": "aaaa"}, {"text": "bbbb"}]})
+        self.remote = Component.from_dict({"name": "Remote", "matches": [
+            {"url": "/readme.html", "text": "WordPress"}, {"text": "remote-only"}]})
+        self.index = LiteralIndex.build(
+            [self.wordpress, self.php, self.status, self.negated, self.remote])
+
+    def test_candidates(self):
+        resp = make_resp("<link href='/WP-CONTENT/themes/x/a.css'>",
+                         "Server: nginx\nX-Powered-By: PHP/7.4\n")
+        ids = self.index.candidates(resp)
+        self.assertIn(id(self.wordpress), ids)
+        self.assertIn(id(self.php), ids)
+        self.assertIn(id(self.status), ids)
+        self.assertIn(id(self.negated), ids)
+        self.assertNotIn(id(self.remote), ids)
+        self.assertIn(id(self.remote), self.index.candidates(resp, aggression=True))
+
+    def test_no_candidates(self):
+        ids = self.index.candidates(make_resp("<html>hello</html>"))
+        self.assertEqual(ids, {id(self.status), id(self.negated)})
+
+    def test_locations(self):
+        self.assertEqual(self.index.locations, {"body", "headers"})
+        body = LiteralIndex.build([self.wordpress])
+        resp = build_response("http://a/", 200, {"Server": "nginx"}, b"<html><title>x</title>wp-includes</html>", {})
+        self.assertIn(id(self.wordpress), body.candidates(resp))
+        # the rules never search them, neither parsed nor joined
+        for field in ("title", "script", "meta", "raw_headers", "raw_cookies"):
+            self.assertNotIn(field, resp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import gc
+import unittest
+
+from src.batch import BatchSniffer
+from src.core import Component
+from src.offline import ResponseStore
+from src.prefork import Prefork, can_fork, shard_targets, share
+
+NGINX = {"name": "Nginx", "matches": [{"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]}
+
+
+@unittest.skipUnless(can_fork(), "needs fork")
+class PreforkTest(unittest.TestCase):
+    def tearDown(self):
+        gc.unfreeze()
+        gc.enable()
+
+    def test_shard_targets(self):
+        targets = ["http://h%d.com/%s" % (i % 5, p) for i in range(20) for p in ("", "x")]
+        shards = shard_targets(targets, 3)
+        self.assertEqual(sorted(t for s in shards for t in s), sorted(targets))
+        # every host in one shard
+        hosts = [{t.split("/")[2] for t in s} for s in shards]
+        self.assertEqual(sum(len(h) for h in hosts), 5)
+
+    def test_items(self):
+        items = list(Prefork(3).start(lambda index, emit: [emit(index, i) for i in range(index + 1)]).items())
+        self.assertEqual(sorted(items), [(0, 0), (1, 0), (1, 1), (2, 0), (2, 1), (2, 2)])
+
+    def test_failed_child(self):
+        def run(index, emit):
+            if index == 1:
+                raise RuntimeError("boom")
+            emit(index)
+        prefork = Prefork(2).start(run)
+        self.assertEqual(list(prefork.items()), [(0,)])
+        self.assertEqual(prefork.join(), 1)
+
+    def test_scan(self):
+        store = ResponseStore()
+        for i in range(6):
+            store.add("http://h%d.com/" % i, 200, [("Server", "nginx/1.%d" % i)], b"<html></html>")
+        batch = BatchSniffer(store.targets(), "", components=[Component.from_dict(NGINX)])
+        batch.store = store
+        share(batch)
+        self.assertGreater(gc.get_freeze_count(), 0)
+        shards = shard_targets(batch.targets, 2)
+
+        def run(index, emit):
+            batch.targets = shards[index]
+            batch.on_result = emit
+            batch.start()
+        results = dict(Prefork(2).start(run).items())
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results["http://h3.com/"][-1], {"name": "Nginx", "version": "1.3"})
+
+    def test_scan_by_host(self):
+        store = ResponseStore()
+        for i in range(24):
+            store.add("http://h%d.com:%d/p%d" % (i % 6, 8000 + i % 4, i), 200, [("Server", "nginx/1.0")], b"")
+        batch = BatchSniffer(store.targets(), "", components=[Component.from_dict(NGINX)])
+        batch.store = store
+        share(batch)
+        shards = shard_targets(batch.targets, 3)
+
+        def run(index, emit):
+            batch.targets = shards[index]
+            batch.on_result = lambda target, results: emit(target, index)
+            batch.start()
+        # every child scans all the targets of its hosts, and only those
+        scanned = dict(Prefork(3).start(run).items())
+        self.assertEqual(sorted(scanned), sorted(store.targets()))
+        children = {}
+        for target, index in scanned.items():
+            children.setdefault(target.split("/")[2], set()).add(index)
+        self.assertEqual(len(children), 12)
+        self.assertTrue(all(len(c) == 1 for c in children.values()), children)
+
+
+if __name__ == "__main__":
+    unittest.main()
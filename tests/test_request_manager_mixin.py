@@ -1,7 +1,51 @@
+import socket
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Dict
 
-from src.core import RequestManagerMixin, fake_user_agent, plain2md5
+from src import metrics
+from src.batch import BatchSniffer
+from src.core import Component, DeadlineExceeded, RequestManagerMixin
+from src.utils import fake_user_agent, plain2md5
+
+FAVICON = b"\x00\x00\x01\x00" * 64
+
+
+class FaviconHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(FAVICON)))
+        self.end_headers()
+        self.wfile.write(FAVICON)
+
+
+class DripHandler(BaseHTTPRequestHandler):
+    """Sends a byte every 0.1s of a long body, a tarpit
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "100000")
+        self.end_headers()
+        try:
+            for _ in range(50):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.1)
+        except OSError:
+            pass
 
 
 class RequestManagerMixinTest(unittest.TestCase):
@@ -28,6 +72,91 @@ class RequestManagerMixinTest(unittest.TestCase):
             "https://www.baidu.com")]
         self.assertIsInstance(resp, Dict)
 
+    def test_probe(self):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), FaviconHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%d/favicon.ico" % httpd.server_port
+        try:
+            resp = self.reqm.probe(url)
+            self.assertEqual(resp["status"], 200)
+            self.assertEqual(resp["md5"], plain2md5(FAVICON))
+            self.assertNotIn("body", resp)
+            resp = self.reqm.probe(url, head=True)
+            self.assertEqual(resp["status"], 200)
+            self.assertIsNone(resp["md5"])
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+    def test_retries(self):
+        # nothing listens on the port
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        url = "http://127.0.0.1:%d/" % sock.getsockname()[1]
+        sock.close()
+        calls = []
+        _orig = self.reqm._timeout
+
+        def _timeout():
+            calls.append(1)
+            return _orig()
+        self.reqm._timeout = _timeout
+        self.reqm.retries = 2
+        self.reqm.retry_backoff = 0.01
+        self.assertIsNone(self.reqm.request(url))
+        self.assertEqual(len(calls), 3)
+        # the failure is cached by this manager for `failure_ttl`
+        self.assertIsNone(self.reqm.request(url))
+        self.assertIsNone(self.reqm.probe(url))
+        self.assertEqual(len(calls), 3)
+        self.assertNotIn(plain2md5(url), RequestManagerMixin.request_manager_history)
+        self.assertFalse(RequestManagerMixin()._failed_recently(plain2md5(url)))
+        self.reqm.failure_ttl = 0
+        self.assertIsNone(self.reqm.request(url))
+        self.assertEqual(len(calls), 6)
+
+    def test_dead_target(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        url = "http://127.0.0.1:%d/" % sock.getsockname()[1]
+        sock.close()
+        components = [Component.from_dict({"name": "C%d" % i, "matches": [{"regexp": "c%d ([\\d.]+)" % i}]})
+                      for i in range(20)]
+        batch = BatchSniffer([url], "", components=components)
+        batch.options = {"retries": 1, "retry_backoff": 0.01}
+        metrics.REGISTRY.reset()
+        results = batch.start()[url]
+        self.assertFalse([r for r in results if r["name"].startswith("C")])
+        # one request of the target, no component is checked
+        self.assertEqual(metrics.REQUEST_ERRORS.value(), 1)
+
+    def test_deadline(self):
+        self.reqm.deadline = time.monotonic() - 1
+        with self.assertRaises(DeadlineExceeded):
+            with self.reqm._send("GET", "http://127.0.0.1:1/"):
+                pass
+        self.assertIsNone(self.reqm.request("http://127.0.0.1:1/"))
+        self.assertIsNone(self.reqm.probe("http://127.0.0.1:1/"))
+        # a slow body is cut at the deadline
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), DripHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%d/" % httpd.server_port
+        try:
+            for method in (self.reqm.request, self.reqm.probe):
+                self.reqm.deadline = time.monotonic() + 0.5
+                start = time.monotonic()
+                self.assertIsNone(method(url))
+                self.assertLess(time.monotonic() - start, 1.5)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        # timeouts are bounded by the deadline
+        self.reqm.deadline = time.monotonic() + 5
+        self.reqm.connect_timeout = 10
+        connect, read = self.reqm._timeout()
+        self.assertLessEqual(connect, 5)
+        self.assertLessEqual(read, 5)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.server import JobStatus, ScanServer, make_handler
+
+
+class TargetHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = b"<html><title>demo</title><body>hello-webhunt</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ScanServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp.name, "demo.json"), "w") as f:
+            json.dump({"name": "Demo", "type": "cms",
+                       "matches": [{"text": "hello-webhunt"}]}, f)
+        with open(os.path.join(self.tmp.name, "title.json"), "w") as f:
+            json.dump({"name": "Title", "matches": [{"search": "title", "text": "demo"}]}, f)
+        self.target = ThreadingHTTPServer(("127.0.0.1", 0), TargetHandler)
+        threading.Thread(target=self.target.serve_forever, daemon=True).start()
+
+        self.server = ScanServer(self.tmp.name, max_jobs=2, max_threads=2)
+        self.server.start_workers()
+        self.httpd = ThreadingHTTPServer(
+            ("127.0.0.1", 0), make_handler(self.server))
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.api = "http://127.0.0.1:%d" % self.httpd.server_port
+
+    def _call(self, path, data=None):
+        req = urllib.request.Request(self.api + path)
+        if data is not None:
+            req.data = json.dumps(data).encode()
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.loads(resp.read())
+
+    def _scan(self, options):
+        status, job = self._call("/scans", options)
+        self.assertEqual(status, 202)
+        for _ in range(100):
+            _, job = self._call("/scans/%s" % job["id"])
+            if job["status"] in (JobStatus.done, JobStatus.failed):
+                break
+            time.sleep(0.1)
+        return job
+
+    def test_scan_job(self):
+        url = "http://127.0.0.1:%d/" % self.target.server_port
+        # the jobs share the components, the second one sees them unchanged
+        for _ in range(2):
+            job = self._scan({"url": url})
+            self.assertEqual(job["status"], JobStatus.done)
+            names = [r["name"] for r in job["results"]]
+            self.assertIn("Demo", names)
+            self.assertIn("Title", names)
+        job = self._scan({"url": url, "components": ["Title"]})
+        self.assertEqual([r["name"] for r in job["results"]][-1:], ["Title"])
+
+    def test_bad_job(self):
+        for options in ({"aggression": True}, {"url": "http://a/", "components": "Title"},
+                        {"url": "http://a/", "components": [1]}, {"url": "http://a/", "aggression": "yes"},
+                        {"url": "http://a/", "max_threads": 1000}, {"url": "http://a/", "headers": {"X": "1"}}):
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                self._call("/scans", options)
+            self.assertEqual(ctx.exception.code, 400)
+
+    def test_health(self):
+        status, health = self._call("/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(health["components"], 2)
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.target.shutdown()
+        self.target.server_close()
+        self.server.stop_workers()
+        self.tmp.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
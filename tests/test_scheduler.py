@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+from src.scheduler import HostScheduler
+
+
+class HostSchedulerTest(unittest.TestCase):
+    def test_round_robin(self):
+        scheduler = HostScheduler()
+        order = []
+        for i in range(3):
+            for host in ("a", "b"):
+                scheduler.submit(host, lambda h=host, i=i: order.append((h, i)))
+        scheduler.run(max_threads=1)
+        self.assertEqual(order, [("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2), ("b", 2)])
+
+    def test_max_in_flight(self):
+        scheduler = HostScheduler(max_in_flight=2)
+        lock = threading.Lock()
+        running, peak = 0, 0
+
+        def task():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+        for _ in range(8):
+            scheduler.submit("a", task)
+        scheduler.run(max_threads=6)
+        self.assertEqual(peak, 2)
+
+    def test_local_tasks_not_limited(self):
+        scheduler = HostScheduler(max_in_flight=1)
+        done = []
+        scheduler.submit("a", lambda: time.sleep(0.05))
+        for i in range(4):
+            scheduler.submit("a", lambda i=i: done.append(i), network=False)
+        scheduler.run(max_threads=2)
+        self.assertEqual(sorted(done), [0, 1, 2, 3])
+
+    def test_submit_from_task(self):
+        scheduler = HostScheduler()
+        done = []
+
+        def parent():
+            for host in ("a", "b"):
+                scheduler.submit(host, lambda h=host: done.append(h))
+        scheduler.submit("a", parent)
+        scheduler.run(max_threads=4)
+        self.assertEqual(sorted(done), ["a", "b"])
+
+    def test_global_limits(self):
+        scheduler = HostScheduler(max_in_flight=8)
+        scheduler.set_limits(2, 1)
+        lock = threading.Lock()
+        running, peaks = {True: 0, False: 0}, {True: 0, False: 0}
+
+        def task(network):
+            with lock:
+                running[network] += 1
+                peaks[network] = max(peaks[network], running[network])
+            time.sleep(0.02)
+            with lock:
+                running[network] -= 1
+        for i in range(6):
+            for host in ("a", "b"):
+                scheduler.submit(host, lambda: task(True))
+                scheduler.submit(host, lambda: task(False), network=False)
+        self.assertEqual(scheduler.saturation(), (False, False))
+        scheduler.run(max_threads=8)
+        self.assertEqual(peaks, {True: 2, False: 1})
+
+    def test_backoff(self):
+        scheduler = HostScheduler(backoff=0.1)
+        scheduler.report("a", 429)
+        start = time.monotonic()
+        scheduler.wait("a")
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        # doubled on repeats, reset after success
+        scheduler.report("a", 503)
+        self.assertAlmostEqual(scheduler._hosts["a"].backoff, 0.2)
+        scheduler.report("a", 200)
+        self.assertEqual(scheduler._hosts["a"].backoff, 0.0)
+        # Retry-After wins
+        scheduler.report("b", 429, {"retry-after": "0.05"})
+        self.assertLessEqual(scheduler._hosts["b"].backoff_until - time.monotonic(), 0.05)
+
+    def test_rate(self):
+        scheduler = HostScheduler(rate=20)
+        start = time.monotonic()
+        for _ in range(3):
+            scheduler.wait("a")
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
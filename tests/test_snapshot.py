@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from src.batch import BatchSniffer
+from src.core import Component
+from src.offline import ResponseStore
+from src.snapshot import SnapshotStore, component_digest
+
+TARGET = "http://example.com/"
+
+
+def components(*rules):
+    return [Component.from_dict(r) for r in rules]
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ResponseStore()
+        self.store.add(TARGET, 200, [("Server", "nginx/1.18.0")], b"<title>Demo</title>hello")
+        self.store.add(TARGET + "admin", 403, [], None)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def scan(self, rules, rescan=False, targets=(TARGET,), **options):
+        batch = BatchSniffer(list(targets), "", components=components(*rules))
+        batch.options = {"aggression": True, **options}
+        batch.snapshots = SnapshotStore(self.path)
+        if rescan:
+            return {t: r[2:] for t, r in batch.rescan().items()}
+        batch.store = self.store
+        return {t: r[2:] for t, r in batch.start().items()}
+
+    def test_digest(self):
+        a, b = components({"name": "A", "matches": [{"text": "a"}]},
+                          {"name": "A", "matches": [{"text": "b"}]})
+        self.assertNotEqual(component_digest(a), component_digest(b))
+        self.assertEqual(component_digest(a), component_digest(components(a.to_dict())[0]))
+
+    def test_save_ruleset_threads(self):
+        store = SnapshotStore(self.path)
+        # a new ruleset every round, all the threads write it at once
+        rounds = [components({"name": "R%d" % i, "matches": [{"text": "r"}]}) for i in range(30)]
+        barrier = threading.Barrier(8)
+        errors = []
+
+        def save():
+            for rules in rounds:
+                barrier.wait()
+                try:
+                    store.save_ruleset(rules)
+                except Exception as err:
+                    errors.append(err)
+        threads = [threading.Thread(target=save) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, "rulesets"))),
+                         sorted(store.save_ruleset(rules) + ".json" for rules in rounds))
+
+    def test_rescan(self):
+        nginx = {"name": "Nginx", "matches": [{"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]}
+        hello = {"name": "Hello", "matches": [{"text": "hello"}]}
+        admin = {"name": "Admin", "matches": [{"url": "/admin", "status": 403}]}
+        self.assertEqual(self.scan([nginx, hello, admin])[TARGET],
+                         [{"name": "Nginx", "version": "1.18.0"}, {"name": "Hello"}, {"name": "Admin"}])
+        # changed, removed and new components, the responses come from the snapshot
+        changed = {"name": "Hello", "matches": [{"text": "bye"}]}
+        title = {"name": "Title", "matches": [{"search": "title", "text": "Demo"}]}
+        self.assertEqual(self.scan([nginx, changed, title], rescan=True)[TARGET],
+                         [{"name": "Nginx", "version": "1.18.0"}, {"name": "Title"}])
+        snapshots = SnapshotStore(self.path)
+        entry = snapshots.journal.entry(TARGET)
+        self.assertEqual(len(snapshots.load_ruleset(entry["ruleset"])), 3)
+        self.assertEqual(len(entry["hits"]), 2)
+        # the HEAD only response is kept
+        sniffer = snapshots.make_sniffer(TARGET, "", [])
+        self.assertEqual(sniffer.probe(TARGET + "admin"), {"url": TARGET + "admin", "status": 403, "md5": None})
+
+    def test_rescan_skipped_components(self):
+        hello = {"name": "Hello", "matches": [{"text": "hello"}]}
+        missing = {"name": "Missing", "matches": [{"text": "definitely-not-here"}]}
+        self.assertEqual(self.scan([hello, missing])[TARGET], [{"name": "Hello"}])
+        # the prefilter skips `Missing`, it isn't recorded as checked
+        snapshots = SnapshotStore(self.path)
+        ruleset = snapshots.load_ruleset(snapshots.journal.entry(TARGET)["ruleset"])
+        self.assertEqual(ruleset, {component_digest(c) for c in components(hello)})
+        self.assertEqual(self.scan([hello, missing], rescan=True)[TARGET], [{"name": "Hello"}])
+
+    def test_rescan_dead_target(self):
+        dead = "http://dead.example.com/"
+        hello = {"name": "Hello", "matches": [{"text": "hello"}]}
+        results = self.scan([hello], targets=[TARGET, dead])
+        self.assertEqual(results[dead], [])
+        self.assertIsNone(SnapshotStore(self.path).journal.entry(dead))
+        # the dead target has no snapshot, the rescan skips it
+        self.assertEqual(self.scan([hello], rescan=True, targets=[TARGET, dead]),
+                         {TARGET: [{"name": "Hello"}]})
+
+    def test_rescan_deadline(self):
+        hello = {"name": "Hello", "matches": [{"text": "hello"}]}
+        self.scan([hello], target_timeout=1e-9)
+        snapshots = SnapshotStore(self.path)
+        self.assertIsNone(snapshots.journal.entry(TARGET))
+        self.assertEqual(os.listdir(os.path.join(self.path, "rulesets")), [])
+        self.assertEqual(self.scan([hello], rescan=True), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.offline import ResponseStore
+from src.snapshot_file import SnapshotFile
+
+
+class SnapshotFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "responses.snap")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_write(self):
+        snap = SnapshotFile(self.path)
+        snap["http://a/"] = (200, [("Server", "nginx"), ("Set-Cookie", "a=1")], b"hello")
+        snap["http://a/head"] = (403, [], None)
+        status, headers, body = snap["http://a/"]
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, [("Server", "nginx"), ("Set-Cookie", "a=1")])
+        self.assertIsInstance(body, memoryview)
+        self.assertEqual(bytes(body), b"hello")
+        self.assertIsNone(snap["http://a/head"][2])
+        # the last record wins, the file is reopened from the index
+        snap["http://a/"] = (200, [], b"world")
+        snap = SnapshotFile(self.path)
+        self.assertEqual(list(snap), ["http://a/", "http://a/head"])
+        self.assertEqual(bytes(snap["http://a/"][2]), b"world")
+        with self.assertRaises(TypeError):
+            del snap["http://a/"]
+
+    def test_recover(self):
+        snap = SnapshotFile(self.path)
+        snap["http://a/"] = (200, [], b"a")
+        snap["http://b/"] = (200, [], b"b")
+        size = os.path.getsize(self.path)
+        # the index misses the last record, a record is cut at the end
+        with open(self.path + ".idx") as f:
+            lines = f.readlines()
+        with open(self.path + ".idx", "w") as f:
+            f.writelines(lines[:1])
+        with open(self.path, "ab") as f:
+            f.write(b"WHR1\x00")
+        snap = SnapshotFile(self.path)
+        self.assertEqual(len(snap), 2)
+        self.assertEqual(bytes(snap["http://b/"][2]), b"b")
+        self.assertEqual(os.path.getsize(self.path), size)
+        # a broken index is rebuilt
+        with open(self.path + ".idx", "w") as f:
+            f.write("999999\thttp://x/\n")
+        self.assertEqual(len(SnapshotFile(self.path)), 2)
+
+    def test_response_store(self):
+        store = ResponseStore(SnapshotFile(self.path))
+        store.add("http://a", 200, [("Content-Type", "text/html")], b"<title>Demo</title>")
+        store = ResponseStore.load(self.path)
+        self.assertEqual(store.targets(), ["http://a/"])
+        self.assertEqual(store.response("http://a/")["title"], "Demo")
+        self.assertEqual(store.probe("http://a/")["md5"], "8a45ea401cb474aa95b1a9b76eadf4db")
+
+
+if __name__ == "__main__":
+    unittest.main()
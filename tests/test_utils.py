@@ -68,6 +68,12 @@ class UtilsTest(unittest.TestCase):
         self.assertEqual("a", utils.get_pinyin_first_letter("/hao"))
         self.assertEqual("z", utils.get_pinyin_first_letter("」hao"))
 
+    def test_murmur3_32(self):
+        self.assertEqual(utils.murmur3_32(b""), 0)
+        self.assertEqual(utils.murmur3_32(b"abc"), -1277324294)
+        self.assertEqual(utils.murmur3_32(b"abcd"), 1139631978)
+        self.assertEqual(utils.favicon_hash(b"hello world" * 30), 1467498601)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from src.core import Component
+from src.offline import OfflineSniffer, ResponseStore
+from src.version import (DECLARED, EXTRACTED, VersionCandidate, normalize_version,
+                         resolve, sort_versions)
+
+
+class VersionTest(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize_version("v5.4.2"), "5.4.2")
+        self.assertEqual(normalize_version("Version 5.4.2."), "5.4.2")
+        self.assertEqual(normalize_version("5_4_2"), "5.4.2")
+        self.assertEqual(normalize_version(2003), "2003")
+        self.assertEqual(normalize_version("vNext"), "vNext")
+        self.assertIsNone(normalize_version(" . "))
+
+    def test_sort(self):
+        self.assertEqual(sort_versions(["5.4.10", "5.4.2", "5.4", "5.4.2rc1", "5.4.2-beta"]),
+                         ["5.4", "5.4.2-beta", "5.4.2rc1", "5.4.2", "5.4.10"])
+
+    def test_resolve(self):
+        self.assertEqual(resolve([]), (None, 0.0))
+        self.assertEqual(resolve([VersionCandidate("5.4.2", 0, EXTRACTED)]), ("5.4.2", 1.0))
+        # a less specific version agrees
+        self.assertEqual(resolve([VersionCandidate("5.4", 0, DECLARED),
+                                  VersionCandidate("5.4.2", 1, EXTRACTED)]), ("5.4.2", 1.0))
+        candidates = [VersionCandidate("5.4.2", 0, EXTRACTED), VersionCandidate("5.3", 1, DECLARED)]
+        self.assertEqual(resolve(candidates), ("5.4.2", 0.67))
+        self.assertEqual(resolve(reversed(candidates)), ("5.4.2", 0.67))
+        # a tie goes to the highest
+        self.assertEqual(resolve([VersionCandidate("1.2", 0, EXTRACTED), VersionCandidate("1.10", 1, EXTRACTED)]),
+                         ("1.10", 0.5))
+
+    def test_check_matches(self):
+        store = ResponseStore()
+        store.add("http://a.com/", 200, [("Server", "nginx/1.18.0")],
+                  b"<html><meta name=\"generator\" content=\"WordPress 5.4.2\">ver=5.3</html>")
+        sniffer = OfflineSniffer("http://a.com/", "", store, components=[])
+        wordpress = Component.from_dict({"name": "WordPress", "matches": [
+            {"text": "ver=5.3", "version": "5.3"},
+            {"search": "meta[generator]", "regexp": r"WordPress ([\d.]+)", "offset": 0},
+        ]})
+        self.assertEqual(sniffer._check_matches(wordpress),
+                         {"name": "WordPress", "version": "5.4.2", "confidence": 0.67})
+        nginx = Component.from_dict({"name": "Nginx", "matches": [
+            {"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]})
+        self.assertEqual(sniffer._check_matches(nginx), {"name": "Nginx", "version": "1.18.0"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from src.batch import BatchSniffer
+from src.core import Component
+from src.offline import ResponseStore
+from src.work_queue import DONE, FAILED, LEASED, PENDING, ScanWorker, WorkQueue
+
+NGINX = {"name": "Nginx", "matches": [{"search": "headers[server]", "regexp": r"nginx/([\d.]+)", "offset": 0}]}
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "queue.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_claim_complete(self):
+        q = WorkQueue(self.path)
+        self.assertEqual(q.add(["http://a", "http://b", "http://c"]), 3)
+        self.assertEqual(q.add(["http://a", "http://d"]), 1)
+        lease = q.claim("w1", 3)
+        self.assertEqual(lease.targets, ["http://a", "http://b", "http://c"])
+        self.assertEqual(q.claim("w2", 3).targets, ["http://d"])
+        self.assertIsNone(q.claim("w3", 3))
+        self.assertTrue(q.complete("http://a", [{"name": "A"}]))
+        self.assertFalse(q.complete("http://a", []))
+        q.release(lease)
+        self.assertEqual(q.counts(), {PENDING: 2, LEASED: 1, DONE: 1, FAILED: 0})
+        self.assertEqual(q.results(), [(1, "http://a", [{"name": "A"}])])
+        self.assertEqual(q.results(1), [])
+
+    def test_shared_settings(self):
+        q = WorkQueue(self.path, lease_ttl=5, max_attempts=2)
+        q.options = {"aggression": True}
+        q = WorkQueue(self.path)
+        self.assertEqual((q.lease_ttl, q.max_attempts), (5, 2))
+        self.assertEqual(q.options, {"aggression": True})
+
+    def test_expire(self):
+        q = WorkQueue(self.path, lease_ttl=0.05, max_attempts=2)
+        q.add(["http://a"])
+        lease = q.claim("w1", 1)
+        self.assertTrue(q.heartbeat(lease))
+        time.sleep(0.1)
+        # the dead worker's lease is taken over
+        self.assertEqual(q.claim("w2", 1).targets, ["http://a"])
+        self.assertFalse(q.heartbeat(lease))
+        time.sleep(0.1)
+        self.assertIsNone(q.claim("w3", 1))
+        self.assertEqual(q.failed(), ["http://a"])
+        self.assertTrue(q.finished)
+
+    def test_workers(self):
+        store = ResponseStore()
+        targets = ["http://host%d.example.com/" % i for i in range(20)]
+        for i, target in enumerate(targets):
+            store.add(target, 200, [("Server", "nginx/1.%d" % i)], b"hello")
+        WorkQueue(self.path).add(targets)
+        scanned = []
+
+        def work(name):
+            batch = BatchSniffer([], "", components=[Component.from_dict(NGINX)])
+            batch.store = store
+            batch.max_threads = 2
+            worker = ScanWorker(WorkQueue(self.path), worker_id=name, lease_size=3, poll_interval=0.01)
+            scanned.append(worker.run(batch))
+        _ts = [threading.Thread(target=work, args=("w%d" % i,)) for i in range(3)]
+        for _t in _ts:
+            _t.start()
+        for _t in _ts:
+            _t.join()
+        self.assertEqual(sum(scanned), 20)
+        q = WorkQueue(self.path)
+        self.assertTrue(q.finished)
+        results = {target: r for _, target, r in q.results()}
+        self.assertEqual(results[targets[7]][-1], {"name": "Nginx", "version": "1.7"})
+
+    def test_lost_results(self):
+        store = ResponseStore()
+        store.add("http://a/", 200, [("Server", "nginx/1.0")], b"hello")
+        q = WorkQueue(self.path, max_attempts=2)
+        q.add(["http://a/"])
+        batch = BatchSniffer([], "", components=[Component.from_dict(NGINX)])
+        batch.store = store
+        worker = ScanWorker(q, worker_id="w1", poll_interval=0.01)
+
+        def _on_result(target, results):
+            raise RuntimeError("lost")
+        worker._on_result = _on_result
+        # scanned and never completed, failed after the attempts instead of claimed forever
+        self.assertEqual(worker.run(batch), 0)
+        self.assertEqual(q.failed(), ["http://a/"])
+
+
+if __name__ == "__main__":
+    unittest.main()